@@ -1,9 +1,20 @@
 """Main Streamlit application for the MIDI generation app."""
 
+import time
+
 import streamlit as st
 from dotenv import load_dotenv
 
-from src.session import init_session_state
+from src.project import PROJECT_SUFFIX, project_from_bytes, project_to_bytes
+from src.session import (
+    get_layer_store,
+    get_midi_encode_count,
+    init_session_state,
+    load_layers,
+    record_run_time,
+    redo_layers,
+    undo_layers,
+)
 from src.interfaces import (
     create_layer_interface,
     layer_analysis_interface,
@@ -14,6 +25,68 @@ from src.interfaces import (
 load_dotenv()
 
 
+def project_panel() -> None:
+    """Save the session's layers to a project file or load one back."""
+
+    store = get_layer_store()
+
+    # Serialise only when asked; the bytes stay valid until the layers change
+    saved = st.session_state.get("project_bytes")
+    if saved is not None and saved[0] == store.version:
+        st.download_button(
+            "💾 Save Project",
+            data=saved[1],
+            file_name=f"midigpt_project{PROJECT_SUFFIX}",
+            mime="application/octet-stream",
+            use_container_width=True,
+        )
+    elif st.button(
+        "📦 Prepare Project File", disabled=not store, use_container_width=True
+    ):
+        st.session_state.project_bytes = (store.version, project_to_bytes(list(store)))
+        st.rerun()
+
+    uploaded = st.file_uploader("📂 Load Project", type=[PROJECT_SUFFIX.lstrip(".")])
+    if uploaded is not None and st.button("Load", use_container_width=True):
+        try:
+            layers = project_from_bytes(uploaded.getvalue())
+        except ValueError as e:
+            st.error(f"❌ Could not load project: {e}")
+        else:
+            load_layers(layers)
+            st.rerun()
+
+
+def history_panel() -> None:
+    """Undo/redo buttons for layer changes."""
+
+    store = get_layer_store()
+    col1, col2 = st.columns(2)
+    with col1:
+        # Callbacks apply the step before the page reruns
+        st.button(
+            "↩️ Undo",
+            on_click=undo_layers,
+            disabled=store.undo_label is None,
+            help=f"Undo: {store.undo_label}" if store.undo_label else None,
+            use_container_width=True,
+        )
+    with col2:
+        st.button(
+            "↪️ Redo",
+            on_click=redo_layers,
+            disabled=store.redo_label is None,
+            help=f"Redo: {store.redo_label}" if store.redo_label else None,
+            use_container_width=True,
+        )
+
+    stats = store.history_stats()
+    st.caption(
+        f"{stats['undo_steps']} undo / {stats['redo_steps']} redo steps • "
+        f"{stats['bytes'] / 1e6:.1f} / {stats['max_bytes'] / 1e6:.0f} MB"
+    )
+
+
 def main() -> None:
     """Main application entry point."""
 
@@ -25,6 +98,9 @@ def main() -> None:
         initial_sidebar_state="expanded",
     )
 
+    run_start = time.perf_counter()
+    encode_start = get_midi_encode_count()
+
     # Initialize session state
     init_session_state()
 
@@ -47,14 +123,28 @@ def main() -> None:
 
         st.markdown("---")
         st.markdown("### 🎛️ Quick Stats")
-        if st.session_state.layers:
-            total_layers = len(st.session_state.layers)
-            active_layers = len([l for l in st.session_state.layers if not l["muted"]])
+        store = get_layer_store()
+        if store:
+            total_layers = len(store)
+            active_layers = total_layers - store.muted_count
             st.metric("Total Layers", total_layers)
             st.metric("Active Layers", active_layers)
         else:
             st.info("No layers created yet")
 
+        st.markdown("---")
+        st.markdown("### 📁 Project")
+        project_panel()
+
+        st.markdown("---")
+        st.markdown("### 🕘 History")
+        history_panel()
+
+        # Full reruns vs fragment reruns (layer rows, plots, mix preview)
+        with st.expander("⏱️ Run Times"):
+            for scope, milliseconds, encodes in reversed(st.session_state.run_times):
+                st.caption(f"{scope}: {milliseconds:.0f} ms • {encodes} MIDI encodes")
+
         st.markdown("---")
         st.markdown("### ℹ️ How to Use")
         st.markdown(
@@ -87,6 +177,10 @@ def main() -> None:
     with tab3:
         mix_export_interface()
 
+    # Export bytes are memoised, so unchanged reruns should encode nothing;
+    # fragment reruns are listed with their encodes under Run Times
+    st.caption(f"🧮 MIDI encodes this rerun: {get_midi_encode_count() - encode_start}")
+
     # Footer
     st.markdown("---")
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -98,6 +192,12 @@ def main() -> None:
             unsafe_allow_html=True,
         )
 
+    record_run_time(
+        "Full run",
+        (time.perf_counter() - run_start) * 1000,
+        get_midi_encode_count() - encode_start,
+    )
+
 
 if __name__ == "__main__":
     main()
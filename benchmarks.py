@@ -0,0 +1,306 @@
+"""Micro-benchmarks for the audio and visualization pipelines.
+
+Run one benchmark by name, e.g.::
+
+    python benchmarks.py audio-dtype --minutes 5
+"""
+
+import argparse
+import gc
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+NOTE_NAMES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+def _random_notes(
+    count: int, octaves: Tuple[int, int], seed: int
+) -> List[Tuple[str, float, float, int]]:
+    """Return *count* non-repeating 16th-note aligned notes."""
+
+    rng = random.Random(seed)
+    notes = []
+    start = 0.0
+    for _ in range(count):
+        pitch = f"{rng.choice(NOTE_NAMES)}{rng.randint(*octaves)}"
+        duration = rng.choice([0.25, 0.5, 0.75, 1.0])
+        notes.append((pitch, start, duration, rng.randint(70, 120)))
+        start += rng.choice([0.25, 0.5])
+    return notes
+
+
+def _measure(func: Callable[[], object]) -> Tuple[float, int]:
+    """Return (wall seconds, peak traced bytes) for a single call of *func*."""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def _wall_time(func: Callable[[], object]) -> float:
+    """Return wall seconds for a single call of *func* (no allocation tracing)."""
+
+    gc.collect()  # Don't bill garbage left by earlier runs to this one
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_audio_dtype(args: argparse.Namespace) -> None:
+    """Compare float64 and float32 synthesis/mixing of a long multi-layer mix."""
+
+    from src.audio import clear_stem_cache, mix_layers_audio
+
+    beats = args.minutes * 60 * args.bpm / 60.0
+    note_count = int(beats * 3)  # ~3 notes per beat, no repeats to tile
+    layers = [
+        {"type": layer_type, "midi_data": _random_notes(note_count, octaves, seed)}
+        for seed, (layer_type, octaves) in enumerate(
+            [
+                ("🎸 Bassline", (1, 2)),
+                ("🎶 Chords", (3, 4)),
+                ("🎺 Lead", (4, 5)),
+                ("🥁 Drums", (1, 3)),
+            ]
+        )
+    ]
+    duration_limit = args.minutes * 60.0
+
+    print(f"Mix of {len(layers)} layers, {args.minutes} min at {args.bpm} BPM")
+    print(f"{'dtype':<10}{'time (s)':>10}{'peak MB':>10}{'buffer MB':>11}")
+    for dtype in (np.float64, np.float32):
+        clear_stem_cache()
+        result = {}
+
+        def run() -> None:
+            result["audio"], _ = mix_layers_audio(
+                layers, duration_limit, args.bpm, dtype=dtype
+            )
+
+        elapsed, peak = _measure(run)
+        print(
+            f"{np.dtype(dtype).name:<10}{elapsed:>10.2f}{peak / 1e6:>10.1f}"
+            f"{result['audio'].nbytes / 1e6:>11.1f}"
+        )
+    clear_stem_cache()
+
+
+def _plot_layers_per_patch(layers: List[dict]) -> None:
+    """Previous piano roll drawing: one Rectangle patch per note (baseline)."""
+
+    import matplotlib.pyplot as plt
+
+    from src.visualization import note_name_to_midi_number
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    for i, layer in enumerate(layers):
+        for note_name, start, duration, velocity in layer["midi_data"]:
+            midi_note = note_name_to_midi_number(note_name)
+            ax.add_patch(
+                plt.Rectangle(
+                    (start, midi_note - 0.4 + i * 0.1),
+                    duration,
+                    0.8,
+                    facecolor="#888888",
+                    alpha=min(1.0, velocity / 127.0 * 0.8 + 0.2),
+                    edgecolor="black",
+                    linewidth=0.5,
+                )
+            )
+    ax.autoscale_view()
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def bench_piano_roll(args: argparse.Namespace) -> None:
+    """Compare per-note patches with batched collections in `plot_midi_layers`."""
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from src.visualization import plot_midi_layers
+
+    def collections(layers: List[dict]) -> None:
+        # Force per-note drawing; "auto" would switch to density cells here
+        fig = plot_midi_layers(layers, lod="notes")
+        fig.canvas.draw()
+        plt.close(fig)
+
+    print(f"{'notes':>8}{'patches (s)':>14}{'collections (s)':>18}{'speedup':>10}")
+    for note_count in args.notes:
+        per_layer = note_count // args.layers
+        layers = [
+            {
+                "title": f"Layer {i}",
+                "type": "🎶 Chords",
+                "muted": False,
+                "midi_data": _random_notes(per_layer, (2, 6), i),
+            }
+            for i in range(args.layers)
+        ]
+
+        # Skip the slow baseline above the requested limit
+        if note_count <= args.baseline_limit:
+            baseline = _wall_time(lambda: _plot_layers_per_patch(layers))
+        else:
+            baseline = float("nan")
+        batched = _wall_time(lambda: collections(layers))
+        print(
+            f"{note_count:>8}{baseline:>14.2f}{batched:>18.2f}"
+            f"{baseline / batched:>9.1f}x"
+        )
+
+
+def bench_project_io(args: argparse.Namespace) -> None:
+    """Compare JSON and the binary project format for saving/loading layers."""
+
+    import json
+    import tempfile
+    from pathlib import Path
+
+    from src.core import make_layer
+    from src.project import load_project, save_project
+
+    print(
+        f"{'notes':>8}{'json save':>11}{'json load':>11}{'json MB':>9}"
+        f"{'bin save':>10}{'bin load':>10}{'bin MB':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = Path(tmp_dir) / "project.json"
+        binary_path = Path(tmp_dir) / "project.midigpt"
+        for note_count in args.notes:
+            layers = [
+                make_layer(
+                    i + 1,
+                    "🎶 Chords",
+                    f"Layer {i}",
+                    _random_notes(note_count // args.layers, (2, 6), i),
+                )
+                for i in range(args.layers)
+            ]
+
+            # Allocation tracing would dominate these object-heavy timings
+            json_save = _wall_time(
+                lambda: json_path.write_text(json.dumps(layers), encoding="utf-8")
+            )
+            json_load = _wall_time(
+                lambda: json.loads(json_path.read_text(encoding="utf-8"))
+            )
+            binary_save = _wall_time(lambda: save_project(binary_path, layers))
+            binary_load = _wall_time(lambda: load_project(binary_path))
+            print(
+                f"{note_count:>8}{json_save * 1000:>9.0f}ms{json_load * 1000:>9.0f}ms"
+                f"{json_path.stat().st_size / 1e6:>9.1f}"
+                f"{binary_save * 1000:>8.0f}ms{binary_load * 1000:>8.0f}ms"
+                f"{binary_path.stat().st_size / 1e6:>8.1f}"
+            )
+
+
+# Import statements compared by the import-time benchmark; "from src import *"
+# resolves every public name, which is what importing the package used to do
+IMPORT_TARGETS = {
+    "cli": "import cli",
+    "src": "import src",
+    "src.core": "import src.core",
+    "src (eager)": "from src import *",
+}
+
+
+def _import_times(statement: str) -> Tuple[float, str, float]:
+    """Return (total ms, heaviest top-level module, its ms) for *statement*.
+
+    Runs a fresh interpreter with ``-X importtime`` and sums the cumulative
+    times of the top-level imports it reports.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  "):  # Nested imports are indented
+            modules[name.strip()] = int(cumulative) / 1000.0
+    heaviest = max(modules, key=modules.get)
+    return sum(modules.values()), heaviest, modules[heaviest]
+
+
+def bench_import_time(args: argparse.Namespace) -> None:
+    """Compare start-up import cost of the CLI and the (lazy) package."""
+
+    print(f"{'target':<14}{'import (ms)':>13}  heaviest top-level import")
+    for target in args.targets:
+        runs = [_import_times(IMPORT_TARGETS[target]) for _ in range(args.repeat)]
+        total = statistics.median(run[0] for run in runs)
+        _, heaviest, heaviest_ms = max(runs, key=lambda run: run[0])
+        print(f"{target:<14}{total:>13.0f}  {heaviest} ({heaviest_ms:.0f} ms)")
+
+
+BENCHMARKS: Dict[str, Tuple[Callable[[argparse.Namespace], None], str]] = {
+    "audio-dtype": (bench_audio_dtype, "float64 vs float32 audio pipeline"),
+    "piano-roll": (bench_piano_roll, "per-note patches vs batched piano roll"),
+    "import-time": (bench_import_time, "CLI/package start-up import cost"),
+    "project-io": (bench_project_io, "JSON vs binary project save/load"),
+}
+
+
+def main() -> None:
+    """Parse arguments and run the selected benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    audio_dtype = subparsers.add_parser(
+        "audio-dtype", help=BENCHMARKS["audio-dtype"][1]
+    )
+    audio_dtype.add_argument("--minutes", type=float, default=5.0)
+    audio_dtype.add_argument("--bpm", type=float, default=124.0)
+
+    piano_roll = subparsers.add_parser("piano-roll", help=BENCHMARKS["piano-roll"][1])
+    piano_roll.add_argument(
+        "--notes", type=int, nargs="+", default=[1_000, 10_000, 50_000]
+    )
+    piano_roll.add_argument("--layers", type=int, default=4)
+    piano_roll.add_argument("--baseline-limit", type=int, default=50_000)
+
+    import_time = subparsers.add_parser(
+        "import-time", help=BENCHMARKS["import-time"][1]
+    )
+    import_time.add_argument(
+        "--targets",
+        nargs="+",
+        choices=list(IMPORT_TARGETS),
+        default=list(IMPORT_TARGETS),
+    )
+    import_time.add_argument("--repeat", type=int, default=5)
+
+    project_io = subparsers.add_parser("project-io", help=BENCHMARKS["project-io"][1])
+    project_io.add_argument(
+        "--notes", type=int, nargs="+", default=[1_000, 50_000, 500_000]
+    )
+    project_io.add_argument("--layers", type=int, default=8)
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark][0](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,10 @@
 import argparse
-import re
 import sys
 from pathlib import Path
+from typing import Optional
 
 from dotenv import load_dotenv
 
-from src.core import generate_midi_file, request_midi
-
-
-def _slugify(text: str) -> str:
-    """Return a filesystem-safe slug derived from *text*."""
-
-    slug = re.sub(r"[^a-zA-Z0-9\-]+", "_", text.strip().lower())
-    slug = re.sub(r"_+", "_", slug).strip("_")
-    return slug or "untitled"
-
 
 def _next_available_path(base: Path) -> Path:
     """Append numeric suffixes until *base* is free, returning the path."""
@@ -30,16 +20,30 @@ def _next_available_path(base: Path) -> Path:
         counter += 1
 
 
-def _run_once(prompt: str, model: str, out_dir: Path) -> None:
-    """Generate a bassline for *prompt* and write a MIDI file to *out_dir*."""
+def _run_once(
+    prompt: str, model: str, out_dir: Path, project: Optional[Path] = None
+) -> None:
+    """Generate a bassline for *prompt* and write a MIDI file to *out_dir*.
+
+    With *project* the bassline is also added as a layer to that project file.
+    """
+
+    # Imported here so --help and REPL start-up skip the OpenAI client
+    from src.core import generate_midi_file, request_midi, slugify
 
     title, midi_data = request_midi(prompt=prompt, model=model)
-    filename = _slugify(title) + ".mid"
+    filename = slugify(title) + ".mid"
     output_path = _next_available_path(out_dir / filename)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     generate_midi_file(midi_data, output_path)
     print(f"✅ '{title}' saved to {output_path}")
 
+    if project is not None:
+        from src.project import append_to_project
+
+        append_to_project(project, "🎸 Bassline", title, midi_data)
+        print(f"📁 Added to project {project}")
+
 
 def main() -> None:
     """Interactive CLI for generating basslines via OpenAI."""
@@ -55,6 +59,12 @@ def main() -> None:
         default="midi",
         help="Directory where generated .mid files are stored (default: midi)",
     )
+    parser.add_argument(
+        "--project",
+        default=None,
+        help="Also add every generated bassline to this project file "
+        "(can be loaded in the app)",
+    )
     parser.add_argument(
         "prompt",
         nargs=argparse.REMAINDER,
@@ -65,10 +75,11 @@ def main() -> None:
     load_dotenv()
 
     out_dir = Path(args.out_dir).expanduser().resolve()
+    project = Path(args.project).expanduser().resolve() if args.project else None
 
     # One-off mode if prompt words were supplied on the command-line.
     if args.prompt:
-        _run_once(" ".join(args.prompt), args.model, out_dir)
+        _run_once(" ".join(args.prompt), args.model, out_dir, project)
         return
 
     # Interactive REPL mode.
@@ -87,7 +98,7 @@ def main() -> None:
                 break
 
             try:
-                _run_once(prompt, args.model, out_dir)
+                _run_once(prompt, args.model, out_dir, project)
             except Exception as exc:  # noqa: BLE001
                 print(f"❌ Error: {exc}", file=sys.stderr)
 
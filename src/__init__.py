@@ -1,58 +1,64 @@
-"""MIDI generation app package."""
-
-from .core import request_midi, midi_to_bytes, analyze_midi_data, combine_midi_layers
-from .presets import ARTIST_PRESETS, LAYER_TYPES, CREATIVE_CONTROLS
-from .session import (
-    init_session_state,
-    add_layer,
-    remove_layer,
-    get_layers_by_type,
-    toggle_layer_mute,
-    toggle_layer_solo,
-    get_active_layers,
-    clear_all_layers,
-)
-from .interfaces import (
-    create_layer_interface,
-    layer_analysis_interface,
-    mix_export_interface,
-)
-from .visualization import (
-    plot_midi_layers,
-    plot_single_layer_analysis,
-    create_velocity_heatmap,
-)
-from .audio import create_layer_preview, create_mix_preview, midi_data_to_audio
-
-__all__ = [
+"""MIDI generation app package.
+
+Public names are imported lazily on first access, so entry points that only
+need `src.core` (such as the CLI) do not load the Streamlit, plotting and
+audio stacks.
+"""
+
+import importlib
+from typing import Any, List
+
+# Public name -> submodule defining it
+_LAZY_IMPORTS = {
     # Core functionality
-    "request_midi",
-    "midi_to_bytes",
-    "analyze_midi_data",
-    "combine_midi_layers",
+    "request_midi": "core",
+    "midi_to_bytes": "core",
+    "analyze_midi_data": "core",
+    "combine_midi_layers": "core",
     # Presets and configurations
-    "ARTIST_PRESETS",
-    "LAYER_TYPES",
-    "CREATIVE_CONTROLS",
+    "ARTIST_PRESETS": "presets",
+    "LAYER_TYPES": "presets",
+    "CREATIVE_CONTROLS": "presets",
     # Session management
-    "init_session_state",
-    "add_layer",
-    "remove_layer",
-    "get_layers_by_type",
-    "toggle_layer_mute",
-    "toggle_layer_solo",
-    "get_active_layers",
-    "clear_all_layers",
+    "init_session_state": "session",
+    "add_layer": "session",
+    "remove_layer": "session",
+    "get_layers_by_type": "session",
+    "toggle_layer_mute": "session",
+    "toggle_layer_solo": "session",
+    "get_active_layers": "session",
+    "clear_all_layers": "session",
+    "LayerStore": "session",
+    "get_layer_store": "session",
+    "undo_layers": "session",
+    "redo_layers": "session",
     # User interfaces
-    "create_layer_interface",
-    "layer_analysis_interface",
-    "mix_export_interface",
+    "create_layer_interface": "interfaces",
+    "layer_analysis_interface": "interfaces",
+    "mix_export_interface": "interfaces",
     # Visualization
-    "plot_midi_layers",
-    "plot_single_layer_analysis",
-    "create_velocity_heatmap",
+    "plot_midi_layers": "visualization",
+    "plot_single_layer_analysis": "visualization",
+    "create_velocity_heatmap": "visualization",
+    "render_plot_png": "visualization",
+    "get_plot_cache_stats": "visualization",
     # Audio synthesis
-    "create_layer_preview",
-    "create_mix_preview",
-    "midi_data_to_audio",
-]
+    "create_layer_preview": "audio",
+    "create_mix_preview": "audio",
+    "midi_data_to_audio": "audio",
+    "get_stem_cache_stats": "audio",
+}
+
+__all__ = list(_LAZY_IMPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_IMPORTS[name]}", __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,239 @@
+"""Dependency-aware generation of a full multi-layer arrangement.
+
+Each layer type lists the layers it is conditioned on (``depends_on`` in
+`LAYER_TYPES`). An `Arrangement` submits every layer whose inputs are ready
+to a `JobRunner` at once, so independent layers (e.g. bassline and drums)
+generate in parallel and dependent ones start as soon as their inputs land.
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from .core import analyze_midi_data
+from .jobs import CANCELLED, DONE, FAILED, GenerationJob, JobRunner
+from .presets import ARTIST_PRESETS, CREATIVE_CONTROLS, LAYER_TYPES
+from .ratelimit import BATCH
+
+# Arrangement-level layer states on top of the job states
+PENDING = "pending"
+SUBMITTED = "submitted"
+SKIPPED = "skipped"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED, SKIPPED)
+
+
+def request_layer_type(layer_type: str) -> str:
+    """Return the model-facing layer name, e.g. "🎶 Chords" -> "chords"."""
+    return layer_type.split(" ", 1)[1].lower() if " " in layer_type else "bassline"
+
+
+def build_layer_prompt(
+    artist: str,
+    layer_type: str,
+    controls: Optional[Dict[str, str]] = None,
+    custom_prompt: str = "",
+) -> str:
+    """Pick a preset prompt for *layer_type* and append non-default controls."""
+    if custom_prompt.strip():
+        prompt = custom_prompt.strip()
+    else:
+        # Get appropriate prompt from preset
+        prompts = ARTIST_PRESETS[artist]["prompts"]
+        layer_key = request_layer_type(layer_type)
+        prompt = random.choice(prompts.get(layer_key, prompts["bassline"]))
+
+    # Add creative controls to prompt
+    control_additions = []
+    for control_name, value in (controls or {}).items():
+        if value != CREATIVE_CONTROLS[control_name]["default"]:
+            control_additions.append(
+                f"{control_name.split(' ', 1)[1].lower()}: {value.lower()}"
+            )
+
+    if control_additions:
+        prompt += f" Style modifiers: {', '.join(control_additions)}."
+    return prompt
+
+
+def arrangement_order(layer_types: Iterable[str]) -> Dict[str, List[str]]:
+    """Return ``{layer type: direct dependencies}`` restricted to *layer_types*.
+
+    Dependencies outside the selection are followed through, so a selection
+    of bassline and melody still conditions the melody on the bassline when
+    chords are left out. Raises ValueError on dependency cycles.
+    """
+    selected = list(dict.fromkeys(layer_types))
+
+    def selected_inputs(layer_type: str, visiting: tuple) -> List[str]:
+        if layer_type in visiting:
+            raise ValueError(f"Layer dependency cycle: {' -> '.join(visiting)}")
+        inputs = []
+        for dependency in LAYER_TYPES.get(layer_type, {}).get("depends_on", []):
+            if dependency in selected:
+                inputs.append(dependency)
+            else:
+                inputs.extend(selected_inputs(dependency, visiting + (layer_type,)))
+        return list(dict.fromkeys(inputs))
+
+    graph = {layer_type: selected_inputs(layer_type, ()) for layer_type in selected}
+
+    # Reject cycles among the selected layers too
+    resolved: set = set()
+    while len(resolved) < len(graph):
+        ready = [
+            layer_type
+            for layer_type, inputs in graph.items()
+            if layer_type not in resolved and set(inputs) <= resolved
+        ]
+        if not ready:
+            raise ValueError("Layer dependency cycle among selected layers")
+        resolved.update(ready)
+    return graph
+
+
+class Arrangement:
+    """One "generate full arrangement" request scheduled over a `JobRunner`.
+
+    Every layer receives the generated notes of all its (transitive) inputs
+    as ``existing_layers``. If an input fails or is cancelled its dependants
+    are skipped. Layers are requested at batch priority unless
+    *request_kwargs* says otherwise, so single-layer requests go first.
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        artist: str,
+        layer_types: Iterable[str],
+        controls: Optional[Dict[str, str]] = None,
+        request_kwargs: Optional[dict] = None,
+    ) -> None:
+        self.runner = runner
+        self.artist = artist
+        self.controls = controls or {}
+        self.request_kwargs = request_kwargs or {}
+        self.graph = arrangement_order(layer_types)
+        self.status: Dict[str, str] = {layer_type: PENDING for layer_type in self.graph}
+        self.jobs: Dict[str, GenerationJob] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._durations: Dict[str, float] = {}
+        self._results: Dict[str, list] = {}
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def start(self) -> "Arrangement":
+        """Submit every layer without inputs."""
+        self.started_at = time.time()
+        self._submit_ready()
+        return self
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def _ancestors(self, layer_type: str) -> List[str]:
+        ancestors = []
+        for dependency in self.graph[layer_type]:
+            ancestors.extend(self._ancestors(dependency))
+            ancestors.append(dependency)
+        return list(dict.fromkeys(ancestors))
+
+    def _context_layers(self, layer_type: str) -> List[dict]:
+        """Layer dicts of every (finished) input of *layer_type*."""
+        return [
+            {
+                "type": dependency,
+                "midi_data": self._results[dependency],
+                "analysis": analyze_midi_data(self._results[dependency]),
+            }
+            for dependency in self._ancestors(layer_type)
+        ]
+
+    def _submit_ready(self) -> None:
+        """Submit layers whose inputs are all done and skip orphaned ones."""
+        ready = []
+        with self._lock:
+            changed = True
+            while changed:  # Skipping can cascade down the graph
+                changed = False
+                for layer_type, inputs in self.graph.items():
+                    if self.status[layer_type] != PENDING:
+                        continue
+                    input_states = [self.status[dependency] for dependency in inputs]
+                    if self._cancelled or any(
+                        state in (FAILED, CANCELLED, SKIPPED) for state in input_states
+                    ):
+                        self.status[layer_type] = SKIPPED
+                        changed = True
+                    elif all(state == DONE for state in input_states):
+                        self.status[layer_type] = SUBMITTED
+                        ready.append(layer_type)
+
+            if self.finished_at is None and all(
+                status in FINISHED_STATES for status in self.status.values()
+            ):
+                self.finished_at = time.time()
+
+        for layer_type in ready:
+            request_kwargs = {"priority": BATCH, **self.request_kwargs}
+            request_kwargs["layer_type"] = request_layer_type(layer_type)
+            request_kwargs["existing_layers"] = self._context_layers(layer_type)
+            job = self.runner.submit(
+                layer_type,
+                build_layer_prompt(self.artist, layer_type, self.controls),
+                request_kwargs,
+                on_finished=self._on_finished,
+            )
+            with self._lock:
+                self.jobs[layer_type] = job
+
+    def _on_finished(self, job: GenerationJob) -> None:
+        with self._lock:
+            self.status[job.layer_type] = job.status
+            self._durations[job.layer_type] = job.elapsed
+            if job.status == DONE:
+                self._results[job.layer_type] = job.midi_data
+        self._submit_ready()
+
+    def cancel(self) -> None:
+        """Cancel every submitted layer and skip the ones not started yet."""
+        with self._lock:
+            self._cancelled = True
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            self.runner.cancel(job.id)
+        self._submit_ready()
+
+    def report(self) -> dict:
+        """Timing of the arrangement so far, in seconds.
+
+        ``sequential`` is the sum of the layer generation times (what one
+        click at a time would take), ``critical_path`` the longest chain of
+        dependent generation times, and ``wall`` the actual elapsed time.
+        """
+        with self._lock:
+            durations = dict(self._durations)
+            status = dict(self.status)
+
+        path_times: Dict[str, float] = {}
+
+        def path_time(layer_type: str) -> float:
+            if layer_type not in path_times:
+                path_times[layer_type] = durations.get(layer_type, 0.0) + max(
+                    (path_time(dependency) for dependency in self.graph[layer_type]),
+                    default=0.0,
+                )
+            return path_times[layer_type]
+
+        wall = 0.0
+        if self.started_at is not None:
+            wall = (self.finished_at or time.time()) - self.started_at
+        return {
+            "layers": status,
+            "sequential": sum(durations.values()),
+            "critical_path": max(map(path_time, self.graph), default=0.0),
+            "wall": wall,
+        }
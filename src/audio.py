@@ -1,13 +1,105 @@
 """Audio synthesis and playback utilities for MIDI preview."""
 
+import functools
 import io
+import math
 import tempfile
-from typing import List, Tuple, Optional
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from os import PathLike
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Tuple, Optional, Union
 
 import numpy as np
+from numpy.typing import DTypeLike
 import pretty_midi
 import soundfile as sf
-from scipy.signal import butter, lfilter
+from scipy.signal import butter, lfilter, lfilter_zi
+
+from .cache import MemoryBoundedCache
+from .core import midi_content_hash, note_name_to_midi
+from .waveform import WaveformPyramid
+
+if TYPE_CHECKING:
+    from .sampler import SampleLibrary
+
+# Rendered layer stems, keyed by layer content and render settings. Mix previews
+# after mute/solo/removal changes only have to sum cached stems.
+STEM_CACHE_MAX_BYTES = 128 * 1024 * 1024
+_stem_cache = MemoryBoundedCache(STEM_CACHE_MAX_BYTES)
+
+# Waveform overview pyramids of rendered stems, keyed like the stems themselves
+WAVEFORM_CACHE_MAX_BYTES = 16 * 1024 * 1024
+_waveform_cache = MemoryBoundedCache(WAVEFORM_CACHE_MAX_BYTES)
+
+# Additive partials (frequency ratio, gain) of the synthesised layer voices
+SINE_PARTIALS = ((1.0, 1.0),)
+BASS_PARTIALS = ((1.0, 1.0), (2.0, 0.3), (3.0, 0.1))
+LEAD_PARTIALS = ((1.0, 1.0), (2.0, 0.5), (3.0, 0.3), (4.0, 0.1))
+CHORD_PARTIALS = ((1.0, 0.8), (1.5, 0.4), (2.0, 0.3))
+
+# Progressive previews: a cheap draft of the first bars is played while the
+# full-quality render runs on a background thread
+BEATS_PER_BAR = 4
+DRAFT_BARS = 4
+DRAFT_SAMPLE_RATE = 8000
+_preview_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preview")
+
+# Near-exact loop matching: relative timing (beats) and velocity differences
+# under which two bar windows count as the same segment
+LOOP_TIMING_TOLERANCE = 1e-3
+LOOP_VELOCITY_TOLERANCE = 2
+
+# General MIDI drum notes and the percussion voice used for each of them
+GM_DRUM_VOICES = {
+    35: "kick",
+    36: "kick",
+    37: "snare",
+    38: "snare",
+    39: "clap",
+    40: "snare",
+    42: "closed_hat",
+    44: "closed_hat",
+    46: "open_hat",
+    49: "open_hat",
+    51: "closed_hat",
+}
+
+# Outside the GM drum notes, voices are chosen by pitch range (upper bound, voice)
+DRUM_PITCH_RANGES = (
+    (48, "kick"),
+    (60, "snare"),
+    (72, "clap"),
+    (84, "closed_hat"),
+    (128, "open_hat"),
+)
+FX_PITCH_RANGES = ((60, "downlifter"), (128, "riser"))
+
+# Output encodings for previews sent to the browser
+PREVIEW_ENCODINGS = {
+    "wav": {"format": "WAV", "subtype": "PCM_16", "mime": "audio/wav"},
+    "wav_float": {"format": "WAV", "subtype": "FLOAT", "mime": "audio/wav"},
+    "flac": {"format": "FLAC", "subtype": "PCM_16", "mime": "audio/flac"},
+    "ogg": {"format": "OGG", "subtype": "VORBIS", "mime": "audio/ogg"},
+}
+
+# Preference order for the "auto" encoding: smallest payload that every browser
+# plays (Safari and iOS cannot play Ogg/Vorbis), first
+AUTO_ENCODING_ORDER = ("flac", "wav")
+
+
+@dataclass(frozen=True)
+class EncodedAudio:
+    """Encoded audio payload together with its encoding statistics."""
+
+    data: bytes
+    encoding: str
+    mime: str
+    encode_time: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
 
 
 def note_name_to_frequency(note_name: str) -> float:
@@ -51,20 +143,25 @@ def note_name_to_frequency(note_name: str) -> float:
 
 
 def generate_sine_wave(
-    frequency: float, duration: float, sample_rate: int = 22050, velocity: int = 100
+    frequency: float,
+    duration: float,
+    sample_rate: int = 22050,
+    velocity: int = 100,
+    dtype: DTypeLike = np.float32,
 ) -> np.ndarray:
     """Generate a sine wave for a given frequency and duration."""
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    length = int(sample_rate * duration)
 
     # Basic sine wave
-    wave = np.sin(2 * np.pi * frequency * t)
+    wave = np.linspace(0, 2 * np.pi * frequency * duration, length, False, dtype=dtype)
+    np.sin(wave, out=wave)
 
     # Apply velocity scaling (0-127 -> 0-1)
     amplitude = velocity / 127.0
 
     # Apply envelope (ADSR - simple version)
-    envelope = create_envelope(len(wave), sample_rate)
-    wave = wave * envelope * amplitude * 0.3  # Scale down to prevent clipping
+    wave *= create_envelope(length, sample_rate, dtype=dtype)
+    wave *= amplitude * 0.3  # Scale down to prevent clipping
 
     return wave
 
@@ -76,9 +173,10 @@ def create_envelope(
     decay: float = 0.1,
     sustain: float = 0.7,
     release: float = 0.2,
+    dtype: DTypeLike = np.float32,
 ) -> np.ndarray:
     """Create an ADSR envelope for natural sound."""
-    envelope = np.ones(length)
+    envelope = np.ones(length, dtype=dtype)
 
     # Convert times to samples
     attack_samples = int(attack * sample_rate)
@@ -87,13 +185,13 @@ def create_envelope(
 
     # Attack phase
     if attack_samples > 0 and attack_samples < length:
-        envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
+        envelope[:attack_samples] = np.linspace(0, 1, attack_samples, dtype=dtype)
 
     # Decay phase
     decay_end = min(attack_samples + decay_samples, length)
     if decay_samples > 0 and decay_end > attack_samples:
         envelope[attack_samples:decay_end] = np.linspace(
-            1, sustain, decay_end - attack_samples
+            1, sustain, decay_end - attack_samples, dtype=dtype
         )
 
     # Sustain phase (handled automatically)
@@ -103,100 +201,329 @@ def create_envelope(
     # Release phase
     if release_samples > 0 and release_samples < length:
         envelope[-release_samples:] = np.linspace(
-            envelope[-release_samples], 0, release_samples
+            envelope[-release_samples], 0, release_samples, dtype=dtype
         )
 
     return envelope
 
 
+def _additive_wave(
+    frequency: float,
+    length: int,
+    sample_rate: int,
+    partials: Tuple[Tuple[float, float], ...],
+    dtype: DTypeLike,
+) -> np.ndarray:
+    """Sum sine partials ((frequency ratio, gain) pairs) into a single buffer."""
+    phase = np.linspace(
+        0, 2 * np.pi * frequency * length / sample_rate, length, False, dtype=dtype
+    )
+    wave = np.zeros(length, dtype=dtype)
+    partial = np.empty(length, dtype=dtype)
+
+    for ratio, gain in partials:
+        np.multiply(phase, ratio, out=partial)
+        np.sin(partial, out=partial)
+        partial *= gain
+        wave += partial
+
+    return wave
+
+
 def synthesize_layer_type(
     layer_type: str,
     frequency: float,
     duration: float,
     sample_rate: int = 22050,
     velocity: int = 100,
+    harmonics: bool = True,
+    dtype: DTypeLike = np.float32,
 ) -> np.ndarray:
-    """Generate audio with different synthesis based on layer type."""
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    """Generate audio with different synthesis based on layer type.
+
+    With ``harmonics=False`` every layer type is rendered as a plain sine,
+    which is what draft previews use.
+    """
+    length = int(sample_rate * duration)
     amplitude = velocity / 127.0 * 0.3
 
-    if "bassline" in layer_type.lower() or "bass" in layer_type.lower():
+    if not harmonics:
+        # Draft: fundamental only
+        wave = _additive_wave(frequency, length, sample_rate, SINE_PARTIALS, dtype)
+
+    elif "bassline" in layer_type.lower() or "bass" in layer_type.lower():
         # Bass: Lower frequencies with some harmonics
-        wave = (
-            np.sin(2 * np.pi * frequency * t)
-            + 0.3 * np.sin(2 * np.pi * frequency * 2 * t)
-            + 0.1 * np.sin(2 * np.pi * frequency * 3 * t)
-        )
+        wave = _additive_wave(frequency, length, sample_rate, BASS_PARTIALS, dtype)
 
         # Low-pass filter for bass
         nyquist = sample_rate // 2
         cutoff = min(800, nyquist - 1)  # Low-pass at 800Hz
         b, a = butter(2, cutoff / nyquist, btype="low")
-        wave = lfilter(b, a, wave)
+        wave = lfilter(b.astype(dtype), a.astype(dtype), wave)
 
     elif "lead" in layer_type.lower():
         # Lead: Brighter sound with harmonics
-        wave = (
-            np.sin(2 * np.pi * frequency * t)
-            + 0.5 * np.sin(2 * np.pi * frequency * 2 * t)
-            + 0.3 * np.sin(2 * np.pi * frequency * 3 * t)
-            + 0.1 * np.sin(2 * np.pi * frequency * 4 * t)
-        )
+        wave = _additive_wave(frequency, length, sample_rate, LEAD_PARTIALS, dtype)
 
     elif "chord" in layer_type.lower():
         # Chords: Softer, pad-like sound
-        wave = (
-            0.8 * np.sin(2 * np.pi * frequency * t)
-            + 0.4 * np.sin(2 * np.pi * frequency * 1.5 * t)
-            + 0.3 * np.sin(2 * np.pi * frequency * 2 * t)
-        )
+        wave = _additive_wave(frequency, length, sample_rate, CHORD_PARTIALS, dtype)
 
     else:
         # Default: Simple sine wave
-        wave = np.sin(2 * np.pi * frequency * t)
+        wave = _additive_wave(frequency, length, sample_rate, SINE_PARTIALS, dtype)
 
-    # Apply envelope and amplitude
-    envelope = create_envelope(len(wave), sample_rate)
-    return wave * envelope * amplitude
+    # Apply envelope and amplitude in place
+    wave *= create_envelope(length, sample_rate, dtype=dtype)
+    wave *= amplitude
+    return wave
 
 
-def midi_data_to_audio(
-    midi_data: List[Tuple[str, float, float, int]],
-    layer_type: str = "melody",
-    sample_rate: int = 22050,
-    bpm: float = 120.0,
-) -> Tuple[np.ndarray, int]:
-    """Convert MIDI data to audio array."""
+def _normalize_in_place(audio: np.ndarray, peak_level: float = 0.8) -> np.ndarray:
+    """Scale *audio* in place so its peak sits at *peak_level*."""
+    if not len(audio):
+        return audio
 
-    if not midi_data:
-        # Return 1 second of silence
-        return np.zeros(sample_rate), sample_rate
+    # Two vectorised passes (max, min) and no temporary. On 10 minutes of
+    # float32 this beats both np.abs(audio).max() (a buffer-sized temporary,
+    # ~5x slower) and a chunked single pass through a scratch array (~2x
+    # slower, as each chunk is still read twice by np.abs() and max()).
+    peak = max(float(audio.max()), -float(audio.min()))
+    if peak > 0:
+        audio *= peak_level / peak
+    return audio
+
+
+def _decay(length: int, sample_rate: int, time_constant: float) -> np.ndarray:
+    """Exponential decay envelope with the given time constant in seconds."""
+    return np.exp(-np.arange(length) / (time_constant * sample_rate))
+
+
+def _noise_sweep(sample_rate: int, rng: np.random.Generator) -> np.ndarray:
+    """One second of noise through a low-pass filter sweeping from 300 Hz up."""
+    length = sample_rate
+    noise = rng.uniform(-1.0, 1.0, length)
+    nyquist = sample_rate / 2
+    block = 512
+
+    sweep = np.zeros(length)
+    zi = None
+    for start in range(0, length, block):
+        progress = start / length
+        cutoff = min(300.0 * (40.0**progress), nyquist * 0.9)
+        b, a = butter(2, cutoff / nyquist, btype="low")
+        if zi is None:
+            zi = lfilter_zi(b, a) * noise[0]
+        sweep[start : start + block], zi = lfilter(
+            b, a, noise[start : start + block], zi=zi
+        )
+
+    # Swell in, then cut off quickly at the end
+    envelope = np.linspace(0.0, 1.0, length) ** 2
+    envelope[-int(0.02 * sample_rate) :] *= np.linspace(
+        1.0, 0.0, int(0.02 * sample_rate)
+    )
+    return sweep * envelope
+
+
+def _render_percussion_voice(voice: str, sample_rate: int) -> np.ndarray:
+    """Synthesise a single percussion one-shot."""
+    rng = np.random.default_rng(0)  # Deterministic noise so previews are stable
+    nyquist = sample_rate / 2
+
+    def noise(seconds: float) -> np.ndarray:
+        return rng.uniform(-1.0, 1.0, int(seconds * sample_rate))
+
+    def filtered(signal: np.ndarray, cutoff, btype: str) -> np.ndarray:
+        cutoff = np.clip(np.asarray(cutoff, dtype=float), 20.0, nyquist * 0.9)
+        b, a = butter(2, cutoff / nyquist, btype=btype)
+        return lfilter(b, a, signal)
+
+    if voice == "kick":
+        # Sine with a fast pitch drop from 150 Hz to 45 Hz
+        length = int(0.35 * sample_rate)
+        frequency = 45.0 + 105.0 * _decay(length, sample_rate, 0.03)
+        phase = 2 * np.pi * np.cumsum(frequency) / sample_rate
+        wave = np.sin(phase) * _decay(length, sample_rate, 0.1)
+
+    elif voice == "snare":
+        # Short body tone plus bright noise
+        length = int(0.25 * sample_rate)
+        t = np.arange(length) / sample_rate
+        body = np.sin(2 * np.pi * 185.0 * t) * _decay(length, sample_rate, 0.04)
+        rattle = filtered(noise(0.25), 1500.0, "high")
+        wave = 0.6 * body + rattle * _decay(length, sample_rate, 0.07)
+
+    elif voice == "clap":
+        # Three quick noise bursts followed by a short tail
+        length = int(0.3 * sample_rate)
+        envelope = _decay(length, sample_rate, 0.06)
+        for burst in (0.0, 0.011, 0.022):
+            start = int(burst * sample_rate)
+            envelope[start:] = np.maximum(
+                envelope[start:], _decay(length - start, sample_rate, 0.006)
+            )
+        wave = filtered(noise(0.3), [900.0, 3000.0], "band") * envelope
+
+    elif voice == "closed_hat":
+        length = int(0.08 * sample_rate)
+        wave = filtered(noise(0.08), 7000.0, "high") * _decay(
+            length, sample_rate, 0.015
+        )
+
+    elif voice == "open_hat":
+        length = int(0.4 * sample_rate)
+        wave = filtered(noise(0.4), 6000.0, "high") * _decay(length, sample_rate, 0.12)
+
+    elif voice == "riser":
+        wave = _noise_sweep(sample_rate, rng)
+
+    elif voice == "downlifter":
+        wave = _noise_sweep(sample_rate, rng)[::-1]
+
+    else:
+        raise ValueError(f"Unknown percussion voice '{voice}'")
+
+    peak = np.max(np.abs(wave))
+    return wave / peak if peak > 0 else wave
+
+
+def percussion_one_shots(sample_rate: int, dtype: DTypeLike = np.float32) -> dict:
+    """Return the read-only percussion one-shot table for *sample_rate*.
+
+    Every voice is synthesised once per sample rate (and dtype); rendering a
+    drum or FX layer afterwards only copies these buffers into place.
+    """
+    return _percussion_table(sample_rate, np.dtype(dtype))
+
+
+@functools.lru_cache(maxsize=None)
+def _percussion_table(sample_rate: int, dtype: np.dtype) -> dict:
+    """Synthesise every percussion voice for a sample rate and dtype."""
+    voices = {voice for _, voice in DRUM_PITCH_RANGES + FX_PITCH_RANGES}
+    voices.update(GM_DRUM_VOICES.values())
+
+    table = {}
+    for voice in sorted(voices):
+        one_shot = _render_percussion_voice(voice, sample_rate).astype(dtype)
+        one_shot.flags.writeable = False
+        table[voice] = one_shot
+    return table
+
+
+def is_percussion_layer(layer_type: str) -> bool:
+    """Return True for layer types rendered with percussion one-shots."""
+    layer_type = layer_type.lower()
+    return "drum" in layer_type or "percussion" in layer_type or "fx" in layer_type
+
+
+def percussion_voice_for_pitch(midi_note: int, layer_type: str = "drums") -> str:
+    """Pick the percussion voice for a MIDI note on a drum or FX layer."""
+    if "fx" in layer_type.lower():
+        ranges = FX_PITCH_RANGES
+    elif midi_note in GM_DRUM_VOICES:
+        return GM_DRUM_VOICES[midi_note]
+    else:
+        ranges = DRUM_PITCH_RANGES
+
+    for upper_bound, voice in ranges:
+        if midi_note < upper_bound:
+            return voice
+    return ranges[-1][1]
+
+
+def _render_percussion_into(
+    audio: np.ndarray,
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str,
+    sample_rate: int,
+    bpm: float,
+) -> None:
+    """Mix pre-rendered percussion one-shots into *audio* at each note onset."""
 
-    # Calculate total duration in seconds
     beats_per_second = bpm / 60.0
-    max_time_beats = max(start + duration for _, start, duration, _ in midi_data)
-    total_duration = max_time_beats / beats_per_second + 1.0  # Add 1 second buffer
+    audio_length = len(audio)
+    one_shots = percussion_one_shots(sample_rate, audio.dtype)
 
-    # Create output buffer
-    audio_length = int(total_duration * sample_rate)
-    audio = np.zeros(audio_length)
+    for note_name, start_beats, _, velocity in midi_data:
+        try:
+            voice = percussion_voice_for_pitch(note_name_to_midi(note_name), layer_type)
+        except Exception as e:
+            print(f"Warning: Skipping note {note_name}: {e}")
+            continue
 
-    for note_name, start_beats, duration_beats, velocity in midi_data:
+        one_shot = one_shots[voice]
+        start_sample = int(start_beats / beats_per_second * sample_rate)
+        if start_sample < 0 or start_sample >= audio_length:
+            continue
+
+        length = min(len(one_shot), audio_length - start_sample)
+        audio[start_sample : start_sample + length] += one_shot[:length] * (
+            velocity / 127.0 * 0.3
+        )
+
+
+def _onset_sample(start_beats: float, beats_per_second: float, sample_rate: int) -> int:
+    """Output sample a note starting at *start_beats* begins on."""
+
+    return int(start_beats / beats_per_second * sample_rate)
+
+
+def _render_notes_into(
+    audio: np.ndarray,
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str,
+    sample_rate: int,
+    bpm: float,
+    harmonics: bool = True,
+    sample_library: Optional["SampleLibrary"] = None,
+    onsets: Optional[List[int]] = None,
+) -> None:
+    """Synthesise *midi_data* and add it (unnormalised) into *audio*.
+
+    *onsets* overrides the start sample of each note (default: its start
+    time rounded down to a sample).
+    """
+
+    beats_per_second = bpm / 60.0
+    audio_length = len(audio)
+
+    for index, (note_name, start_beats, duration_beats, velocity) in enumerate(
+        midi_data
+    ):
         try:
             # Convert timing from beats to seconds
-            start_time = start_beats / beats_per_second
             duration_time = duration_beats / beats_per_second
 
-            # Convert note to frequency
-            frequency = note_name_to_frequency(note_name)
-
-            # Generate the note audio
-            note_audio = synthesize_layer_type(
-                layer_type, frequency, duration_time, sample_rate, velocity
-            )
+            if sample_library is not None:
+                # Play the nearest sample from the library
+                note_audio = sample_library.render_note(
+                    note_name_to_midi(note_name),
+                    duration_time,
+                    sample_rate,
+                    velocity,
+                    dtype=audio.dtype,
+                )
+            else:
+                # Convert note to frequency
+                frequency = note_name_to_frequency(note_name)
+
+                # Generate the note audio
+                note_audio = synthesize_layer_type(
+                    layer_type,
+                    frequency,
+                    duration_time,
+                    sample_rate,
+                    velocity,
+                    harmonics,
+                    dtype=audio.dtype,
+                )
 
             # Calculate sample positions
-            start_sample = int(start_time * sample_rate)
+            if onsets is not None:
+                start_sample = onsets[index]
+            else:
+                start_sample = _onset_sample(start_beats, beats_per_second, sample_rate)
             end_sample = start_sample + len(note_audio)
 
             # Add to audio buffer (with bounds checking)
@@ -214,24 +541,252 @@ def midi_data_to_audio(
             print(f"Warning: Skipping note {note_name}: {e}")
             continue
 
+
+@dataclass(frozen=True)
+class LoopPlan:
+    """Layer notes split into unique bar windows and where each one repeats."""
+
+    window_beats: float
+    # Unique window contents, with note starts relative to the window start
+    segments: List[List[Tuple[str, float, float, int]]]
+    # (window start in beats, index into segments) for every non-empty window
+    placements: List[Tuple[float, int]]
+    # The original notes of each placement, in the order of its segment
+    windows: List[List[Tuple[str, float, float, int]]]
+
+    @property
+    def has_repeats(self) -> bool:
+        return len(self.placements) > len(self.segments)
+
+
+def _segments_match(
+    a: List[Tuple[str, float, float, int]],
+    b: List[Tuple[str, float, float, int]],
+    timing_tolerance: float,
+    velocity_tolerance: int,
+) -> bool:
+    """Return True when two windows hold the same notes within tolerance."""
+    if len(a) != len(b):
+        return False
+    for (note_a, start_a, dur_a, vel_a), (note_b, start_b, dur_b, vel_b) in zip(a, b):
+        if (
+            note_a != note_b
+            or abs(start_a - start_b) > timing_tolerance
+            or abs(dur_a - dur_b) > timing_tolerance
+            or abs(vel_a - vel_b) > velocity_tolerance
+        ):
+            return False
+    return True
+
+
+def detect_loops(
+    midi_data: List[Tuple[str, float, float, int]],
+    beats_per_bar: int = BEATS_PER_BAR,
+    candidate_bars: Tuple[int, ...] = (1, 2, 4, 8),
+    timing_tolerance: float = LOOP_TIMING_TOLERANCE,
+    velocity_tolerance: int = LOOP_VELOCITY_TOLERANCE,
+) -> LoopPlan:
+    """Find the bar window size whose repeats leave the fewest notes to render.
+
+    Notes are assigned to the window they start in; a window matches an
+    earlier one when every note agrees in pitch and, within the given
+    tolerances, in relative start, duration and velocity. Pass zero
+    tolerances to accept exact repeats only.
+    """
+    best_plan = None
+    best_cost = None
+
+    for bars in candidate_bars:
+        window_beats = float(bars * beats_per_bar)
+
+        windows: dict = {}
+        for note, start, duration, velocity in midi_data:
+            index = int(np.floor(start / window_beats))
+            # Keep the original start so placements can be checked exactly
+            windows.setdefault(index, []).append(
+                ((note, start - index * window_beats, duration, velocity), start)
+            )
+
+        segments: List[List[Tuple[str, float, float, int]]] = []
+        placements: List[Tuple[float, int]] = []
+        window_notes: List[List[Tuple[str, float, float, int]]] = []
+        for index in sorted(windows):
+            entries = sorted(
+                windows[index], key=lambda e: (e[0][1], e[0][0], e[0][2], e[0][3])
+            )
+            window = [relative for relative, _ in entries]
+            window_notes.append(
+                [
+                    (note, start, duration, velocity)
+                    for (note, _, duration, velocity), start in entries
+                ]
+            )
+            for segment_index, segment in enumerate(segments):
+                if _segments_match(
+                    window, segment, timing_tolerance, velocity_tolerance
+                ):
+                    break
+            else:
+                segment_index = len(segments)
+                segments.append(window)
+            placements.append((index * window_beats, segment_index))
+
+        # Prefer fewer rendered notes, then longer windows (fewer placements)
+        cost = sum(len(segment) for segment in segments)
+        if best_cost is None or cost <= best_cost:
+            best_plan = LoopPlan(window_beats, segments, placements, window_notes)
+            best_cost = cost
+
+    return best_plan
+
+
+def render_loop_plan(
+    audio: np.ndarray,
+    plan: LoopPlan,
+    layer_type: str,
+    sample_rate: int,
+    bpm: float,
+    harmonics: bool = True,
+    sample_library: Optional["SampleLibrary"] = None,
+) -> None:
+    """Synthesise each unique segment once and tile it into *audio*.
+
+    Segments are rendered with their full tails, so notes that ring past the
+    end of a window are overlap-added into the following window. Every note
+    starts on the exact sample direct rendering would use: when the window
+    length is not a whole number of samples, repeats round their note onsets
+    differently, so one tile is rendered per distinct onset pattern.
+    """
+    beats_per_second = bpm / 60.0
+    audio_length = len(audio)
+
+    tiles: Dict[Tuple[int, Tuple[int, ...]], np.ndarray] = {}
+    for (_, segment_index), window in zip(plan.placements, plan.windows):
+        onsets = [
+            _onset_sample(start, beats_per_second, sample_rate)
+            for _, start, _, _ in window
+        ]
+        offset = onsets[0]
+        key = (segment_index, tuple(onset - offset for onset in onsets))
+
+        buffer = tiles.get(key)
+        if buffer is None:
+            segment = plan.segments[segment_index]
+            segment_end = max(start + duration for _, start, duration, _ in segment)
+            buffer = np.zeros(
+                int((segment_end / beats_per_second + 1.0) * sample_rate),
+                dtype=audio.dtype,
+            )
+            _render_notes_into(
+                buffer,
+                segment,
+                layer_type,
+                sample_rate,
+                bpm,
+                harmonics,
+                sample_library,
+                onsets=list(key[1]),
+            )
+            tiles[key] = buffer
+
+        # Clip the tile to the output bounds
+        audio_start = max(0, offset)
+        audio_end = min(audio_length, offset + len(buffer))
+        if audio_end <= audio_start:
+            continue
+        tile_start = audio_start - offset
+        audio[audio_start:audio_end] += buffer[
+            tile_start : tile_start + audio_end - audio_start
+        ]
+
+
+def midi_data_to_audio(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    sample_rate: int = 22050,
+    bpm: float = 120.0,
+    harmonics: bool = True,
+    loop_aware: bool = True,
+    sample_library: Optional["SampleLibrary"] = None,
+    dtype: DTypeLike = np.float32,
+    loop_timing_tolerance: float = LOOP_TIMING_TOLERANCE,
+    loop_velocity_tolerance: int = LOOP_VELOCITY_TOLERANCE,
+) -> Tuple[np.ndarray, int]:
+    """Convert MIDI data to audio array.
+
+    With ``loop_aware`` enabled, repeating bar windows are synthesised once
+    and tiled (see `detect_loops`); windows within the loop tolerances of an
+    earlier one reuse its rendering. When a *sample_library* is given,
+    melodic layers are played with its samples instead of being synthesised.
+    Every note is accumulated in place into a single *dtype* buffer.
+    """
+
+    if not midi_data:
+        # Return 1 second of silence
+        return np.zeros(sample_rate, dtype=dtype), sample_rate
+
+    # Calculate total duration in seconds
+    beats_per_second = bpm / 60.0
+    max_time_beats = max(start + duration for _, start, duration, _ in midi_data)
+    total_duration = max_time_beats / beats_per_second + 1.0  # Add 1 second buffer
+
+    # Create output buffer
+    audio_length = int(total_duration * sample_rate)
+    audio = np.zeros(audio_length, dtype=dtype)
+
+    if is_percussion_layer(layer_type):
+        # One-shots are already just copies, no need to tile loops
+        _render_percussion_into(audio, midi_data, layer_type, sample_rate, bpm)
+    else:
+        plan = (
+            detect_loops(
+                midi_data,
+                timing_tolerance=loop_timing_tolerance,
+                velocity_tolerance=loop_velocity_tolerance,
+            )
+            if loop_aware
+            else None
+        )
+        if plan is not None and plan.has_repeats:
+            render_loop_plan(
+                audio, plan, layer_type, sample_rate, bpm, harmonics, sample_library
+            )
+        else:
+            _render_notes_into(
+                audio,
+                midi_data,
+                layer_type,
+                sample_rate,
+                bpm,
+                harmonics,
+                sample_library,
+            )
+
     # Normalize to prevent clipping
-    if np.max(np.abs(audio)) > 0:
-        audio = audio / np.max(np.abs(audio)) * 0.8
+    _normalize_in_place(audio)
 
     return audio, sample_rate
 
 
-def audio_to_bytes(audio: np.ndarray, sample_rate: int, format: str = "wav") -> bytes:
-    """Convert audio array to bytes for streaming/download."""
-
-    # Create a bytes buffer
+def _write_bytes(
+    audio: np.ndarray, sample_rate: int, format: str, subtype: Optional[str]
+) -> bytes:
+    """Encode *audio* into an in-memory file, raising if the encoder fails."""
     buffer = io.BytesIO()
+    sf.write(buffer, audio, sample_rate, format=format.upper(), subtype=subtype)
+    return buffer.getvalue()
+
+
+def audio_to_bytes(
+    audio: np.ndarray,
+    sample_rate: int,
+    format: str = "wav",
+    subtype: Optional[str] = None,
+) -> bytes:
+    """Convert audio array to bytes for streaming/download."""
 
     try:
-        # Write audio to buffer
-        sf.write(buffer, audio, sample_rate, format=format.upper())
-        buffer.seek(0)
-        return buffer.getvalue()
+        return _write_bytes(audio, sample_rate, format, subtype)
     except Exception as e:
         print(f"Error converting audio to bytes: {e}")
         # Return empty WAV file
@@ -242,98 +797,501 @@ def audio_to_bytes(audio: np.ndarray, sample_rate: int, format: str = "wav") ->
         return buffer.getvalue()
 
 
-def create_layer_preview(
-    midi_data: List[Tuple[str, float, float, int]],
-    layer_type: str = "melody",
-    duration_limit: float = 30.0,
-    bpm: float = 120.0,
-) -> bytes:
-    """Create an audio preview of a MIDI layer (limited duration for web playback)."""
+def resolve_encoding(encoding: str = "auto") -> str:
+    """Resolve *encoding* to a concrete one.
 
-    if not midi_data:
-        return audio_to_bytes(np.zeros(22050), 22050)  # 1 second silence
+    "auto" picks the smallest encoding libsndfile can write that every
+    browser can play.
+    """
+    if encoding != "auto":
+        if encoding not in PREVIEW_ENCODINGS:
+            raise ValueError(
+                f"Unknown encoding '{encoding}'. "
+                f"Choose from: auto, {', '.join(PREVIEW_ENCODINGS)}"
+            )
+        return encoding
+
+    for candidate in AUTO_ENCODING_ORDER:
+        spec = PREVIEW_ENCODINGS[candidate]
+        if sf.check_format(spec["format"], spec["subtype"]):
+            return candidate
+    return "wav"
 
-    # Limit duration for web preview
-    beats_per_second = bpm / 60.0
-    max_beats = duration_limit * beats_per_second
 
-    # Filter notes that start within the time limit
-    limited_midi = [
+def encode_audio(
+    audio: np.ndarray, sample_rate: int, encoding: str = "auto"
+) -> EncodedAudio:
+    """Encode *audio* for playback, reporting the payload size and encode time.
+
+    If the requested encoding fails the audio is encoded as 16-bit WAV, and
+    the result names the encoding that was actually produced.
+    """
+    encoding = resolve_encoding(encoding)
+    spec = PREVIEW_ENCODINGS[encoding]
+
+    start = time.perf_counter()
+    try:
+        data = _write_bytes(audio, sample_rate, spec["format"], spec["subtype"])
+    except Exception as e:
+        print(f"Warning: {encoding} encoding failed, falling back to WAV: {e}")
+        encoding = "wav"
+        spec = PREVIEW_ENCODINGS[encoding]
+        data = audio_to_bytes(audio, sample_rate, spec["format"], spec["subtype"])
+    encode_time = time.perf_counter() - start
+
+    return EncodedAudio(data, encoding, spec["mime"], encode_time)
+
+
+def _limit_midi_data(
+    midi_data: List[Tuple[str, float, float, int]], max_beats: float
+) -> List[Tuple[str, float, float, int]]:
+    """Keep only the notes that start before *max_beats*."""
+    return [
         (note, start, duration, velocity)
         for note, start, duration, velocity in midi_data
         if start < max_beats
     ]
 
+
+def _stem_key(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str,
+    duration_limit: float,
+    bpm: float,
+    sample_rate: int,
+    sample_library: Optional["SampleLibrary"] = None,
+    dtype: DTypeLike = np.float32,
+) -> tuple:
+    """Build the stem cache key for a layer and its render settings."""
+    return (
+        midi_content_hash(midi_data),
+        layer_type,
+        float(bpm),
+        sample_rate,
+        float(duration_limit),
+        (
+            (sample_library.directory, sample_library.fingerprint)
+            if sample_library is not None
+            else None
+        ),
+        np.dtype(dtype).str,
+    )
+
+
+def _render_stem(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str,
+    duration_limit: float,
+    bpm: float,
+    sample_rate: int,
+    sample_library: Optional["SampleLibrary"],
+    dtype: DTypeLike,
+) -> np.ndarray:
+    """Render the notes of a layer that start within *duration_limit* seconds."""
+    max_beats = duration_limit * bpm / 60.0
+    limited_midi = _limit_midi_data(midi_data, max_beats)
     if not limited_midi:
-        return audio_to_bytes(np.zeros(22050), 22050)
+        stem = np.zeros(0, dtype=dtype)
+    else:
+        stem, _ = midi_data_to_audio(
+            limited_midi,
+            layer_type,
+            sample_rate,
+            bpm,
+            sample_library=sample_library,
+            dtype=dtype,
+        )
+    stem.flags.writeable = False
+    return stem
 
-    # Generate audio
-    audio, sample_rate = midi_data_to_audio(limited_midi, layer_type, bpm=bpm)
 
-    # Convert to bytes
-    return audio_to_bytes(audio, sample_rate)
+def render_layer_stem(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    sample_rate: int = 22050,
+    sample_library: Optional["SampleLibrary"] = None,
+    dtype: DTypeLike = np.float32,
+) -> np.ndarray:
+    """Render a layer limited to *duration_limit* seconds, reusing cached stems.
+
+    Stems are keyed by the layer content hash, layer type, bpm, sample rate,
+    duration limit and sample library files, so re-rendering an unchanged
+    layer is a dictionary lookup.
+    The returned array is shared with the cache and must not be modified.
+    """
+    key = _stem_key(
+        midi_data, layer_type, duration_limit, bpm, sample_rate, sample_library, dtype
+    )
 
+    return _stem_cache.get_or_create(
+        key,
+        lambda: _render_stem(
+            midi_data,
+            layer_type,
+            duration_limit,
+            bpm,
+            sample_rate,
+            sample_library,
+            dtype,
+        ),
+    )
 
-def create_mix_preview(
-    layers: List[dict], duration_limit: float = 30.0, bpm: float = 120.0
-) -> bytes:
-    """Create an audio preview of multiple MIDI layers mixed together."""
 
-    if not layers:
-        return audio_to_bytes(np.zeros(22050), 22050)
+def get_layer_waveform(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    duration_limit: float = math.inf,
+    bpm: float = 120.0,
+    sample_rate: int = 22050,
+    sample_library: Optional["SampleLibrary"] = None,
+) -> WaveformPyramid:
+    """Return the (cached) waveform overview pyramid of a layer's rendered audio.
+
+    By default the whole layer is rendered, however long. A matching stem is
+    reused from the stem cache, but a freshly rendered one is not added to
+    it: only the pyramid, a small fraction of its size, is kept.
+    """
+    key = _stem_key(
+        midi_data, layer_type, duration_limit, bpm, sample_rate, sample_library
+    )
+
+    def build() -> WaveformPyramid:
+        stem = _stem_cache.get(key)
+        if stem is None:
+            stem = _render_stem(
+                midi_data,
+                layer_type,
+                duration_limit,
+                bpm,
+                sample_rate,
+                sample_library,
+                np.float32,
+            )
+        return WaveformPyramid(stem, sample_rate)
+
+    return _waveform_cache.get_or_create(key, build)
+
+
+def get_stem_cache_stats() -> dict:
+    """Return usage statistics of the rendered stem cache."""
+    return _stem_cache.stats()
+
+
+def clear_stem_cache() -> None:
+    """Drop every cached stem and waveform overview."""
+    _stem_cache.clear()
+    _waveform_cache.clear()
+
+
+def render_layer_preview(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    sample_library: Optional["SampleLibrary"] = None,
+) -> Tuple[np.ndarray, int]:
+    """Render the audio of a layer preview, falling back to one second of silence."""
 
     sample_rate = 22050
+    audio = render_layer_stem(
+        midi_data, layer_type, duration_limit, bpm, sample_rate, sample_library
+    )
+
+    if not len(audio):
+        return np.zeros(sample_rate, dtype=np.float32), sample_rate
+
+    return audio, sample_rate
+
+
+def render_draft_preview(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    bpm: float = 120.0,
+    bars: int = DRAFT_BARS,
+    sample_rate: int = DRAFT_SAMPLE_RATE,
+    sample_library: Optional["SampleLibrary"] = None,
+) -> Tuple[np.ndarray, int]:
+    """Quickly render a low sample-rate, fundamental-only draft of the first bars."""
+
+    draft_midi = _limit_midi_data(midi_data, bars * BEATS_PER_BAR)
+    if not draft_midi:
+        return np.zeros(sample_rate, dtype=np.float32), sample_rate
+
+    return midi_data_to_audio(
+        draft_midi,
+        layer_type,
+        sample_rate,
+        bpm,
+        harmonics=False,
+        sample_library=sample_library,
+    )
+
+
+def layer_preview_key(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    sample_library: Optional["SampleLibrary"] = None,
+) -> tuple:
+    """Stem cache key of the full-quality preview of a layer.
+
+    A preview whose key differs from the current one is stale, e.g. because
+    the layer's sample library changed.
+    """
+    return _stem_key(midi_data, layer_type, duration_limit, bpm, 22050, sample_library)
+
+
+class ProgressivePreview:
+    """A draft preview available immediately plus a full render in the background.
+
+    *key* is the `layer_preview_key` of the full render.
+    """
+
+    def __init__(
+        self,
+        draft: Tuple[np.ndarray, int],
+        full: "Future[Tuple[np.ndarray, int]]",
+        key: tuple,
+    ) -> None:
+        self.draft = draft
+        self.full = full
+        self.key = key
+        # (requested encoding, payload), which may have fallen back to WAV
+        self._encoded_draft: Optional[Tuple[str, EncodedAudio]] = None
+
+    def encoded_draft(self, encoding: str = "auto") -> EncodedAudio:
+        """Return the draft encoded with *encoding*, encoding it only once."""
+        encoding = resolve_encoding(encoding)
+        if self._encoded_draft is None or self._encoded_draft[0] != encoding:
+            self._encoded_draft = (encoding, encode_audio(*self.draft, encoding))
+        return self._encoded_draft[1]
+
+    def done(self) -> bool:
+        """Return True once the full-quality render has finished."""
+        return self.full.done()
+
+    def best(self) -> Tuple[np.ndarray, int]:
+        """Return the full render if it is ready, otherwise the draft."""
+        if self.full.done() and self.full.exception() is None:
+            return self.full.result()
+        return self.draft
+
+
+def start_progressive_preview(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    sample_library: Optional["SampleLibrary"] = None,
+) -> ProgressivePreview:
+    """Render a draft preview now and schedule the full-quality render.
+
+    When the full stem is already cached no draft is rendered and the
+    returned preview is complete straight away.
+    """
+    key = layer_preview_key(midi_data, layer_type, duration_limit, bpm, sample_library)
+    if key in _stem_cache:
+        full: "Future[Tuple[np.ndarray, int]]" = Future()
+        full.set_result(
+            render_layer_preview(
+                midi_data, layer_type, duration_limit, bpm, sample_library
+            )
+        )
+        return ProgressivePreview(full.result(), full, key)
+
+    draft = render_draft_preview(
+        midi_data, layer_type, bpm, sample_library=sample_library
+    )
+    full = _preview_executor.submit(
+        render_layer_preview,
+        midi_data,
+        layer_type,
+        duration_limit,
+        bpm,
+        sample_library,
+    )
+    return ProgressivePreview(draft, full, key)
+
+
+def create_layer_preview(
+    midi_data: List[Tuple[str, float, float, int]],
+    layer_type: str = "melody",
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    encoding: str = "wav",
+    sample_library: Optional["SampleLibrary"] = None,
+) -> bytes:
+    """Create an audio preview of a MIDI layer (limited duration for web playback)."""
+
+    # Generate (or reuse) the audio of the notes within the time limit
+    audio, sample_rate = render_layer_preview(
+        midi_data, layer_type, duration_limit, bpm, sample_library
+    )
+
+    # Convert to bytes
+    return encode_audio(audio, sample_rate, encoding).data
+
+
+def mix_layers_audio(
+    layers: List[dict],
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    sample_rate: int = 22050,
+    sample_libraries: Optional[Dict[str, "SampleLibrary"]] = None,
+    dtype: DTypeLike = np.float32,
+) -> Tuple[np.ndarray, int]:
+    """Mix the unmuted *layers* into a single normalised audio buffer.
+
+    *sample_libraries* maps layer types to the sample library their layers
+    are played with; other layer types are synthesised.
+    """
+
+    sample_libraries = sample_libraries or {}
+
     beats_per_second = bpm / 60.0
     max_beats = duration_limit * beats_per_second
 
-    # Calculate total duration
-    all_midi_data = []
-    for layer in layers:
-        if layer.get("muted", False):
-            continue
-        midi_data = layer.get("midi_data", [])
-        all_midi_data.extend(midi_data)
+    audible_layers = [
+        layer
+        for layer in layers
+        if not layer.get("muted", False) and layer.get("midi_data")
+    ]
 
-    if not all_midi_data:
-        return audio_to_bytes(np.zeros(sample_rate), sample_rate)
+    if not audible_layers:
+        return np.zeros(sample_rate, dtype=dtype), sample_rate
 
     # Calculate audio length
     max_time_beats = min(
-        max_beats, max(start + duration for _, start, duration, _ in all_midi_data)
+        max_beats,
+        max(
+            start + duration
+            for layer in audible_layers
+            for _, start, duration, _ in layer["midi_data"]
+        ),
     )
     total_duration = max_time_beats / beats_per_second + 1.0
     audio_length = int(total_duration * sample_rate)
-    mixed_audio = np.zeros(audio_length)
-
-    # Mix each layer
-    for layer in layers:
-        if layer.get("muted", False):
-            continue
+    mixed_audio = np.zeros(audio_length, dtype=dtype)
 
-        midi_data = layer.get("midi_data", [])
+    # Mix each layer from its (cached) stem
+    for layer in audible_layers:
         layer_type = layer.get("type", "melody")
+        layer_audio = render_layer_stem(
+            layer["midi_data"],
+            layer_type,
+            duration_limit,
+            bpm,
+            sample_rate,
+            sample_libraries.get(layer_type),
+            dtype,
+        )
 
-        if not midi_data:
-            continue
+        # Mix into the main audio (with length matching)
+        mix_length = min(len(mixed_audio), len(layer_audio))
+        mixed_audio[:mix_length] += layer_audio[:mix_length]
 
-        # Filter for duration limit
-        limited_midi = [
-            (note, start, duration, velocity)
-            for note, start, duration, velocity in midi_data
-            if start < max_beats
-        ]
+    # Normalize the mix
+    _normalize_in_place(mixed_audio)
+
+    return mixed_audio, sample_rate
+
+
+def create_mix_preview(
+    layers: List[dict],
+    duration_limit: float = 30.0,
+    bpm: float = 120.0,
+    encoding: str = "wav",
+    sample_libraries: Optional[Dict[str, "SampleLibrary"]] = None,
+) -> bytes:
+    """Create an audio preview of multiple MIDI layers mixed together."""
+
+    mixed_audio, sample_rate = mix_layers_audio(
+        layers, duration_limit, bpm, sample_libraries=sample_libraries
+    )
+    return encode_audio(mixed_audio, sample_rate, encoding).data
+
+
+def midi_file_to_layers(
+    path: str, layer_type: str = "bassline"
+) -> Tuple[List[dict], float]:
+    """Read a ``.mid`` file into layer dicts (one per instrument) and its tempo.
+
+    Drum instruments become "drums" layers; every other instrument is
+    rendered as *layer_type*. Timing uses the file's first tempo.
+    """
+    midi = pretty_midi.PrettyMIDI(str(path))
+    _, tempi = midi.get_tempo_changes()
+    bpm = float(tempi[0]) if len(tempi) else 120.0
+    beats_per_second = bpm / 60.0
 
-        if limited_midi:
-            layer_audio, _ = midi_data_to_audio(
-                limited_midi, layer_type, sample_rate, bpm
+    layers = []
+    for instrument in midi.instruments:
+        midi_data = [
+            (
+                pretty_midi.note_number_to_name(note.pitch),
+                note.start * beats_per_second,
+                (note.end - note.start) * beats_per_second,
+                note.velocity,
+            )
+            for note in instrument.notes
+        ]
+        if midi_data:
+            layers.append(
+                {
+                    "type": "drums" if instrument.is_drum else layer_type,
+                    "midi_data": midi_data,
+                }
             )
 
-            # Mix into the main audio (with length matching)
-            mix_length = min(len(mixed_audio), len(layer_audio))
-            mixed_audio[:mix_length] += layer_audio[:mix_length]
+    return layers, bpm
 
-    # Normalize the mix
-    if np.max(np.abs(mixed_audio)) > 0:
-        mixed_audio = mixed_audio / np.max(np.abs(mixed_audio)) * 0.8
 
-    return audio_to_bytes(mixed_audio, sample_rate)
+def render_midi_file(
+    path: str,
+    layer_type: str = "bassline",
+    sample_rate: int = 22050,
+    bpm: Optional[float] = None,
+    dtype: DTypeLike = np.float32,
+) -> Tuple[np.ndarray, int]:
+    """Render a complete ``.mid`` file to a normalised audio buffer.
+
+    Unlike the previews this bypasses the stem cache, so batch renders do
+    not fill it with one-off stems.
+    """
+    layers, file_bpm = midi_file_to_layers(path, layer_type)
+    if not layers:
+        return np.zeros(sample_rate, dtype=dtype), sample_rate
+
+    if bpm is not None:
+        # Notes were converted to beats with the file tempo; keep them in beats
+        # and play them back at the requested tempo instead
+        file_bpm = bpm
+
+    stems = [
+        midi_data_to_audio(
+            layer["midi_data"], layer["type"], sample_rate, file_bpm, dtype=dtype
+        )[0]
+        for layer in layers
+    ]
+    audio = np.zeros(max(len(stem) for stem in stems), dtype=dtype)
+    for stem in stems:
+        audio[: len(stem)] += stem
+
+    _normalize_in_place(audio)
+    return audio, sample_rate
+
+
+def write_audio_file(
+    audio: np.ndarray,
+    sample_rate: int,
+    file: Union[str, BinaryIO],
+    encoding: str = "wav",
+) -> None:
+    """Write *audio* to a path or binary *file* in a `PREVIEW_ENCODINGS` format."""
+    spec = PREVIEW_ENCODINGS[resolve_encoding(encoding)]
+    if isinstance(file, PathLike):
+        file = str(file)
+    sf.write(file, audio, sample_rate, format=spec["format"], subtype=spec["subtype"])
@@ -5,16 +5,21 @@ entry-points so we avoid code duplication.
 """
 from __future__ import annotations
 
+import hashlib
 import os
+import re
 from io import BytesIO
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Hashable, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from midiutil import MIDIFile
 from openai import OpenAI
 from pydantic import BaseModel, Field, ValidationError
 
+from .cache import MemoryBoundedCache
+from .ratelimit import INTERACTIVE, estimate_tokens, get_rate_limiter
+
 # ---------------------------------------------------------------------------
 # Model definitions
 # ---------------------------------------------------------------------------
@@ -98,6 +103,17 @@ def note_name_to_midi(note: str) -> int:
     return NOTES_TO_MIDI[pitch] + (int(octave) + 1) * 12
 
 
+def midi_content_hash(
+    midi_data: List[Tuple[str, float, float]] | List[Tuple[str, float, float, int]],
+) -> str:
+    """Return a stable digest of *midi_data* suitable for cache keys."""
+
+    digest = hashlib.blake2b(digest_size=16)
+    for data in midi_data:
+        digest.update(repr(tuple(data)).encode("utf-8"))
+    return digest.hexdigest()
+
+
 # ---------------------------------------------------------------------------
 # OpenAI interaction
 # ---------------------------------------------------------------------------
@@ -109,6 +125,115 @@ def _model_to_tuples(model: MidiResponse) -> List[Tuple[str, float, float, int]]
     return [(n.pitch, n.start, n.duration, n.velocity) for n in model.notes]
 
 
+def _prepare_request(
+    prompt: str,
+    api_key: str | None,
+    layer_type: str,
+    existing_layers: List[dict] | None,
+) -> Tuple[OpenAI, List[dict]]:
+    """Return the OpenAI client and chat messages for a layer request."""
+
+    # Ensure environment variables are loaded once — harmless if called again.
+    load_dotenv()
+
+    if api_key is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise EnvironmentError("OPENAI_API_KEY not set. Provide it or add to .env")
+
+    # Create layering-aware prompt if we have existing layers
+    final_prompt = prompt
+    if existing_layers:
+        final_prompt = create_layering_prompt(layer_type, prompt, existing_layers)
+
+    client = OpenAI(api_key=api_key)
+    messages = [
+        {"role": "system", "content": PROMPT_SYSTEM},
+        {"role": "user", "content": final_prompt},
+    ]
+    return client, messages
+
+
+def _used_tokens(completion: object) -> int | None:
+    """Total tokens reported for a completion, if the API returned usage."""
+
+    usage = getattr(completion, "usage", None)
+    return usage.total_tokens if usage is not None else None
+
+
+def _partial_notes(parsed: object) -> List[Tuple[str, float, float, int]]:
+    """Return the complete notes of a partially streamed `MidiResponse`.
+
+    The last note in the snapshot may still be streaming, so it is only
+    included once a later note has started.
+    """
+
+    if not isinstance(parsed, dict):
+        return []
+
+    notes = []
+    for note in (parsed.get("notes") or [])[:-1]:
+        try:
+            notes.append(Note.model_validate(note))
+        except ValidationError:
+            continue
+    return [(n.pitch, n.start, n.duration, n.velocity) for n in notes]
+
+
+def stream_midi(
+    prompt: str,
+    *,
+    api_key: str | None = None,
+    model: str = "o1",
+    layer_type: str = "bassline",
+    existing_layers: List[dict] | None = None,
+    on_notes: Optional[Callable[[List[Tuple[str, float, float, int]]], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    priority: str = INTERACTIVE,
+    session: Hashable = None,
+) -> Tuple[str, List[Tuple[str, float, float, int]]]:
+    """Streaming variant of `request_midi`.
+
+    *on_notes* is called with the notes completed so far whenever the
+    streamed response grows by a note. When *should_stop* returns True
+    (while waiting for the rate limiter or streaming) `InterruptedError`
+    is raised and the stream is closed.
+    """
+
+    client, messages = _prepare_request(prompt, api_key, layer_type, existing_layers)
+    limiter = get_rate_limiter()
+    grant = limiter.acquire(
+        model, estimate_tokens(messages), priority, session, should_stop
+    )
+
+    note_count = 0
+    with client.beta.chat.completions.stream(
+        model=model,
+        response_format=MidiResponse,
+        messages=messages,
+    ) as stream:
+        for event in stream:
+            if should_stop is not None and should_stop():
+                raise InterruptedError("Generation cancelled")
+            if event.type != "content.delta" or on_notes is None:
+                continue
+
+            notes = _partial_notes(event.parsed)
+            if len(notes) > note_count:
+                note_count = len(notes)
+                on_notes(notes)
+
+        completion = stream.get_final_completion()
+    limiter.settle(grant, _used_tokens(completion))
+
+    try:
+        midi_resp = MidiResponse.model_validate(completion.choices[0].message.parsed)
+    except ValidationError as exc:  # pragma: no cover – should never happen
+        raise ValueError(f"Model output failed validation: {exc}") from exc
+
+    return midi_resp.title, _model_to_tuples(midi_resp)
+
+
 def request_midi(
     prompt: str,
     *,
@@ -116,6 +241,8 @@ def request_midi(
     model: str = "o1",
     layer_type: str = "bassline",
     existing_layers: List[dict] | None = None,
+    priority: str = INTERACTIVE,
+    session: Hashable = None,
 ) -> Tuple[str, List[Tuple[str, float, float, int]]]:
     """Ask the LLM for a MIDI layer (bassline, melody, chords, etc.).
 
@@ -129,31 +256,21 @@ def request_midi(
     The function relies on OpenAI's *structured output* feature using
     the very convenient `beta.chat.completions.parse` helper which
     guarantees a JSON response that matches the `MidiResponse` schema.
-    """
-
-    # Ensure environment variables are loaded once — harmless if called again.
-    load_dotenv()
-
-    if api_key is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise EnvironmentError("OPENAI_API_KEY not set. Provide it or add to .env")
 
-    # Create layering-aware prompt if we have existing layers
-    final_prompt = prompt
-    if existing_layers:
-        final_prompt = create_layering_prompt(layer_type, prompt, existing_layers)
+    Requests go through the shared rate limiter; *priority* (interactive
+    or batch) and *session* decide their place in its queue.
+    """
 
-    client = OpenAI(api_key=api_key)
+    client, messages = _prepare_request(prompt, api_key, layer_type, existing_layers)
+    limiter = get_rate_limiter()
+    grant = limiter.acquire(model, estimate_tokens(messages), priority, session)
 
     response = client.beta.chat.completions.parse(
         model=model,
         response_format=MidiResponse,
-        messages=[
-            {"role": "system", "content": PROMPT_SYSTEM},
-            {"role": "user", "content": final_prompt},
-        ],
+        messages=messages,
     )
+    limiter.settle(grant, _used_tokens(response))
 
     try:
         midi_resp = MidiResponse.model_validate(response.choices[0].message.parsed)
@@ -209,6 +326,14 @@ def _write_notes_to_midi(
             continue
 
 
+def slugify(text: str) -> str:
+    """Return a filesystem-safe slug derived from *text*."""
+
+    slug = re.sub(r"[^a-zA-Z0-9\-]+", "_", text.strip().lower())
+    slug = re.sub(r"_+", "_", slug).strip("_")
+    return slug or "untitled"
+
+
 def generate_midi_file(
     midi_data: List[Tuple[str, float, float]] | List[Tuple[str, float, float, int]],
     output_path: Path | str,
@@ -223,6 +348,11 @@ def generate_midi_file(
         midi.writeFile(fp)
 
 
+# Encoded exports keyed by layer content, so unchanged layers are never re-encoded
+EXPORT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+_export_cache = MemoryBoundedCache(EXPORT_CACHE_MAX_BYTES)
+
+
 def midi_to_bytes(
     midi_data: List[Tuple[str, float, float]] | List[Tuple[str, float, float, int]]
 ) -> bytes:
@@ -432,3 +562,70 @@ def combine_midi_layers(layers: List[dict]) -> List[Tuple[str, float, float, int
 
     # Sort by start time for proper playback
     return sorted(combined_data, key=lambda x: x[1])
+
+
+def make_layer(
+    layer_id: int,
+    layer_type: str,
+    title: str,
+    midi_data: List[Tuple[str, float, float, int]],
+) -> dict:
+    """Return a new (unmuted) layer dict with its analysis and content hash."""
+
+    return {
+        "id": layer_id,
+        "type": layer_type,
+        "title": title,
+        "midi_data": midi_data,
+        "analysis": analyze_midi_data(midi_data),
+        "content_hash": midi_content_hash(midi_data),
+        "muted": False,
+        "solo": False,
+    }
+
+
+def layer_content_hash(layer: dict) -> str:
+    """Return the layer's stored content hash, computing it if it has none."""
+
+    return layer.get("content_hash") or midi_content_hash(layer["midi_data"])
+
+
+def _encode_midi(
+    midi_data: List[Tuple[str, float, float, int]],
+    on_encode: Optional[Callable[[], None]],
+) -> bytes:
+    if on_encode is not None:
+        on_encode()
+    return midi_to_bytes(midi_data)
+
+
+def layer_midi_bytes(
+    layer: dict, on_encode: Optional[Callable[[], None]] = None
+) -> bytes:
+    """Return the layer's MIDI file bytes, encoding each distinct content once.
+
+    *on_encode* is called whenever the bytes are not cached and have to be
+    encoded (e.g. to count encodes per session).
+    """
+
+    return _export_cache.get_or_create(
+        ("layer", layer_content_hash(layer)),
+        lambda: _encode_midi(layer["midi_data"], on_encode),
+    )
+
+
+def combined_midi_bytes(
+    layers: List[dict], on_encode: Optional[Callable[[], None]] = None
+) -> bytes:
+    """Return `combine_midi_layers` of *layers* as MIDI bytes, memoised by content.
+
+    *on_encode* is called as for `layer_midi_bytes`.
+    """
+
+    key = (
+        "combined",
+        tuple((layer_content_hash(layer), layer.get("type")) for layer in layers),
+    )
+    return _export_cache.get_or_create(
+        key, lambda: _encode_midi(combine_midi_layers(layers), on_encode)
+    )
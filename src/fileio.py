@@ -0,0 +1,34 @@
+"""File helpers shared by the caches, project files and batch tools."""
+
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+
+@contextmanager
+def atomic_write(
+    path: Union[str, Path], mode: str = "wb", encoding: Optional[str] = None
+) -> Iterator[IO]:
+    """Open a temp file next to *path* and move it into place on success.
+
+    Every writer gets its own temp file, so concurrent writers (threads or
+    processes) never share one, and readers only ever see a complete file.
+    If writing fails the temp file is removed and *path* is left untouched.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(
+        prefix=f".{path.name}.", suffix=".tmp", dir=path.parent
+    )
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,181 @@
+"""Shared cache for model generations with single-flight request coalescing.
+
+Identical requests (same model, layer type and final prompt, including the
+existing-layer context) are served from a process-wide cache, and identical
+requests that arrive while one is in flight wait for it instead of calling
+the API again. Setting ``MIDIGPT_GENERATION_CACHE`` (or passing a directory)
+also stores results as JSON files, so other processes and restarts reuse
+them; coalescing itself is per process.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from .cache import MemoryBoundedCache, SingleFlight
+from .core import PROMPT_SYSTEM, create_layering_prompt, stream_midi
+from .fileio import atomic_write
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_MAX_BYTES = 16 * 1024 * 1024
+GENERATION_CACHE_DIR_ENV = "MIDIGPT_GENERATION_CACHE"
+
+# Coalesced callers re-check for cancellation this often (seconds)
+_WAIT_POLL_SECONDS = 0.2
+
+Generation = Tuple[str, List[Tuple[str, float, float, int]]]
+
+
+def generation_key(
+    prompt: str,
+    model: str = "o1",
+    layer_type: str = "bassline",
+    existing_layers: Optional[List[dict]] = None,
+) -> str:
+    """Return a digest identifying everything that is sent to the model."""
+    final_prompt = prompt
+    if existing_layers:
+        final_prompt = create_layering_prompt(layer_type, prompt, existing_layers)
+    payload = json.dumps([model, layer_type, PROMPT_SYSTEM, final_prompt])
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class GenerationCache:
+    """In-memory (and optionally file-backed) cache of generated layers."""
+
+    def __init__(
+        self,
+        max_bytes: int = GENERATION_CACHE_MAX_BYTES,
+        directory: Optional[str] = None,
+    ) -> None:
+        self._memory = MemoryBoundedCache(max_bytes)
+        self._flights = SingleFlight()
+        self.directory = Path(directory).expanduser() if directory else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.generated = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Generation]:
+        """Return a stored generation from memory or disk."""
+        result = self._memory.get(key)
+        if result is not None or self.directory is None:
+            return result
+
+        try:
+            stored = json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        result = (stored["title"], [tuple(note) for note in stored["notes"]])
+        self._memory.put(key, result)
+        return result
+
+    def put(self, key: str, result: Generation) -> None:
+        """Store a generation in memory and, if configured, on disk."""
+        self._memory.put(key, result)
+        if self.directory is None:
+            return
+
+        with atomic_write(self._path(key), "w", encoding="utf-8") as f:
+            json.dump({"title": result[0], "notes": result[1]}, f)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def generate(
+        self,
+        generate: Callable[..., Generation],
+        prompt: str,
+        *,
+        fresh: bool = False,
+        should_stop: Optional[Callable[[], bool]] = None,
+        **request_kwargs,
+    ) -> Generation:
+        """Return ``generate(prompt, **request_kwargs)``, reusing identical requests.
+
+        With *fresh* the cache is bypassed (and then updated), so users can
+        ask for a new variation of a prompt they have already generated.
+        """
+        key = generation_key(
+            prompt,
+            request_kwargs.get("model", "o1"),
+            request_kwargs.get("layer_type", "bassline"),
+            request_kwargs.get("existing_layers"),
+        )
+
+        def run() -> Generation:
+            result = generate(prompt, should_stop=should_stop, **request_kwargs)
+            self._count("generated")
+            try:
+                self.put(key, result)
+            except Exception:  # noqa: BLE001
+                # A failed cache write must not fail a successful generation
+                logger.warning("Could not cache generation %s", key, exc_info=True)
+            return result
+
+        if fresh:
+            return run()
+
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                self._count("hits")
+                return cached
+
+            try:
+                result, shared = self._flights.do(key, run, _WAIT_POLL_SECONDS)
+            except concurrent.futures.TimeoutError:
+                # Still in flight: wait again unless this caller was cancelled
+                if should_stop is not None and should_stop():
+                    raise InterruptedError("Generation cancelled")
+                continue
+            except InterruptedError:
+                # The request we joined was cancelled by its own caller; retry
+                if should_stop is not None and should_stop():
+                    raise
+                continue
+
+            if shared:
+                self._count("coalesced")
+            return result
+
+    def stats(self) -> dict:
+        """Return hit/coalesce/generation counters and current in-flight calls."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "generated": self.generated,
+                "in_flight": self._flights.in_flight(),
+                "entries": len(self._memory),
+            }
+
+
+_generation_cache: Optional[GenerationCache] = None
+_generation_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """Return the process-wide generation cache, creating it on first use."""
+    global _generation_cache
+    with _generation_cache_lock:
+        if _generation_cache is None:
+            _generation_cache = GenerationCache(
+                directory=os.getenv(GENERATION_CACHE_DIR_ENV) or None
+            )
+        return _generation_cache
+
+
+def cached_stream_midi(prompt: str, *, fresh: bool = False, **kwargs) -> Generation:
+    """`stream_midi` through the shared generation cache."""
+    return get_generation_cache().generate(stream_midi, prompt, fresh=fresh, **kwargs)
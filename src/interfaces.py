@@ -1,12 +1,12 @@
 """Streamlit interface components for the MIDI generation app."""
 
-import random
-from typing import List, Optional
+from typing import Dict, List, NamedTuple, Optional
 
+import numpy as np
 import streamlit as st
 from mido import MidiFile
 
-from .core import request_midi, midi_to_bytes, combine_midi_layers
+from .core import layer_midi_bytes, combined_midi_bytes
 from .presets import ARTIST_PRESETS, LAYER_TYPES, CREATIVE_CONTROLS
 from .session import (
     add_layer,
@@ -16,13 +16,176 @@ from .session import (
     toggle_layer_solo,
     get_active_layers,
     clear_all_layers,
+    clear_solo,
+    count_midi_encode,
+    get_layer_store,
+    run_timer,
+    set_all_layers_muted,
 )
 from .visualization import (
     plot_midi_layers,
     plot_single_layer_analysis,
     create_velocity_heatmap,
+    plot_waveform_overview,
+    piano_roll_vega_lite_spec,
+    get_plot_cache_stats,
+    render_plot_png,
 )
-from .audio import create_layer_preview, create_mix_preview
+from .audio import (
+    PREVIEW_ENCODINGS,
+    EncodedAudio,
+    ProgressivePreview,
+    encode_audio,
+    get_layer_waveform,
+    get_stem_cache_stats,
+    is_percussion_layer,
+    layer_preview_key,
+    mix_layers_audio,
+    resolve_encoding,
+    start_progressive_preview,
+)
+from .sampler import SampleLibrary, get_sample_library
+from .jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobRunner
+from .arrangement import Arrangement, build_layer_prompt, request_layer_type
+from .generation_cache import get_generation_cache
+from .ratelimit import BATCH, INTERACTIVE, get_rate_limiter
+
+
+def _play_preview(audio: np.ndarray, sample_rate: int) -> None:
+    """Encode a rendered preview with the selected encoding and play it."""
+
+    _show_encoded_preview(
+        encode_audio(
+            audio, sample_rate, st.session_state.get("preview_encoding", "auto")
+        )
+    )
+
+
+def _show_encoded_preview(encoded: EncodedAudio) -> None:
+    """Play an encoded preview with its size and encode time."""
+
+    st.audio(encoded.data, format=encoded.mime)
+    st.caption(
+        f"📦 {encoded.encoding.upper()} • {encoded.size / 1024:.0f} KB • "
+        f"encoded in {encoded.encode_time * 1000:.0f} ms"
+    )
+
+
+# Layer types that can be played with a sample library instead of synthesis
+_SAMPLED_LAYER_TYPES = [
+    layer_type for layer_type in LAYER_TYPES if not is_percussion_layer(layer_type)
+]
+
+
+def _sample_dir(layer_type: str) -> str:
+    """Sample folder entered in the UI for *layer_type* ("" if none)."""
+
+    if layer_type not in _SAMPLED_LAYER_TYPES:
+        return ""
+    return st.session_state.get(f"sample_dir_{layer_type}", "").strip()
+
+
+def _selected_sample_library(layer_type: str) -> Optional[SampleLibrary]:
+    """Return the sample library chosen in the UI for *layer_type*, if any."""
+
+    sample_dir = _sample_dir(layer_type)
+    if not sample_dir:
+        return None
+
+    try:
+        return get_sample_library(sample_dir)
+    except Exception as e:
+        st.warning(f"{layer_type} sample library unavailable, using synthesis: {e}")
+        return None
+
+
+def _selected_sample_libraries() -> Dict[str, SampleLibrary]:
+    """Sample libraries chosen in the UI, keyed by layer type."""
+
+    libraries = {}
+    for layer_type in _SAMPLED_LAYER_TYPES:
+        library = _selected_sample_library(layer_type)
+        if library is not None:
+            libraries[layer_type] = library
+    return libraries
+
+
+class _EncodedLayerPreview(NamedTuple):
+    """A finished layer preview, encoded once and kept without its audio."""
+
+    key: tuple  # Stem cache key of the rendered audio
+    encoding: str
+    audio: EncodedAudio
+
+
+def _layer_preview_settings(layer: dict) -> dict:
+    """Render settings of the audio preview of *layer*."""
+
+    return {
+        "layer_type": layer["type"],
+        "duration_limit": 15.0,  # Limit to 15 seconds for preview
+        "sample_library": _selected_sample_library(layer["type"]),
+    }
+
+
+def _start_layer_preview(layer: dict) -> ProgressivePreview:
+    """Start the (progressive) audio preview of *layer*."""
+
+    return start_progressive_preview(
+        layer["midi_data"], **_layer_preview_settings(layer)
+    )
+
+
+def _show_layer_preview(layer: dict) -> None:
+    """Show the preview of *layer*: its draft while rendering, then the full one.
+
+    The full render is encoded once when it finishes and only the encoded
+    payload stays in the session, so later reruns neither re-encode it nor
+    keep its audio buffer alive. A preview whose stem key no longer matches
+    the layer (e.g. its sample library changed) or whose encoding changed is
+    rendered again (usually straight from the stem cache).
+    """
+
+    state_key = f"audio_preview_{layer['id']}"
+    preview = st.session_state[state_key]
+    encoding = resolve_encoding(st.session_state.get("preview_encoding", "auto"))
+    settings = _layer_preview_settings(layer)
+    if preview.key != layer_preview_key(layer["midi_data"], **settings) or (
+        isinstance(preview, _EncodedLayerPreview) and preview.encoding != encoding
+    ):
+        preview = st.session_state[state_key] = start_progressive_preview(
+            layer["midi_data"], **settings
+        )
+
+    if isinstance(preview, ProgressivePreview):
+        if not preview.done():
+            _poll_progressive_preview(state_key)
+            return
+
+        if preview.full.exception() is not None:
+            st.error(f"Audio generation failed: {preview.full.exception()}")
+            return
+
+        preview = st.session_state[state_key] = _EncodedLayerPreview(
+            preview.key, encoding, encode_audio(*preview.full.result(), encoding)
+        )
+
+    _show_encoded_preview(preview.audio)
+
+
+@st.fragment(run_every=0.5)
+def _poll_progressive_preview(state_key: str) -> None:
+    """Play the draft preview and poll until the full render is ready."""
+
+    preview = st.session_state.get(state_key)
+    if not isinstance(preview, ProgressivePreview) or preview.done():
+        # Rerun the app so the full-quality render replaces the draft
+        st.rerun()
+
+    _show_encoded_preview(
+        preview.encoded_draft(st.session_state.get("preview_encoding", "auto"))
+    )
+    st.caption("⏳ Draft preview — rendering full quality...")
 
 
 def create_layer_interface() -> None:
@@ -82,53 +245,168 @@ def create_layer_interface() -> None:
     # Generate button
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
+        # Identical requests are shared across sessions unless a new take is wanted
+        fresh = st.checkbox(
+            "🎲 Fresh variation",
+            help="Always call the model instead of reusing an identical earlier "
+            "or in-flight generation",
+        )
         if st.button("🎼 Generate Layer", type="primary", use_container_width=True):
-            with st.spinner("🎵 Generating MIDI layer..."):
-                try:
-                    # Build prompt
-                    if custom_prompt.strip():
-                        prompt = custom_prompt.strip()
-                    else:
-                        # Get appropriate prompt from preset
-                        layer_key = (
-                            layer_type.split(" ", 1)[1].lower()
-                            if " " in layer_type
-                            else "bassline"
-                        )
-                        if layer_key in preset["prompts"]:
-                            prompt = random.choice(preset["prompts"][layer_key])
-                        else:
-                            prompt = random.choice(preset["prompts"]["bassline"])
-
-                    # Add creative controls to prompt
-                    control_additions = []
-                    for control_name, value in controls.items():
-                        if value != CREATIVE_CONTROLS[control_name]["default"]:
-                            control_additions.append(
-                                f"{control_name.split(' ', 1)[1].lower()}: {value.lower()}"
-                            )
+            # Generate MIDI in the background; the layer is added when it finishes
+            _job_runner().submit(
+                layer_type,
+                build_layer_prompt(
+                    selected_artist, layer_type, controls, custom_prompt
+                ),
+                {
+                    "layer_type": request_layer_type(layer_type),
+                    "existing_layers": get_active_layers(),
+                    "fresh": fresh,
+                },
+            )
 
-                    if control_additions:
-                        prompt += f" Style modifiers: {', '.join(control_additions)}."
-
-                    # Generate MIDI
-                    existing_layers = get_active_layers()
-                    title, midi_data = request_midi(
-                        prompt,
-                        layer_type=layer_type.split(" ", 1)[1].lower()
-                        if " " in layer_type
-                        else "bassline",
-                        existing_layers=existing_layers,
-                    )
+    # Full arrangement: independent layers in parallel, dependants as inputs land
+    with st.expander("🎼 Generate Full Arrangement"):
+        arrangement_types = st.multiselect(
+            "Layers:",
+            options=list(LAYER_TYPES.keys()),
+            default=[t for t in LAYER_TYPES if t != "🎛️ FX"],
+            help="Each layer is conditioned on the layers it depends on "
+            "(chords on bass, melody on chords, ...)",
+        )
+        if st.button(
+            "🚀 Generate Arrangement",
+            disabled=not arrangement_types,
+            use_container_width=True,
+        ):
+            try:
+                st.session_state.arrangement = Arrangement(
+                    _job_runner(),
+                    selected_artist,
+                    arrangement_types,
+                    controls,
+                    request_kwargs={"fresh": fresh},
+                ).start()
+            except ValueError as e:
+                st.error(f"❌ {e}")
+
+    _generation_jobs_panel()
+
+
+def _job_runner() -> JobRunner:
+    """Return the session's background generation job runner."""
+
+    if "job_runner" not in st.session_state:
+        st.session_state.job_runner = JobRunner()
+    return st.session_state.job_runner
+
+
+def _collect_generation_results() -> int:
+    """Add layers for finished generation jobs; returns how many were added."""
+
+    runner = _job_runner()
+    finished = runner.collect_finished()
+    for job in finished:
+        add_layer(job.layer_type, job.title, job.midi_data)
+        runner.forget(job.id)
+        st.toast(f"✅ Generated: {job.title}")
+    return len(finished)
+
+
+def _show_arrangement_report() -> None:
+    """Summarise the latest full-arrangement request and its timings."""
+
+    arrangement = st.session_state.get("arrangement")
+    if arrangement is None:
+        return
 
-                    # Add to session
-                    add_layer(layer_type, title, midi_data)
+    report = arrangement.report()
+    finished = sum(status == DONE for status in report["layers"].values())
+    st.caption(
+        f"🎼 Arrangement: {finished}/{len(report['layers'])} layers • "
+        f"wall {report['wall']:.0f}s • critical path {report['critical_path']:.0f}s "
+        f"vs {report['sequential']:.0f}s sequential"
+    )
 
-                    st.success(f"✅ Generated: **{title}**")
-                    st.rerun()
 
-                except Exception as e:
-                    st.error(f"❌ Generation failed: {str(e)}")
+def _show_generation_jobs() -> None:
+    """List queued, running and failed generation jobs with their controls."""
+
+    cache_stats = get_generation_cache().stats()
+    if cache_stats["hits"] or cache_stats["coalesced"] or cache_stats["generated"]:
+        st.caption(
+            f"♻️ Generation cache: {cache_stats['generated']} generated • "
+            f"{cache_stats['hits']} reused • {cache_stats['coalesced']} coalesced • "
+            f"{cache_stats['in_flight']} in flight"
+        )
+    limiter_stats = get_rate_limiter().stats()
+    interactive, batch = limiter_stats[INTERACTIVE], limiter_stats[BATCH]
+    if (
+        interactive["granted"]
+        or batch["granted"]
+        or interactive["queued"]
+        or batch["queued"]
+    ):
+        st.caption(
+            f"🚦 Rate limiter: {interactive['queued']} interactive / "
+            f"{batch['queued']} batch queued • mean wait "
+            f"{interactive['mean_wait']:.1f}s / {batch['mean_wait']:.1f}s"
+        )
+    _show_arrangement_report()
+    runner = _job_runner()
+    for job in runner.jobs():
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            if job.status == QUEUED:
+                st.caption(f"⏳ {job.layer_type} — queued")
+            elif job.status == RUNNING:
+                st.caption(
+                    f"🎼 {job.layer_type} — generating for {job.elapsed:.0f}s • "
+                    f"{len(job.partial_notes)} notes so far"
+                )
+            elif job.status == FAILED:
+                st.error(f"❌ {job.layer_type} generation failed: {job.error}")
+            elif job.status == CANCELLED:
+                st.caption(f"🚫 {job.layer_type} — cancelled")
+
+        with col2:
+            if job.active:
+                st.button(
+                    "Cancel",
+                    key=f"cancel_job_{job.id}",
+                    on_click=runner.cancel,
+                    args=(job.id,),
+                    use_container_width=True,
+                )
+            elif job.status in (FAILED, CANCELLED):
+                st.button(
+                    "Dismiss",
+                    key=f"dismiss_job_{job.id}",
+                    on_click=runner.forget,
+                    args=(job.id,),
+                    use_container_width=True,
+                )
+
+
+def _generation_jobs_panel() -> None:
+    """Show background generation jobs, polling while any are still active."""
+
+    _collect_generation_results()
+    if _job_runner().has_active():
+        _poll_generation_jobs()
+    else:
+        _show_generation_jobs()
+
+
+@st.fragment(run_every=1.0)
+def _poll_generation_jobs() -> None:
+    """Refresh job progress and add finished layers to the session."""
+
+    if _collect_generation_results() or not _job_runner().has_active():
+        # Rerun the app so new layers show up everywhere
+        st.rerun()
+
+    _show_generation_jobs()
 
 
 def layer_analysis_interface() -> None:
@@ -147,20 +425,17 @@ def layer_analysis_interface() -> None:
 
     with col1:
         if st.button("🔇 Mute All", use_container_width=True):
-            for layer in st.session_state.layers:
-                layer["muted"] = True
+            set_all_layers_muted(True)
             st.rerun()
 
     with col2:
         if st.button("🔊 Unmute All", use_container_width=True):
-            for layer in st.session_state.layers:
-                layer["muted"] = False
+            set_all_layers_muted(False)
             st.rerun()
 
     with col3:
         if st.button("🎯 Clear Solo", use_container_width=True):
-            for layer in st.session_state.layers:
-                layer["solo"] = False
+            clear_solo()
             st.rerun()
 
     with col4:
@@ -177,6 +452,31 @@ def layer_analysis_interface() -> None:
     st.subheader("📋 Active Layers")
 
     for layer in st.session_state.layers:
+        _layer_row(layer["id"])
+
+
+def _toggle_analysis(layer_id: int) -> None:
+    """Show or hide the detailed analysis below a layer row."""
+
+    key = f"show_analysis_{layer_id}"
+    st.session_state[key] = not st.session_state.get(key, False)
+
+
+@st.fragment
+def _layer_row(layer_id: int) -> None:
+    """One layer row; its own controls only rerun this fragment.
+
+    Analysis and preview clicks rerun just the row. Mute, solo and delete
+    change what the mix export, statistics, plots and sidebar show, so they
+    rerun the whole app: Streamlit can only rerun the current fragment or
+    the whole script, not a chosen set of other fragments.
+    """
+
+    layer = get_layer_store().get(layer_id)
+    if layer is None:
+        return
+
+    with run_timer(f"Layer row {layer_id}"):
         with st.container():
             col1, col2, col3, col4, col5, col6, col7 = st.columns(
                 [2.5, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8]
@@ -185,7 +485,9 @@ def layer_analysis_interface() -> None:
             with col1:
                 # Layer info with color indicator
                 layer_color = LAYER_TYPES.get(layer["type"], {}).get("color", "#888888")
-                status_icon = "🔇" if layer["muted"] else ("🎯" if layer["solo"] else "🔊")
+                status_icon = (
+                    "🔇" if layer["muted"] else ("🎯" if layer["solo"] else "🔊")
+                )
 
                 st.markdown(
                     f"""
@@ -224,11 +526,10 @@ def layer_analysis_interface() -> None:
                     st.rerun()
 
             with col4:
-                # Download individual layer
-                midi_bytes = midi_to_bytes(layer["midi_data"])
+                # Download individual layer (encoded once per layer content)
                 st.download_button(
                     "💾",
-                    data=midi_bytes,
+                    data=layer_midi_bytes(layer, on_encode=count_midi_encode),
                     file_name=f"{layer['title']}.mid",
                     mime="audio/midi",
                     key=f"download_{layer['id']}",
@@ -238,16 +539,14 @@ def layer_analysis_interface() -> None:
 
             with col5:
                 # Show analysis
-                if st.button(
+                st.button(
                     "📊",
                     key=f"analyze_{layer['id']}",
                     help="Show analysis",
                     use_container_width=True,
-                ):
-                    st.session_state[
-                        f'show_analysis_{layer["id"]}'
-                    ] = not st.session_state.get(f'show_analysis_{layer["id"]}', False)
-                    st.rerun()
+                    on_click=_toggle_analysis,
+                    args=(layer["id"],),
+                )
 
             with col6:
                 # Audio preview
@@ -257,16 +556,13 @@ def layer_analysis_interface() -> None:
                     help="Preview audio",
                     use_container_width=True,
                 ):
-                    with st.spinner("🎵 Generating audio..."):
-                        try:
-                            audio_bytes = create_layer_preview(
-                                layer["midi_data"],
-                                layer_type=layer["type"],
-                                duration_limit=15.0,  # Limit to 15 seconds for preview
-                            )
-                            st.audio(audio_bytes, format="audio/wav")
-                        except Exception as e:
-                            st.error(f"Audio generation failed: {e}")
+                    try:
+                        # Draft plays immediately, full quality swaps in when ready
+                        st.session_state[f'audio_preview_{layer["id"]}'] = (
+                            _start_layer_preview(layer)
+                        )
+                    except Exception as e:
+                        st.error(f"Audio generation failed: {e}")
 
             with col7:
                 if st.button(
@@ -278,6 +574,10 @@ def layer_analysis_interface() -> None:
                     remove_layer(layer["id"])
                     st.rerun()
 
+            # Show the audio preview if one was requested
+            if f'audio_preview_{layer["id"]}' in st.session_state:
+                _show_layer_preview(layer)
+
             # Show detailed analysis if requested
             if st.session_state.get(f'show_analysis_{layer["id"]}', False):
                 st.markdown("---")
@@ -295,91 +595,250 @@ def layer_analysis_interface() -> None:
                     st.metric("Pitch Range", f"{analysis['pitch_range']:.1f}")
 
                 # Individual layer plot
-                fig = plot_single_layer_analysis(layer)
-                st.pyplot(fig)
+                st.image(
+                    render_plot_png(plot_single_layer_analysis, layer),
+                    use_container_width=True,
+                )
 
             st.markdown("---")
 
 
-def mix_export_interface() -> None:
-    """Interface for mixing and exporting the complete track."""
+@st.fragment
+def _visualization_panel() -> None:
+    """Visualization selector and plot; reruns alone when its widgets change."""
+
+    with run_timer("Visualization"):
+        # Visualization options
+        viz_option = st.selectbox(
+            "📊 Visualization:",
+            [
+                "Layer Overview",
+                "Interactive Piano Roll",
+                "Velocity Heatmap",
+                "Waveform Overview",
+                "None",
+            ],
+            index=0,
+        )
 
-    if not st.session_state.layers:
-        return
+        if viz_option != "None":
+            active_layers = get_active_layers()
+
+            if viz_option == "Layer Overview":
+                if active_layers:
+                    song_beats = max(
+                        (
+                            note[1] + note[2]
+                            for layer in active_layers
+                            for note in layer["midi_data"]
+                        ),
+                        default=0.0,
+                    )
+                    view_start, view_end = 0.0, max(
+                        16.0, float(np.ceil(song_beats)) + 1
+                    )
+                    if song_beats > 16:
+                        # Scroll through long arrangements; zoomed-out views use density cells
+                        view_start, view_end = st.slider(
+                            "View (beats):",
+                            min_value=0.0,
+                            max_value=view_end,
+                            value=(0.0, view_end),
+                            step=1.0,
+                        )
+                    st.image(
+                        render_plot_png(
+                            plot_midi_layers,
+                            active_layers,
+                            width=14,
+                            height=8,
+                            start=view_start,
+                            end=view_end,
+                        ),
+                        use_container_width=True,
+                    )
+                else:
+                    st.info("🔇 All layers are muted")
+
+            elif viz_option == "Interactive Piano Roll":
+                if active_layers:
+                    # Drawn in the browser: drag to pan, scroll to zoom
+                    st.vega_lite_chart(
+                        piano_roll_vega_lite_spec(active_layers),
+                        use_container_width=True,
+                    )
+                else:
+                    st.info("🔇 All layers are muted")
+
+            elif viz_option == "Velocity Heatmap":
+                if active_layers:
+                    st.image(
+                        render_plot_png(
+                            create_velocity_heatmap, active_layers, width=14, height=6
+                        ),
+                        use_container_width=True,
+                    )
+                else:
+                    st.info("🔇 All layers are muted")
+
+            elif viz_option == "Waveform Overview":
+                if active_layers:
+                    # Peak pyramids of the full-length layers, built once and cached
+                    overviews = [
+                        (
+                            layer,
+                            get_layer_waveform(
+                                layer["midi_data"],
+                                layer["type"],
+                                sample_library=_selected_sample_library(layer["type"]),
+                            ),
+                        )
+                        for layer in active_layers
+                    ]
+                    max_duration = max(pyramid.duration for _, pyramid in overviews)
+                    if max_duration <= 0:
+                        st.info("🔇 The active layers have no audio to draw")
+                    else:
+                        view_start, view_end = st.slider(
+                            "Zoom (seconds):",
+                            min_value=0.0,
+                            max_value=float(max_duration),
+                            value=(0.0, float(max_duration)),
+                            step=0.1,
+                        )
+                        # Pyramids follow from the layer content and sample libraries
+                        st.image(
+                            render_plot_png(
+                                plot_waveform_overview,
+                                overviews,
+                                extra_key=tuple(
+                                    _sample_dir(layer_type)
+                                    for layer_type in _SAMPLED_LAYER_TYPES
+                                ),
+                                width=14,
+                                height=max(3, 1.5 * len(overviews)),
+                                start=view_start,
+                                end=view_end,
+                            ),
+                            use_container_width=True,
+                        )
+                else:
+                    st.info("🔇 All layers are muted")
 
-    st.header("🎚️ Mix & Export")
 
-    # Visualization options
-    viz_option = st.selectbox(
-        "📊 Visualization:", ["Layer Overview", "Velocity Heatmap", "None"], index=0
+def _preview_settings() -> None:
+    """Preview encoding and sample libraries.
+
+    Kept outside the fragments: layer previews, waveforms and mixes all
+    depend on these, so changing them reruns the whole app.
+    """
+
+    # Audio Preview Section
+    st.subheader("🔊 Audio Preview")
+
+    st.selectbox(
+        "Preview Encoding:",
+        options=["auto"] + list(PREVIEW_ENCODINGS.keys()),
+        key="preview_encoding",
+        help="Audio format sent to the browser; auto picks the smallest one "
+        "every browser plays",
     )
 
-    if viz_option != "None":
-        active_layers = get_active_layers()
+    # One folder per layer type, e.g. bass one-shots for basslines only
+    with st.expander("🎚️ Sample Libraries (optional)"):
+        for layer_type in _SAMPLED_LAYER_TYPES:
+            st.text_input(
+                f"{layer_type} samples folder:",
+                key=f"sample_dir_{layer_type}",
+                help="Folder of WAV/FLAC one-shots named by root note (e.g. "
+                "bass_C2.wav); layers of this type are played with these "
+                "samples instead of synthesis",
+            )
 
-        if viz_option == "Layer Overview":
-            if active_layers:
-                fig = plot_midi_layers(active_layers, width=14, height=8)
-                st.pyplot(fig)
-            else:
-                st.info("🔇 All layers are muted")
 
-        elif viz_option == "Velocity Heatmap":
+@st.fragment
+def _mix_preview_panel() -> None:
+    """Mix audio preview controls; reruns alone when its widgets change."""
+
+    with run_timer("Mix preview"):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Preview mix of active layers
+            active_layers = get_active_layers()
             if active_layers:
-                fig = create_velocity_heatmap(active_layers, width=14, height=6)
-                st.pyplot(fig)
+                if st.button(
+                    "🎵 Preview Mix (Active Layers)",
+                    use_container_width=True,
+                    type="primary",
+                ):
+                    with st.spinner("🎵 Generating mix audio..."):
+                        try:
+                            audio, sample_rate = mix_layers_audio(
+                                active_layers,
+                                duration_limit=20.0,  # Limit to 20 seconds for mix preview
+                                sample_libraries=_selected_sample_libraries(),
+                            )
+                            _play_preview(audio, sample_rate)
+                            st.success(
+                                f"🎧 Playing mix of {len(active_layers)} active layers"
+                            )
+                        except Exception as e:
+                            st.error(f"Mix audio generation failed: {e}")
             else:
-                st.info("🔇 All layers are muted")
+                st.info("🔇 No active layers to preview")
 
-    # Audio Preview Section
-    st.subheader("🔊 Audio Preview")
+        with col2:
+            # Preview all layers
+            if st.session_state.layers:
+                if st.button("🎼 Preview All Layers", use_container_width=True):
+                    with st.spinner("🎵 Generating full mix audio..."):
+                        try:
+                            # Temporarily unmute all for full preview
+                            all_layers = [
+                                dict(layer, muted=False)
+                                for layer in st.session_state.layers
+                            ]
+                            audio, sample_rate = mix_layers_audio(
+                                all_layers,
+                                duration_limit=20.0,
+                                sample_libraries=_selected_sample_libraries(),
+                            )
+                            _play_preview(audio, sample_rate)
+                            st.success(
+                                f"🎧 Playing mix of all {len(st.session_state.layers)} layers"
+                            )
+                        except Exception as e:
+                            st.error(f"Full mix audio generation failed: {e}")
+
+        # Stem cache statistics
+        cache_stats = get_stem_cache_stats()
+        st.caption(
+            f"🗄️ Stem cache: {cache_stats['entries']} stems • "
+            f"{cache_stats['bytes'] / 1e6:.1f} / {cache_stats['max_bytes'] / 1e6:.0f} MB • "
+            f"{cache_stats['hits']} hits / {cache_stats['misses']} misses • "
+            f"{cache_stats['evictions']} evictions"
+        )
+        plot_stats = get_plot_cache_stats()
+        st.caption(
+            f"🖼️ Plot cache: {plot_stats['entries']} images • "
+            f"{plot_stats['bytes'] / 1e6:.1f} / {plot_stats['max_bytes'] / 1e6:.0f} MB • "
+            f"{plot_stats['hits']} hits / {plot_stats['misses']} misses"
+        )
 
-    col1, col2 = st.columns(2)
 
-    with col1:
-        # Preview mix of active layers
-        active_layers = get_active_layers()
-        if active_layers:
-            if st.button(
-                "🎵 Preview Mix (Active Layers)",
-                use_container_width=True,
-                type="primary",
-            ):
-                with st.spinner("🎵 Generating mix audio..."):
-                    try:
-                        audio_bytes = create_mix_preview(
-                            active_layers,
-                            duration_limit=20.0,  # Limit to 20 seconds for mix preview
-                        )
-                        st.audio(audio_bytes, format="audio/wav")
-                        st.success(
-                            f"🎧 Playing mix of {len(active_layers)} active layers"
-                        )
-                    except Exception as e:
-                        st.error(f"Mix audio generation failed: {e}")
-        else:
-            st.info("🔇 No active layers to preview")
+def mix_export_interface() -> None:
+    """Interface for mixing and exporting the complete track."""
 
-    with col2:
-        # Preview all layers
-        if st.session_state.layers:
-            if st.button("🎼 Preview All Layers", use_container_width=True):
-                with st.spinner("🎵 Generating full mix audio..."):
-                    try:
-                        # Temporarily unmute all for full preview
-                        all_layers = [
-                            dict(layer, muted=False)
-                            for layer in st.session_state.layers
-                        ]
-                        audio_bytes = create_mix_preview(
-                            all_layers, duration_limit=20.0
-                        )
-                        st.audio(audio_bytes, format="audio/wav")
-                        st.success(
-                            f"🎧 Playing mix of all {len(st.session_state.layers)} layers"
-                        )
-                    except Exception as e:
-                        st.error(f"Full mix audio generation failed: {e}")
+    if not st.session_state.layers:
+        return
+
+    st.header("🎚️ Mix & Export")
+
+    # Plots and audio previews rerun on their own when their widgets change
+    _visualization_panel()
+    _preview_settings()
+    _mix_preview_panel()
 
     # Export options
     st.subheader("💾 Export Options")
@@ -390,12 +849,9 @@ def mix_export_interface() -> None:
         # Export active layers
         active_layers = get_active_layers()
         if active_layers:
-            combined_midi = combine_midi_layers(active_layers)
-            combined_bytes = midi_to_bytes(combined_midi)
-
             st.download_button(
                 "🎼 Download Mix (Active Layers)",
-                data=combined_bytes,
+                data=combined_midi_bytes(active_layers, on_encode=count_midi_encode),
                 file_name="midi_mix.mid",
                 mime="audio/midi",
                 type="primary",
@@ -408,12 +864,11 @@ def mix_export_interface() -> None:
     with col2:
         # Export all layers
         if st.session_state.layers:
-            all_midi = combine_midi_layers(st.session_state.layers)
-            all_bytes = midi_to_bytes(all_midi)
-
             st.download_button(
                 "📁 Download All Layers",
-                data=all_bytes,
+                data=combined_midi_bytes(
+                    list(st.session_state.layers), on_encode=count_midi_encode
+                ),
                 file_name="midi_all_layers.mid",
                 mime="audio/midi",
                 use_container_width=True,
@@ -424,10 +879,9 @@ def mix_export_interface() -> None:
     if st.session_state.layers:
         st.subheader("📈 Mix Statistics")
 
-        total_layers = len(st.session_state.layers)
+        store = get_layer_store()
+        total_layers = len(store)
         active_layers = get_active_layers()
-        muted_layers = [l for l in st.session_state.layers if l["muted"]]
-        solo_layers = [l for l in st.session_state.layers if l["solo"]]
 
         col1, col2, col3, col4 = st.columns(4)
 
@@ -436,9 +890,9 @@ def mix_export_interface() -> None:
         with col2:
             st.metric("Active Layers", len(active_layers))
         with col3:
-            st.metric("Muted Layers", len(muted_layers))
+            st.metric("Muted Layers", store.muted_count)
         with col4:
-            st.metric("Solo Layers", len(solo_layers))
+            st.metric("Solo Layers", int(store.solo_id is not None))
 
         # Layer type breakdown
         layer_types = {}
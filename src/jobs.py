@@ -0,0 +1,238 @@
+"""Background MIDI generation jobs for the Streamlit app.
+
+Generation requests run on a thread pool shared by every session, so the
+page script never blocks on model latency and idle sessions hold no
+threads. Each session's `JobRunner` keeps its own jobs and limits how many
+of them run at once. The UI submits jobs, polls their status and partial
+notes, cancels them, and collects finished results.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .generation_cache import cached_stream_midi
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# Concurrent model requests per session; further jobs wait in the queue
+DEFAULT_MAX_WORKERS = 2
+
+# Worker threads shared by all sessions in the process
+SHARED_POOL_WORKERS = 8
+
+_job_ids = itertools.count(1)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    """Return the process-wide generation thread pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                SHARED_POOL_WORKERS, thread_name_prefix="generate"
+            )
+        return _executor
+
+
+@dataclass
+class GenerationJob:
+    """State of one layer generation request, updated by its worker thread."""
+
+    layer_type: str
+    prompt: str
+    id: int = field(default_factory=lambda: next(_job_ids))
+    status: str = QUEUED
+    title: Optional[str] = None
+    partial_notes: List[Tuple[str, float, float, int]] = field(default_factory=list)
+    midi_data: Optional[List[Tuple[str, float, float, int]]] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    collected: bool = False
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATES
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the job started running (or ran for, once finished)."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobRunner:
+    """Runs a session's generation jobs and keeps their state for polling.
+
+    At most *max_workers* of the runner's jobs run on the shared pool at a
+    time; the rest wait in the runner's own queue.
+
+    *generate* has the signature of `stream_midi` (the default goes through
+    the shared generation cache); it is called with the job's prompt and
+    request options (including ``fresh`` for the cached default) plus
+    ``on_notes`` and ``should_stop`` callbacks. Requests carry the runner's
+    *session* so the shared rate limiter can queue sessions fairly.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        generate: Callable[..., Tuple[str, list]] = cached_stream_midi,
+        session: Optional[str] = None,
+    ) -> None:
+        self._max_workers = max_workers
+        self._generate = generate
+        self.session = session or uuid.uuid4().hex
+        self._jobs: Dict[int, GenerationJob] = {}
+        self._futures: Dict[int, Future] = {}
+        self._callbacks: Dict[int, Optional[Callable[[GenerationJob], None]]] = {}
+        self._pending: Deque[Tuple[GenerationJob, dict]] = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        layer_type: str,
+        prompt: str,
+        request_kwargs: Optional[dict] = None,
+        on_finished: Optional[Callable[[GenerationJob], None]] = None,
+    ) -> GenerationJob:
+        """Queue a generation of a *layer_type* layer for *prompt*.
+
+        *request_kwargs* are passed on to *generate* (model, request layer
+        type, existing layers...). *on_finished* is called with the job once
+        it is done, failed or cancelled, from the thread that finished it.
+        """
+        job = GenerationJob(layer_type=layer_type, prompt=prompt)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._callbacks[job.id] = on_finished
+            self._pending.append(
+                (job, {"session": self.session, **(request_kwargs or {})})
+            )
+        self._dispatch()
+        return job
+
+    def _dispatch(self) -> None:
+        """Start queued jobs on the shared pool up to the runner's limit."""
+        with self._lock:
+            while self._pending and self._running < self._max_workers:
+                job, request_kwargs = self._pending.popleft()
+                self._running += 1
+                self._futures[job.id] = _shared_executor().submit(
+                    self._run_slot, job, request_kwargs
+                )
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._running -= 1
+        self._dispatch()
+
+    def _run_slot(self, job: GenerationJob, request_kwargs: dict) -> None:
+        try:
+            self._run(job, request_kwargs)
+        finally:
+            self._release_slot()
+
+    def _finish(self, job: GenerationJob, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        with self._lock:
+            callback = self._callbacks.pop(job.id, None)
+        if callback is not None:
+            callback(job)
+
+    def _run(self, job: GenerationJob, request_kwargs: dict) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+
+        def on_notes(notes: List[Tuple[str, float, float, int]]) -> None:
+            job.partial_notes = notes
+
+        try:
+            job.title, job.midi_data = self._generate(
+                job.prompt,
+                on_notes=on_notes,
+                should_stop=job.cancel_event.is_set,
+                **request_kwargs,
+            )
+            status = DONE
+        except InterruptedError:
+            status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            status = FAILED
+        self._finish(job, status)
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; returns False if it already finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            future = self._futures.get(job_id)
+            queued = [entry for entry in self._pending if entry[0] is job]
+            for entry in queued:
+                self._pending.remove(entry)
+        if job is None or not job.active:
+            return False
+
+        job.cancel_event.set()
+        if queued:
+            # Still in the runner's queue: it never reached the pool
+            self._finish(job, CANCELLED)
+        elif future is not None and future.cancel():
+            # Never started on the pool: finish it here and free its slot
+            self._finish(job, CANCELLED)
+            self._release_slot()
+        return True
+
+    def jobs(self) -> List[GenerationJob]:
+        """All jobs in submission order."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def has_active(self) -> bool:
+        return any(job.active for job in self.jobs())
+
+    def collect_finished(self) -> List[GenerationJob]:
+        """Return successful jobs not collected before, marking them collected."""
+        finished = []
+        for job in self.jobs():
+            if job.status == DONE and not job.collected:
+                job.collected = True
+                finished.append(job)
+        return finished
+
+    def forget(self, job_id: int) -> None:
+        """Drop a finished job from the list."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.active:
+                del self._jobs[job_id]
+                self._futures.pop(job_id, None)
+
+    def shutdown(self) -> None:
+        """Cancel every job of this runner (the shared pool keeps running)."""
+        for job in self.jobs():
+            self.cancel(job.id)
@@ -167,28 +167,44 @@ ARTIST_PRESETS = {
     },
 }
 
+# "depends_on" lists the layers a type is conditioned on when generating a
+# full arrangement (their notes are passed as existing layers)
 LAYER_TYPES = {
     "🎸 Bassline": {
         "description": "Foundation low-end groove",
         "icon": "🎸",
         "color": "#FF6B6B",
+        "depends_on": [],
     },
     "🎹 Melody": {
         "description": "Main melodic content",
         "icon": "🎹",
         "color": "#4ECDC4",
+        "depends_on": ["🎶 Chords"],
     },
     "🎶 Chords": {
         "description": "Harmonic progression",
         "icon": "🎶",
         "color": "#45B7D1",
+        "depends_on": ["🎸 Bassline"],
+    },
+    "🎺 Lead": {
+        "description": "Lead synth element",
+        "icon": "🎺",
+        "color": "#96CEB4",
+        "depends_on": ["🎹 Melody"],
+    },
+    "🥁 Drums": {
+        "description": "Rhythmic percussion",
+        "icon": "🥁",
+        "color": "#FECA57",
+        "depends_on": [],
     },
-    "🎺 Lead": {"description": "Lead synth element", "icon": "🎺", "color": "#96CEB4"},
-    "🥁 Drums": {"description": "Rhythmic percussion", "icon": "🥁", "color": "#FECA57"},
     "🎛️ FX": {
         "description": "Sound effects and textures",
         "icon": "🎛️",
         "color": "#FF9FF3",
+        "depends_on": ["🥁 Drums"],
     },
 }
 
@@ -0,0 +1,240 @@
+"""Binary project files shared by the CLI and the Streamlit app.
+
+A project file is a small JSON header followed by the notes of every layer
+as flat little-endian arrays::
+
+    b"MIDIGPT\\x01" | header length (uint32) | JSON header | padding | arrays
+
+The header holds each layer's metadata (type, title, mute/solo) and its
+slice of the note arrays, plus the pitch-name table the ``pitches`` array
+indexes into. Loading memory-maps the file and builds the note tuples
+straight from the arrays. Analysis and content hashes are recomputed from
+the notes, since the hashes key caches shared by every session and must
+never come from an edited or stale file.
+"""
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, List, Tuple, Union
+
+import numpy as np
+
+from .core import make_layer
+from .fileio import atomic_write
+
+PROJECT_MAGIC = b"MIDIGPT\x01"
+PROJECT_SUFFIX = ".midigpt"
+PROJECT_VERSION = 1
+
+# Note columns in file order; float64 first keeps every array aligned
+_COLUMNS: List[Tuple[str, str]] = [
+    ("starts", "<f8"),
+    ("durations", "<f8"),
+    ("pitches", "<u2"),
+    ("velocities", "u1"),
+]
+
+_HEADER_LENGTH = struct.Struct("<I")
+_ALIGNMENT = 8
+
+# Expected JSON types of each layer entry in the header
+_LAYER_FIELDS = {
+    "id": int,
+    "type": str,
+    "title": str,
+    "muted": bool,
+    "solo": bool,
+    "offset": int,
+    "count": int,
+}
+
+
+def _is_count(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _validate_header(header: Any) -> None:
+    """Raise ValueError unless *header* is a well-formed project header."""
+
+    if not isinstance(header, dict):
+        raise ValueError("Malformed project header")
+    if header.get("version") != PROJECT_VERSION:
+        raise ValueError(f"Unsupported project version: {header.get('version')}")
+    notes = header.get("notes")
+    pitch_names = header.get("pitch_names")
+    layers = header.get("layers")
+    if not _is_count(notes):
+        raise ValueError("Malformed project header: bad note count")
+    if not isinstance(pitch_names, list) or not all(
+        isinstance(name, str) for name in pitch_names
+    ):
+        raise ValueError("Malformed project header: bad pitch names")
+    if not isinstance(layers, list):
+        raise ValueError("Malformed project header: bad layer list")
+
+    seen_ids = set()
+    for index, entry in enumerate(layers):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Malformed project layer {index}")
+        for key, expected in _LAYER_FIELDS.items():
+            if key not in entry or not isinstance(entry[key], expected):
+                raise ValueError(f"Malformed project layer {index}: bad {key!r}")
+        if entry["id"] in seen_ids:
+            raise ValueError(f"Malformed project layer {index}: duplicate ID")
+        seen_ids.add(entry["id"])
+        if not _is_count(entry["offset"]) or not _is_count(entry["count"]):
+            raise ValueError(f"Malformed project layer {index}: bad note slice")
+        if entry["offset"] + entry["count"] > notes:
+            raise ValueError(f"Malformed project layer {index}: notes out of range")
+
+
+def project_to_bytes(layers: List[dict]) -> bytes:
+    """Serialise *layers* (layer dicts) to project file bytes."""
+
+    pitch_codes = {}
+    columns = {name: [] for name, _ in _COLUMNS}
+    header_layers = []
+    offset = 0
+    for layer in layers:
+        midi_data = layer["midi_data"]
+        for pitch, start, duration, velocity in midi_data:
+            columns["starts"].append(start)
+            columns["durations"].append(duration)
+            columns["pitches"].append(pitch_codes.setdefault(pitch, len(pitch_codes)))
+            columns["velocities"].append(velocity)
+
+        header_layers.append(
+            {
+                "id": layer["id"],
+                "type": layer["type"],
+                "title": layer["title"],
+                "muted": layer["muted"],
+                "solo": layer["solo"],
+                "offset": offset,
+                "count": len(midi_data),
+            }
+        )
+        offset += len(midi_data)
+
+    arrays = [np.asarray(columns[name], dtype=dtype) for name, dtype in _COLUMNS]
+    header = json.dumps(
+        {
+            "version": PROJECT_VERSION,
+            "notes": offset,
+            "pitch_names": list(pitch_codes),
+            "layers": header_layers,
+        }
+    ).encode("utf-8")
+
+    prefix_length = len(PROJECT_MAGIC) + _HEADER_LENGTH.size + len(header)
+    padding = b"\0" * (-prefix_length % _ALIGNMENT)
+    return b"".join(
+        [PROJECT_MAGIC, _HEADER_LENGTH.pack(len(header)), header, padding]
+        + [array.tobytes() for array in arrays]
+    )
+
+
+def project_from_bytes(buffer: Union[bytes, memoryview, mmap.mmap]) -> List[dict]:
+    """Return the layer dicts stored in project file bytes (or a mapped file).
+
+    Raises ValueError if *buffer* is not a project file or is truncated or
+    malformed.
+    """
+
+    if bytes(buffer[: len(PROJECT_MAGIC)]) != PROJECT_MAGIC:
+        raise ValueError("Not a MidiGPT project file")
+    header_start = len(PROJECT_MAGIC) + _HEADER_LENGTH.size
+    if len(buffer) < header_start:
+        raise ValueError("Truncated project file")
+    (header_length,) = _HEADER_LENGTH.unpack_from(buffer, len(PROJECT_MAGIC))
+    if len(buffer) < header_start + header_length:
+        raise ValueError("Truncated project file")
+    # JSON and UTF-8 decoding errors are ValueErrors too
+    header = json.loads(bytes(buffer[header_start : header_start + header_length]))
+    _validate_header(header)
+
+    # Zero-copy views of the note arrays. They must all be released before a
+    # mapped file can be closed, including when a later check fails.
+    count = header["notes"]
+    offset = header_start + header_length
+    offset += -offset % _ALIGNMENT
+    arrays = {}
+    try:
+        for name, dtype in _COLUMNS:
+            if len(buffer) < offset + count * np.dtype(dtype).itemsize:
+                raise ValueError("Truncated project file")
+            arrays[name] = np.frombuffer(
+                buffer, dtype=dtype, count=count, offset=offset
+            )
+            offset += arrays[name].nbytes
+
+        if count and int(arrays["pitches"].max()) >= len(header["pitch_names"]):
+            raise ValueError("Malformed project file: pitch out of range")
+        if len(header["pitch_names"]):
+            pitches = np.array(header["pitch_names"], dtype=object)[arrays["pitches"]]
+        else:
+            pitches = np.zeros(0, dtype=object)
+        notes = list(
+            zip(
+                pitches.tolist(),
+                arrays["starts"].tolist(),
+                arrays["durations"].tolist(),
+                arrays["velocities"].tolist(),
+            )
+        )
+    finally:
+        del arrays
+
+    return [
+        {
+            **make_layer(
+                entry["id"],
+                entry["type"],
+                entry["title"],
+                notes[entry["offset"] : entry["offset"] + entry["count"]],
+            ),
+            "muted": entry["muted"],
+            "solo": entry["solo"],
+        }
+        for entry in header["layers"]
+    ]
+
+
+def save_project(path: Union[str, Path], layers: List[dict]) -> None:
+    """Write *layers* to a project file at *path*, replacing it atomically."""
+
+    data = project_to_bytes(layers)
+    with atomic_write(path) as f:
+        f.write(data)
+
+
+def load_project(path: Union[str, Path]) -> List[dict]:
+    """Read the layer dicts of the project file at *path* via a memory map."""
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Not a MidiGPT project file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return project_from_bytes(mapped)
+
+
+def append_to_project(
+    path: Union[str, Path],
+    layer_type: str,
+    title: str,
+    midi_data: List[Tuple[str, float, float, int]],
+) -> dict:
+    """Add a new layer to the project at *path* (created if missing)."""
+
+    layers = load_project(path) if Path(path).exists() else []
+    layer = make_layer(
+        max((existing["id"] for existing in layers), default=0) + 1,
+        layer_type,
+        title,
+        midi_data,
+    )
+    save_project(path, layers + [layer])
+    return layer
@@ -0,0 +1,232 @@
+"""Process-wide rate limiting and fair scheduling of OpenAI requests.
+
+Every model has a requests-per-minute and a tokens-per-minute token bucket.
+Callers wait in per-session FIFO queues inside two priority classes:
+interactive requests are always granted before batch ones, and sessions of
+the same class take turns, so one session submitting many requests cannot
+starve the others. Token costs are estimated up front and corrected with
+the reported usage once a response arrives.
+"""
+
+import collections
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+# Per-model budgets as (requests per minute, tokens per minute); models not
+# listed use the defaults, which can be overridden from the environment
+MODEL_RATE_LIMITS: Dict[str, Tuple[int, int]] = {}
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM_LIMIT", "60"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+
+# Tokens reserved for a response before its real usage is known
+COMPLETION_TOKEN_ESTIMATE = 4000
+
+# Waiters re-check for cancellation this often (seconds)
+_WAIT_POLL_SECONDS = 0.2
+
+# Recent waits kept per priority for the metrics
+WAIT_HISTORY = 100
+
+
+def estimate_tokens(messages: List[dict]) -> int:
+    """Rough token cost of a chat request (about four characters per token)."""
+    prompt_chars = sum(len(message["content"]) for message in messages)
+    return prompt_chars // 4 + COMPLETION_TOKEN_ESTIMATE
+
+
+class TokenBucket:
+    """Bucket holding up to *capacity* units, refilled at *capacity* per minute.
+
+    Not thread-safe on its own; `RateLimiter` guards its buckets.
+    """
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.capacity, self.level + (now - self._updated) * self.capacity / 60.0
+        )
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until *amount* units are available (0 if they are now)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60.0 / self.capacity)
+
+    def take(self, amount: float) -> None:
+        """Remove *amount* units; corrections may leave the bucket in debt."""
+        self._refill()
+        self.level -= amount
+
+
+@dataclass
+class _Ticket:
+    model: str
+    tokens: int
+    priority: str
+    session: Hashable
+    id: int
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class Grant:
+    """Permission for one request; pass it to `RateLimiter.settle` afterwards."""
+
+    model: str
+    tokens: int
+    wait: float
+
+
+class RateLimiter:
+    """Shared per-model request and token budgets with priority fair queueing."""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None) -> None:
+        self._limits = dict(MODEL_RATE_LIMITS if limits is None else limits)
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        # model -> priority -> session -> tickets; session order is the turn order
+        self._queues: Dict[str, Dict[str, "collections.OrderedDict"]] = {}
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._granted = {priority: 0 for priority in PRIORITIES}
+        self._waits: Dict[str, Deque[float]] = {
+            priority: collections.deque(maxlen=WAIT_HISTORY) for priority in PRIORITIES
+        }
+
+    def set_limits(
+        self, model: str, requests_per_minute: int, tokens_per_minute: int
+    ) -> None:
+        """Change the budgets of *model* (takes effect for new buckets)."""
+        with self._condition:
+            self._limits[model] = (requests_per_minute, tokens_per_minute)
+            self._buckets.pop(model, None)
+            self._condition.notify_all()
+
+    def _model_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            requests, tokens = self._limits.get(
+                model, (DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE)
+            )
+            self._buckets[model] = (TokenBucket(requests), TokenBucket(tokens))
+        return self._buckets[model]
+
+    def _model_queues(self, model: str) -> Dict[str, "collections.OrderedDict"]:
+        if model not in self._queues:
+            self._queues[model] = {
+                priority: collections.OrderedDict() for priority in PRIORITIES
+            }
+        return self._queues[model]
+
+    def _next_ticket(self, model: str) -> Optional[_Ticket]:
+        """Head ticket of the first waiting session in the highest priority."""
+        for sessions in self._model_queues(model).values():
+            for tickets in sessions.values():
+                return tickets[0]
+        return None
+
+    def _remove(self, ticket: _Ticket, rotate: bool) -> None:
+        sessions = self._model_queues(ticket.model)[ticket.priority]
+        tickets = sessions[ticket.session]
+        tickets.remove(ticket)
+        if not tickets:
+            del sessions[ticket.session]
+        elif rotate:
+            # The session had its turn; the other sessions go first next
+            sessions.move_to_end(ticket.session)
+
+    def acquire(
+        self,
+        model: str,
+        tokens: int,
+        priority: str = INTERACTIVE,
+        session: Hashable = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+    ) -> Grant:
+        """Block until a request of *tokens* for *model* may be sent.
+
+        Raises `InterruptedError` if *should_stop* returns True while waiting.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority!r}")
+
+        with self._condition:
+            ticket = _Ticket(model, tokens, priority, session, next(self._ids))
+            sessions = self._model_queues(model)[priority]
+            sessions.setdefault(session, collections.deque()).append(ticket)
+
+            while True:
+                if should_stop is not None and should_stop():
+                    self._remove(ticket, rotate=False)
+                    self._condition.notify_all()
+                    raise InterruptedError("Generation cancelled")
+
+                timeout = _WAIT_POLL_SECONDS
+                if self._next_ticket(model) is ticket:
+                    requests, token_bucket = self._model_buckets(model)
+                    delay = max(requests.delay(1), token_bucket.delay(tokens))
+                    if delay == 0:
+                        break
+                    timeout = min(timeout, delay)
+                self._condition.wait(timeout)
+
+            requests.take(1)
+            token_bucket.take(tokens)
+            self._remove(ticket, rotate=True)
+            wait = time.monotonic() - ticket.enqueued_at
+            self._granted[priority] += 1
+            self._waits[priority].append(wait)
+            self._condition.notify_all()
+        return Grant(model, tokens, wait)
+
+    def settle(self, grant: Grant, used_tokens: Optional[int]) -> None:
+        """Correct the token bucket with the usage reported for *grant*."""
+        if used_tokens is None:
+            return
+        with self._condition:
+            self._model_buckets(grant.model)[1].take(used_tokens - grant.tokens)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Queue depth and grant/wait metrics per priority class."""
+        with self._condition:
+            stats = {}
+            for priority in PRIORITIES:
+                depth = sum(
+                    len(tickets)
+                    for queues in self._queues.values()
+                    for tickets in queues[priority].values()
+                )
+                waits = list(self._waits[priority])
+                stats[priority] = {
+                    "queued": depth,
+                    "granted": self._granted[priority],
+                    "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+                    "max_wait": max(waits, default=0.0),
+                }
+            return stats
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter, creating it on first use."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
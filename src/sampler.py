@@ -0,0 +1,216 @@
+"""Memory-mapped sample library used as a sampler voice for audio previews."""
+
+import bisect
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from numpy.typing import DTypeLike
+import soundfile as sf
+
+from .fileio import atomic_write
+
+SAMPLE_EXTENSIONS = (".wav", ".flac")
+
+# Decoded samples are stored here as float32 .npy files so they can be memory
+# mapped; every process mapping the same file shares its pages without copies.
+DEFAULT_SAMPLE_CACHE_DIR = Path(
+    os.getenv("MIDIGPT_SAMPLE_CACHE", Path.home() / ".cache" / "midigpt" / "samples")
+)
+
+# Root notes come from note names ("bass_C#2.wav") or else MIDI numbers ("bass_37.wav")
+_NOTE_NAME_PATTERN = re.compile(r"(?<![A-Za-z])([A-G][#b]?)(-?[0-9])(?![0-9])")
+_MIDI_NUMBER_PATTERN = re.compile(r"(?<![0-9])([0-9]{2,3})(?![0-9])")
+_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+
+_RELEASE_SECONDS = 0.02
+
+
+class Sample(NamedTuple):
+    """A single mono sample and the MIDI note it was recorded at."""
+
+    root_note: int
+    sample_rate: int
+    data: np.ndarray
+
+
+def root_note_from_filename(filename: str) -> Optional[int]:
+    """Parse the root MIDI note from a sample file name, if it has one."""
+    stem = Path(filename).stem
+
+    note_matches = _NOTE_NAME_PATTERN.findall(stem)
+    if note_matches:
+        name, octave = note_matches[-1]
+        semitone = _SEMITONES[name[0]] + {"#": 1, "b": -1}.get(name[1:], 0)
+        return semitone + (int(octave) + 1) * 12
+
+    number_matches = _MIDI_NUMBER_PATTERN.findall(stem)
+    if number_matches and int(number_matches[-1]) <= 127:
+        return int(number_matches[-1])
+
+    return None
+
+
+def _sample_files(directory: Path) -> List[Path]:
+    """Sample files in *directory*, sorted by name."""
+    return [
+        path
+        for path in sorted(directory.iterdir())
+        if path.suffix.lower() in SAMPLE_EXTENSIONS
+    ]
+
+
+def library_fingerprint(directory: str) -> str:
+    """Digest of the names, sizes and mtimes of the sample files in *directory*.
+
+    It changes whenever a sample is added, removed, edited or replaced, so
+    it can key caches of audio rendered with the library.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in _sample_files(Path(directory)):
+        stat = path.stat()
+        digest.update(f"{path.name}|{stat.st_mtime_ns}|{stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+
+class SampleLibrary:
+    """A directory of multisampled WAV/FLAC one-shots mapped onto MIDI pitches.
+
+    Samples are decoded once into float32 ``.npy`` files under *cache_dir* and
+    then opened with ``np.load(mmap_mode="r")``, so loading a library is cheap
+    and the sample data is shared between sessions and worker processes.
+    *fingerprint* identifies the sample files the library was loaded from
+    (see `library_fingerprint`).
+    """
+
+    def __init__(self, directory: str, cache_dir: Optional[Path] = None) -> None:
+        self.directory = str(Path(directory).expanduser().resolve())
+        self.cache_dir = Path(cache_dir or DEFAULT_SAMPLE_CACHE_DIR)
+        self._samples: Dict[int, Sample] = {}
+        self._roots: List[int] = []
+        self.fingerprint = ""
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    @property
+    def root_notes(self) -> List[int]:
+        return list(self._roots)
+
+    def _cached_path(self, path: Path) -> Path:
+        """Return the decoded-sample cache path for *path* (keyed by mtime and size)."""
+        stat = path.stat()
+        digest = hashlib.blake2b(
+            f"{path}|{stat.st_mtime_ns}|{stat.st_size}".encode("utf-8"),
+            digest_size=16,
+        ).hexdigest()
+        return self.cache_dir / f"{digest}.npy"
+
+    def _map_sample(self, path: Path, root_note: int) -> Sample:
+        """Decode *path* into the cache if needed and memory-map it."""
+        cached = self._cached_path(path)
+        sample_rate = sf.info(str(path)).samplerate
+
+        if not cached.exists():
+            data, sample_rate = sf.read(str(path), dtype="float32", always_2d=True)
+            mono = np.ascontiguousarray(data.mean(axis=1), dtype=np.float32)
+
+            # Write atomically so concurrent workers never map a partial file
+            with atomic_write(cached) as f:
+                np.save(f, mono)
+
+        return Sample(root_note, sample_rate, np.load(cached, mmap_mode="r"))
+
+    def _load(self) -> None:
+        """Scan the library directory and map every recognised sample."""
+        directory = Path(self.directory)
+        if not directory.is_dir():
+            raise FileNotFoundError(f"Sample directory not found: {directory}")
+
+        # Taken before reading, so a file edited mid-load changes it again
+        self.fingerprint = library_fingerprint(self.directory)
+        for path in _sample_files(directory):
+            root_note = root_note_from_filename(path.name)
+            if root_note is None:
+                print(f"Warning: Skipping sample {path.name}: no root note in name")
+                continue
+            if root_note in self._samples:
+                continue
+
+            try:
+                self._samples[root_note] = self._map_sample(path, root_note)
+            except Exception as e:
+                print(f"Warning: Skipping sample {path.name}: {e}")
+
+        self._roots = sorted(self._samples)
+        if not self._roots:
+            raise ValueError(f"No usable samples found in {directory}")
+
+    def nearest(self, midi_note: int) -> Sample:
+        """Return the sample whose root note is closest to *midi_note*."""
+        index = bisect.bisect_left(self._roots, midi_note)
+        candidates = self._roots[max(0, index - 1) : index + 1]
+        root = min(candidates, key=lambda r: (abs(r - midi_note), r))
+        return self._samples[root]
+
+    def render_note(
+        self,
+        midi_note: int,
+        duration: float,
+        sample_rate: int = 22050,
+        velocity: int = 100,
+        dtype: DTypeLike = np.float32,
+    ) -> np.ndarray:
+        """Play the nearest sample at *midi_note*, resampled to *sample_rate*.
+
+        The note is held for *duration* seconds (or until the sample ends)
+        followed by a short release.
+        """
+        sample = self.nearest(midi_note)
+
+        # Source samples advanced per output sample
+        step = 2.0 ** ((midi_note - sample.root_note) / 12.0) * (
+            sample.sample_rate / sample_rate
+        )
+        available = int((len(sample.data) - 1) / step)
+        length = min(int((duration + _RELEASE_SECONDS) * sample_rate), available)
+        if length <= 0:
+            return np.zeros(0, dtype=dtype)
+
+        # Linear interpolation; fancy indexing only touches the mapped pages needed
+        positions = np.arange(length) * step
+        index = positions.astype(np.int64)
+        fraction = (positions - index).astype(dtype)
+        wave = sample.data[index + 1].astype(dtype)
+        wave -= sample.data[index]
+        wave *= fraction
+        wave += sample.data[index]
+
+        release = min(int(_RELEASE_SECONDS * sample_rate), length)
+        wave[length - release :] *= np.linspace(1.0, 0.0, release, dtype=dtype)
+
+        wave *= velocity / 127.0 * 0.3
+        return wave
+
+
+_libraries: Dict[str, SampleLibrary] = {}
+_libraries_lock = threading.Lock()
+
+
+def get_sample_library(directory: str) -> SampleLibrary:
+    """Return the shared `SampleLibrary` for *directory*, loading it on first use.
+
+    The library is reloaded when its sample files have changed since it was
+    loaded.
+    """
+    key = str(Path(directory).expanduser().resolve())
+    with _libraries_lock:
+        library = _libraries.get(key)
+        if library is None or library.fingerprint != library_fingerprint(key):
+            library = _libraries[key] = SampleLibrary(key)
+        return library
@@ -1,56 +1,417 @@
 """Session state management and layer operations for the MIDI generation app."""
 
 import random
+import re
 import string
-from typing import Dict, List, Tuple
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
 
 import streamlit as st
 
-from .core import analyze_midi_data
+from .core import make_layer
+
+# Undo history limits: steps kept, and approximate bytes of the notes that
+# only the history keeps alive (e.g. removed layers)
+HISTORY_DEPTH = 100
+HISTORY_MAX_BYTES = 64 * 1024 * 1024
+
+# Rough in-memory size of one note tuple and of one layer record
+_NOTE_BYTES = 200
+_RECORD_BYTES = 1024
+
+
+@dataclass(frozen=True)
+class _Change:
+    """One undoable step: the records it replaced and the records it set.
+
+    ``None`` stands for "no layer with this ID". Untouched layers are not
+    stored, so a step costs only the entries it changed.
+    """
+
+    label: str
+    before: Dict[int, Optional[dict]]
+    after: Dict[int, Optional[dict]]
+    nbytes: int
+
+
+class LayerStore:
+    """Ordered collection of layer dicts with id/type indexes and an active set.
+
+    Layers keep their dict shape so plotting, audio and export code can read
+    them as before, but every change must go through the store so the
+    indexes stay valid. ``version`` increases on every change and can be
+    used as a cache key for anything derived from the layers.
+
+    Layer records are never modified once stored: a change swaps in a
+    shallow copy, which shares the notes and analysis of the old record.
+    Undo/redo steps therefore only hold the records they changed, and the
+    history is capped at *history_depth* steps and *history_max_bytes*.
+    """
+
+    def __init__(
+        self,
+        history_depth: int = HISTORY_DEPTH,
+        history_max_bytes: int = HISTORY_MAX_BYTES,
+    ) -> None:
+        self._layers: Dict[int, dict] = {}  # Ordered by ID
+        self._by_type: Dict[str, Dict[int, None]] = {}
+        self._muted: Set[int] = set()
+        self._solo_id: Optional[int] = None
+        self._counter = 0
+        self._active: Optional[List[dict]] = None
+        self.version = 0
+        self.history_depth = history_depth
+        self.history_max_bytes = history_max_bytes
+        self._undo: Deque[_Change] = deque()
+        self._redo: List[_Change] = []
+        self._history_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._layers)
+
+    def __iter__(self) -> Iterator[dict]:
+        # Iterate over a snapshot so layers can be removed while looping
+        return iter(list(self._layers.values()))
+
+    def __contains__(self, layer_id: int) -> bool:
+        return layer_id in self._layers
+
+    def _changed(self) -> None:
+        self.version += 1
+        self._active = None
+
+    def _discard(self, layer_id: int) -> None:
+        layer = self._layers.pop(layer_id, None)
+        if layer is None:
+            return
+
+        type_ids = self._by_type[layer["type"]]
+        del type_ids[layer_id]
+        if not type_ids:
+            del self._by_type[layer["type"]]
+        self._muted.discard(layer_id)
+        if self._solo_id == layer_id:
+            self._solo_id = None
+
+    def _insert(self, layer: dict) -> None:
+        self._layers[layer["id"]] = layer
+        self._by_type.setdefault(layer["type"], {})[layer["id"]] = None
+        if layer["muted"]:
+            self._muted.add(layer["id"])
+        if layer["solo"]:
+            self._solo_id = layer["id"]
+
+    def _apply(self, records: Dict[int, Optional[dict]]) -> None:
+        """Set (or remove, for None) the layer records in *records*."""
+        last_id = max(self._layers, default=0)
+        reorder = False
+        for layer_id, layer in records.items():
+            self._discard(layer_id)
+            if layer is not None:
+                self._insert(layer)
+                reorder = reorder or layer_id < last_id
+
+        # Layers restored by undo go back to their original position
+        if reorder:
+            self._layers = dict(sorted(self._layers.items()))
+        self._counter = max(self._counter, max(self._layers, default=0))
+        self._changed()
+
+    @staticmethod
+    def _change_bytes(
+        before: Dict[int, Optional[dict]], after: Dict[int, Optional[dict]]
+    ) -> int:
+        """Approximate memory a history step keeps alive.
+
+        Notes shared by the old and new record (mute, solo...) are free; only
+        notes present on one side (added or removed layers) are counted.
+        """
+        notes_before = {
+            id(layer["midi_data"]): len(layer["midi_data"])
+            for layer in before.values()
+            if layer is not None
+        }
+        notes_after = {
+            id(layer["midi_data"]): len(layer["midi_data"])
+            for layer in after.values()
+            if layer is not None
+        }
+        unshared = sum(
+            count
+            for notes, other in (
+                (notes_before, notes_after),
+                (notes_after, notes_before),
+            )
+            for key, count in notes.items()
+            if key not in other
+        )
+        return unshared * _NOTE_BYTES + (len(before) + len(after)) * _RECORD_BYTES
+
+    def _commit(self, label: str, records: Dict[int, Optional[dict]]) -> None:
+        """Apply *records* as one undoable step (no-op if nothing changes)."""
+        before = {layer_id: self._layers.get(layer_id) for layer_id in records}
+        records = {
+            layer_id: layer
+            for layer_id, layer in records.items()
+            if layer is not before[layer_id]
+        }
+        if not records:
+            return
+
+        before = {layer_id: before[layer_id] for layer_id in records}
+        self._apply(records)
+
+        change = _Change(label, before, records, self._change_bytes(before, records))
+        self._history_bytes -= sum(redo.nbytes for redo in self._redo)
+        self._redo.clear()
+        self._undo.append(change)
+        self._history_bytes += change.nbytes
+        self._trim_history()
+
+    def _trim_history(self) -> None:
+        while self._undo and (
+            len(self._undo) > self.history_depth
+            or self._history_bytes > self.history_max_bytes
+        ):
+            self._history_bytes -= self._undo.popleft().nbytes
+
+    def get(self, layer_id: int) -> Optional[dict]:
+        """Return the layer with *layer_id*, if it exists."""
+        return self._layers.get(layer_id)
+
+    def add(
+        self,
+        layer_type: str,
+        title: str,
+        midi_data: List[Tuple[str, float, float, int]],
+    ) -> dict:
+        """Create a layer from generated notes and append it."""
+        self._counter += 1
+        layer = make_layer(self._counter, layer_type, title, midi_data)
+        self._commit(f"Add {title}", {layer["id"]: layer})
+        return layer
+
+    def replace(self, layers: List[dict]) -> None:
+        """Replace every layer with complete layer dicts (e.g. a loaded project).
+
+        Mute and solo flags are kept. The layers are renumbered after the
+        highest ID the store has used, so IDs (and any UI state keyed by
+        them) are never reused. Replacing is one undoable step.
+        """
+        records: Dict[int, Optional[dict]] = dict.fromkeys(self._layers)
+        for layer in layers:
+            self._counter += 1
+            records[self._counter] = {**layer, "id": self._counter}
+        self._commit("Load project", records)
+
+    def remove(self, layer_id: int) -> None:
+        """Remove a layer by ID (unknown IDs are ignored)."""
+        layer = self._layers.get(layer_id)
+        if layer is not None:
+            self._commit(f"Remove {layer['title']}", {layer_id: None})
+
+    def by_type(self, layer_type: str) -> List[dict]:
+        """Layers whose type equals *layer_type* or contains its name.
+
+        "🎸 Bassline" and "bassline" both match "🎸 Bassline" layers; only the
+        handful of distinct type names is scanned, not the layers.
+        """
+        type_key = layer_type.split(" ", 1)[1] if " " in layer_type else layer_type
+        type_key = type_key.lower()
+        ids = [
+            layer_id
+            for stored_type, type_ids in self._by_type.items()
+            if stored_type == layer_type or type_key in stored_type.lower()
+            for layer_id in type_ids
+        ]
+        return [self._layers[layer_id] for layer_id in sorted(ids)]
+
+    def set_muted(self, layer_id: int, muted: bool) -> None:
+        """Mute or unmute one layer."""
+        layer = self._layers.get(layer_id)
+        if layer is None or layer["muted"] == muted:
+            return
+
+        label = f"{'Mute' if muted else 'Unmute'} {layer['title']}"
+        self._commit(label, {layer_id: {**layer, "muted": muted}})
+
+    def set_all_muted(self, muted: bool) -> None:
+        """Mute or unmute every layer."""
+        self._commit(
+            "Mute all" if muted else "Unmute all",
+            {
+                layer_id: {**layer, "muted": muted}
+                for layer_id, layer in self._layers.items()
+                if layer["muted"] != muted
+            },
+        )
+
+    def set_solo(self, layer_id: Optional[int]) -> None:
+        """Solo *layer_id* (only one layer can be solo), or clear solo with None."""
+        if layer_id == self._solo_id or (
+            layer_id is not None and layer_id not in self._layers
+        ):
+            return
+
+        records = {}
+        if self._solo_id is not None:
+            records[self._solo_id] = {**self._layers[self._solo_id], "solo": False}
+        if layer_id is not None:
+            records[layer_id] = {**self._layers[layer_id], "solo": True}
+        label = (
+            "Clear solo"
+            if layer_id is None
+            else "Solo " + self._layers[layer_id]["title"]
+        )
+        self._commit(label, records)
+
+    @property
+    def solo_id(self) -> Optional[int]:
+        return self._solo_id
+
+    @property
+    def muted_count(self) -> int:
+        return len(self._muted)
+
+    def active(self) -> List[dict]:
+        """Layers that should be audible: the solo layer, else every unmuted one."""
+        if self._active is None:
+            if self._solo_id is not None:
+                self._active = [self._layers[self._solo_id]]
+            else:
+                self._active = [
+                    layer
+                    for layer_id, layer in self._layers.items()
+                    if layer_id not in self._muted
+                ]
+        return list(self._active)
+
+    def clear(self) -> None:
+        """Remove every layer (undoable; IDs are not reused)."""
+        self._commit("Clear all", dict.fromkeys(self._layers))
+
+    def undo(self) -> Optional[str]:
+        """Revert the last change; returns its label, or None if there is none."""
+        if not self._undo:
+            return None
+        change = self._undo.pop()
+        self._apply(change.before)
+        self._redo.append(change)
+        return change.label
+
+    def redo(self) -> Optional[str]:
+        """Re-apply the last undone change; returns its label, or None."""
+        if not self._redo:
+            return None
+        change = self._redo.pop()
+        self._apply(change.after)
+        self._undo.append(change)
+        return change.label
+
+    @property
+    def undo_label(self) -> Optional[str]:
+        return self._undo[-1].label if self._undo else None
+
+    @property
+    def redo_label(self) -> Optional[str]:
+        return self._redo[-1].label if self._redo else None
+
+    def history_stats(self) -> dict:
+        """Undo/redo step counts and the approximate bytes the history holds."""
+        return {
+            "undo_steps": len(self._undo),
+            "redo_steps": len(self._redo),
+            "bytes": self._history_bytes,
+            "max_bytes": self.history_max_bytes,
+        }
+
+
+# Number of recent script/fragment run times kept for display
+RUN_TIME_HISTORY = 20
+
+# Session-state keys of per-layer UI state, ending in the layer ID
+_LAYER_STATE_KEY = re.compile(r"(?:audio_preview|show_analysis)_([0-9]+)")
 
 
 def init_session_state() -> None:
     """Initialize Streamlit session state variables."""
     if "layers" not in st.session_state:
-        st.session_state.layers = []
-    if "layer_counter" not in st.session_state:
-        st.session_state.layer_counter = 0
+        st.session_state.layers = LayerStore()
+    if "run_times" not in st.session_state:
+        st.session_state.run_times = deque(maxlen=RUN_TIME_HISTORY)
+
+
+def record_run_time(scope: str, milliseconds: float, midi_encodes: int = 0) -> None:
+    """Append a script or fragment run time (and its MIDI encodes) to the history."""
+    run_times: Deque[Tuple[str, float, int]] = st.session_state.setdefault(
+        "run_times", deque(maxlen=RUN_TIME_HISTORY)
+    )
+    run_times.append((scope, milliseconds, midi_encodes))
+
+
+def count_midi_encode() -> None:
+    """Count one MIDI export encode for the session (pass as ``on_encode``)."""
+    st.session_state.midi_encodes = get_midi_encode_count() + 1
+
+
+def get_midi_encode_count() -> int:
+    """Number of MIDI export encodes this session has done so far."""
+    return st.session_state.get("midi_encodes", 0)
+
+
+@contextmanager
+def run_timer(scope: str) -> Iterator[None]:
+    """Record how long the enclosed part of a (fragment) run takes."""
+    start = time.perf_counter()
+    encodes = get_midi_encode_count()
+    try:
+        yield
+    finally:
+        record_run_time(
+            scope,
+            (time.perf_counter() - start) * 1000,
+            get_midi_encode_count() - encodes,
+        )
+
+
+def get_layer_store() -> LayerStore:
+    """Return the session's `LayerStore`."""
+    return st.session_state.layers
+
+
+def get_layers_version() -> int:
+    """Version counter of the session's layers, bumped on every change."""
+    return get_layer_store().version
 
 
 def add_layer(
     layer_type: str, title: str, midi_data: List[Tuple[str, float, float, int]]
 ) -> None:
     """Add a new MIDI layer to the session."""
-    st.session_state.layer_counter += 1
+    get_layer_store().add(layer_type, title, midi_data)
 
-    layer = {
-        "id": st.session_state.layer_counter,
-        "type": layer_type,
-        "title": title,
-        "midi_data": midi_data,
-        "analysis": analyze_midi_data(midi_data),
-        "muted": False,
-        "solo": False,
-    }
 
-    st.session_state.layers.append(layer)
+def _drop_removed_layer_state() -> None:
+    """Forget per-layer UI state (e.g. audio previews) of layers that are gone."""
+    store = get_layer_store()
+    for key in list(st.session_state):
+        match = _LAYER_STATE_KEY.fullmatch(str(key))
+        if match and int(match.group(1)) not in store:
+            del st.session_state[key]
 
 
 def remove_layer(layer_id: int) -> None:
     """Remove a layer by ID."""
-    st.session_state.layers = [
-        layer for layer in st.session_state.layers if layer["id"] != layer_id
-    ]
+    get_layer_store().remove(layer_id)
+    _drop_removed_layer_state()
 
 
 def get_layers_by_type(layer_type: str) -> List[dict]:
     """Get all layers of a specific type."""
-    type_key = layer_type.split(" ", 1)[1] if " " in layer_type else layer_type
-    return [
-        layer
-        for layer in st.session_state.layers
-        if layer["type"] == layer_type or (type_key.lower() in layer["type"].lower())
-    ]
+    return get_layer_store().by_type(layer_type)
 
 
 def generate_unique_id(length: int = 8) -> str:
@@ -60,32 +421,54 @@ def generate_unique_id(length: int = 8) -> str:
 
 def toggle_layer_mute(layer_id: int) -> None:
     """Toggle mute state for a layer."""
-    for layer in st.session_state.layers:
-        if layer["id"] == layer_id:
-            layer["muted"] = not layer["muted"]
-            break
+    store = get_layer_store()
+    layer = store.get(layer_id)
+    if layer is not None:
+        store.set_muted(layer_id, not layer["muted"])
+
+
+def set_all_layers_muted(muted: bool) -> None:
+    """Mute or unmute every layer."""
+    get_layer_store().set_all_muted(muted)
 
 
 def toggle_layer_solo(layer_id: int) -> None:
     """Toggle solo state for a layer."""
-    for layer in st.session_state.layers:
-        if layer["id"] == layer_id:
-            layer["solo"] = not layer["solo"]
-        else:
-            layer["solo"] = False  # Only one layer can be solo at a time
+    store = get_layer_store()
+    store.set_solo(None if store.solo_id == layer_id else layer_id)
+
+
+def clear_solo() -> None:
+    """Un-solo every layer."""
+    get_layer_store().set_solo(None)
 
 
 def get_active_layers() -> List[dict]:
     """Get layers that should be audible (not muted, or solo if any solo exists)."""
-    solo_layers = [layer for layer in st.session_state.layers if layer["solo"]]
-
-    if solo_layers:
-        return solo_layers
-    else:
-        return [layer for layer in st.session_state.layers if not layer["muted"]]
+    return get_layer_store().active()
 
 
 def clear_all_layers() -> None:
     """Clear all layers from the session."""
-    st.session_state.layers = []
-    st.session_state.layer_counter = 0
+    get_layer_store().clear()
+    _drop_removed_layer_state()
+
+
+def load_layers(layers: List[dict]) -> None:
+    """Replace the session's layers, e.g. with a loaded project."""
+    get_layer_store().replace(layers)
+    _drop_removed_layer_state()
+
+
+def undo_layers() -> Optional[str]:
+    """Undo the last layer change; returns its label, if any."""
+    label = get_layer_store().undo()
+    _drop_removed_layer_state()
+    return label
+
+
+def redo_layers() -> Optional[str]:
+    """Redo the last undone layer change; returns its label, if any."""
+    label = get_layer_store().redo()
+    _drop_removed_layer_state()
+    return label
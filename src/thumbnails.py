@@ -0,0 +1,117 @@
+"""Headless piano-roll thumbnails for MIDI files.
+
+Figures are built with the object-oriented API on an Agg canvas rather than
+through ``pyplot``, so rendering keeps no global figure state and is safe to
+run in worker processes and threads.
+"""
+
+import io
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy as np
+import pretty_midi
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+
+from .fileio import atomic_write
+from .presets import LAYER_TYPES
+
+# Output sizes in pixels (width, height)
+THUMBNAIL_SIZES: Dict[str, Tuple[int, int]] = {
+    "small": (160, 60),
+    "medium": (320, 120),
+    "large": (640, 240),
+}
+THUMBNAIL_DPI = 100
+
+NOTE_COLOR = LAYER_TYPES["🎸 Bassline"]["color"]
+DRUM_COLOR = LAYER_TYPES["🥁 Drums"]["color"]
+
+
+def _note_vertices(
+    starts: np.ndarray, ends: np.ndarray, pitches: np.ndarray
+) -> np.ndarray:
+    """Return (n, 4, 2) rectangle vertices for notes one semitone tall."""
+    bottoms = pitches - 0.4
+    tops = pitches + 0.4
+    return np.stack(
+        [
+            np.column_stack([starts, bottoms]),
+            np.column_stack([starts, tops]),
+            np.column_stack([ends, tops]),
+            np.column_stack([ends, bottoms]),
+        ],
+        axis=1,
+    )
+
+
+def render_thumbnail(
+    path: str,
+    width: int = 320,
+    height: int = 120,
+    dpi: int = THUMBNAIL_DPI,
+) -> bytes:
+    """Render a piano-roll thumbnail of the ``.mid`` file at *path* as PNG bytes.
+
+    Every instrument is drawn in one collection (drum tracks in their own
+    colour) with velocity mapped to opacity; the image has no axes or margins.
+    """
+    midi = pretty_midi.PrettyMIDI(str(path))
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+
+    pitch_min, pitch_max, end_time = 127, 0, 0.0
+    for instrument in midi.instruments:
+        if not instrument.notes:
+            continue
+
+        notes = np.array(
+            [(n.start, n.end, n.pitch, n.velocity) for n in instrument.notes],
+            dtype=float,
+        )
+        starts, ends, pitches, velocities = notes.T
+
+        colors = np.tile(
+            to_rgba(DRUM_COLOR if instrument.is_drum else NOTE_COLOR),
+            (len(notes), 1),
+        )
+        colors[:, 3] = np.minimum(1.0, velocities / 127.0 * 0.8 + 0.2)
+        ax.add_collection(
+            PolyCollection(
+                _note_vertices(starts, ends, pitches),
+                facecolors=colors,
+                linewidths=0,
+            )
+        )
+
+        pitch_min = min(pitch_min, int(pitches.min()))
+        pitch_max = max(pitch_max, int(pitches.max()))
+        end_time = max(end_time, float(ends.max()))
+
+    if end_time > 0:
+        ax.set_xlim(0, end_time)
+        ax.set_ylim(pitch_min - 1, pitch_max + 1)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
+
+
+def write_thumbnail(
+    source: Path,
+    target: Path,
+    width: int = 320,
+    height: int = 120,
+    dpi: int = THUMBNAIL_DPI,
+) -> None:
+    """Render *source* to a PNG at *target*, replacing it atomically."""
+    png = render_thumbnail(str(source), width, height, dpi)
+
+    with atomic_write(target) as f:
+        f.write(png)
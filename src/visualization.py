@@ -1,22 +1,213 @@
 """MIDI visualization and plotting utilities for the MIDI generation app."""
 
-from typing import List, Tuple
+import io
+from functools import lru_cache
+from typing import Any, Callable, Hashable, List, Optional, Tuple
 import warnings
 
 import matplotlib.pyplot as plt
+import numpy as np
 import streamlit as st
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba
 
+from .cache import MemoryBoundedCache
+from .core import layer_content_hash
 from .presets import LAYER_TYPES
+from .waveform import WaveformPyramid
 
 # Suppress font warnings
 warnings.filterwarnings("ignore", message="Glyph.*missing from current font")
 plt.rcParams["font.family"] = ["DejaVu Sans", "sans-serif"]
 
+# Note labels are only drawn when they fit inside their rectangles
+LABEL_MIN_NOTE_WIDTH_PX = 18
+LABEL_MIN_ROW_HEIGHT_PX = 8
+LABEL_MAX_COUNT = 300
+
+# Rendered PNGs keyed by layer content and plot parameters
+PLOT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+PLOT_DPI = 100
+_plot_cache = MemoryBoundedCache(PLOT_CACHE_MAX_BYTES)
+
+# Piano roll density cells are this many pixels wide when zoomed out
+LOD_CELL_PX = 2
+
+# Narrowest piano roll view; shorter (or empty) ranges are widened to this
+MIN_VIEW_BEATS = 1.0
+
+# Narrowest heatmap cell; longer songs switch to coarser time cells
+HEATMAP_MIN_CELL_PX = 4
+
+
+def figure_to_png(fig: plt.Figure, dpi: int = PLOT_DPI) -> bytes:
+    """Rasterise *fig* to PNG bytes and close it."""
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi)
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def _layer_key(layer: dict) -> Tuple:
+    """Cache key for everything the plots read from a layer."""
+    return (
+        layer_content_hash(layer),
+        layer["type"],
+        layer["title"],
+        layer["muted"],
+    )
+
+
+def _plot_data_key(data: Any) -> Tuple:
+    """Cache key for a layer, a list of layers or a list of (layer, ...) pairs."""
+    if isinstance(data, dict):
+        return _layer_key(data)
+    return tuple(
+        _layer_key(item if isinstance(item, dict) else item[0]) for item in data
+    )
+
+
+def render_plot_png(
+    plot_func: Callable[..., plt.Figure],
+    data: Any,
+    *,
+    extra_key: Hashable = (),
+    dpi: int = PLOT_DPI,
+    **kwargs: Any,
+) -> bytes:
+    """Return ``plot_func(data, **kwargs)`` as PNG bytes, drawing it only once.
+
+    *data* is a layer or a list of layers (or of ``(layer, ...)`` pairs, e.g.
+    for waveform overviews); the cache key is built from the layers' content
+    hashes, the keyword arguments and *extra_key*, which must cover any other
+    input the extra pair items depend on. Figures are always closed.
+    """
+    key = (
+        plot_func.__name__,
+        _plot_data_key(data),
+        tuple(sorted(kwargs.items())),
+        extra_key,
+        dpi,
+    )
+    return _plot_cache.get_or_create(
+        key, lambda: figure_to_png(plot_func(data, **kwargs), dpi)
+    )
+
+
+def get_plot_cache_stats() -> dict:
+    """Return usage statistics of the rendered plot cache."""
+    return _plot_cache.stats()
+
+
+def clear_plot_cache() -> None:
+    """Drop every cached plot image."""
+    _plot_cache.clear()
+
+
+def _note_arrays(
+    midi_data: List[Tuple[str, float, float, int]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return (starts, durations, MIDI pitches, velocities) arrays for *midi_data*."""
+    if not midi_data:
+        empty = np.zeros(0)
+        return empty, empty, empty, empty
+
+    names, starts, durations, velocities = zip(*midi_data)
+    pitches = np.fromiter(
+        (note_name_to_midi_number(name) for name in names), float, len(names)
+    )
+    return (
+        np.asarray(starts, dtype=float),
+        np.asarray(durations, dtype=float),
+        pitches,
+        np.asarray(velocities, dtype=float),
+    )
+
+
+def _note_collection(
+    starts: np.ndarray,
+    durations: np.ndarray,
+    bottoms: np.ndarray,
+    height: float,
+    color: str,
+    velocities: np.ndarray,
+) -> PolyCollection:
+    """Build one collection of note rectangles with velocity-based alpha."""
+    lefts = starts
+    rights = starts + durations
+    tops = bottoms + height
+    vertices = np.stack(
+        [
+            np.column_stack([lefts, bottoms]),
+            np.column_stack([lefts, tops]),
+            np.column_stack([rights, tops]),
+            np.column_stack([rights, bottoms]),
+        ],
+        axis=1,
+    )
+
+    # Alpha based on velocity, applied to faces and edges like a patch alpha
+    alphas = np.minimum(1.0, velocities / 127.0 * 0.8 + 0.2)
+    facecolors = np.tile(to_rgba(color), (len(starts), 1))
+    facecolors[:, 3] = alphas
+    edgecolors = np.zeros((len(starts), 4))
+    edgecolors[:, 3] = alphas
+
+    return PolyCollection(
+        vertices, facecolors=facecolors, edgecolors=edgecolors, linewidths=0.5
+    )
+
+
+def _draw_density_cells(
+    ax: plt.Axes,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    pitches: np.ndarray,
+    view: Tuple[float, float],
+    columns: int,
+    color: str,
+) -> None:
+    """Draw a layer as pitch/time occupancy cells instead of single notes."""
+    resolution = (view[1] - view[0]) / columns
+    notes, cells = _note_cells(starts, ends, view[0], resolution, columns)
+
+    density = np.zeros((128, columns))
+    rows = np.clip(pitches[notes].astype(np.int64), 0, 127)
+    np.add.at(density, (rows, cells), 1)
+
+    # Layer colour everywhere, opacity from how busy each cell is
+    image = np.zeros((128, columns, 4))
+    image[..., :3] = to_rgba(color)[:3]
+    occupied = density > 0
+    image[..., 3][occupied] = 0.3 + 0.7 * density[occupied] / density.max()
+
+    ax.imshow(
+        image,
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        extent=(view[0], view[1], -0.5, 127.5),
+    )
+
 
 def plot_midi_layers(
-    layers: List[dict], width: int = 12, height: int = 8
+    layers: List[dict],
+    width: int = 12,
+    height: int = 8,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    lod: str = "auto",
 ) -> plt.Figure:
-    """Create a comprehensive visualization of multiple MIDI layers."""
+    """Create a comprehensive visualization of multiple MIDI layers.
+
+    *start* and *end* restrict the view to a beat range (at least
+    `MIN_VIEW_BEATS` wide); only notes inside it are drawn. With
+    ``lod="auto"`` the layers are drawn as density cells once there are more
+    visible notes than pixel columns (``"notes"`` and ``"density"`` force
+    either mode).
+    """
 
     if not layers:
         fig, ax = plt.subplots(figsize=(width, height))
@@ -36,59 +227,68 @@ def plot_midi_layers(
 
     fig, ax = plt.subplots(figsize=(width, height))
 
-    # Track min/max values for better visualization
-    all_times = []
-    all_pitches = []
-
-    for i, layer in enumerate(layers):
-        if layer["muted"]:
-            continue
+    layer_notes = [
+        (i, layer, _note_arrays(layer["midi_data"]))
+        for i, layer in enumerate(layers)
+        if not layer["muted"] and layer["midi_data"]
+    ]
+
+    # Default view covers the whole arrangement with some padding
+    time_max = max((np.max(n[0] + n[1]) for _, _, n in layer_notes), default=15)
+    view = (
+        0.0 if start is None else start,
+        max(16, time_max + 1) if end is None else end,
+    )
+    if view[1] - view[0] < MIN_VIEW_BEATS:
+        view = (view[0], view[0] + MIN_VIEW_BEATS)
+
+    # Keep only the notes overlapping the view
+    visible = []
+    for i, layer, (starts, durations, pitches, velocities) in layer_notes:
+        mask = (starts < view[1]) & (starts + durations > view[0])
+        if mask.any():
+            visible.append(
+                (
+                    i,
+                    layer,
+                    starts[mask],
+                    durations[mask],
+                    pitches[mask],
+                    velocities[mask],
+                )
+            )
 
-        midi_data = layer["midi_data"]
-        layer_type = layer["type"]
+    axes_width_px = fig.get_figwidth() * fig.dpi * ax.get_position().width
+    columns = max(1, int(axes_width_px / LOD_CELL_PX))
+    visible_count = sum(len(v[2]) for v in visible)
+    use_density = lod == "density" or (lod == "auto" and visible_count > columns)
 
+    for i, layer, starts, durations, pitches, velocities in visible:
         # Get color for this layer type
-        layer_color = LAYER_TYPES.get(layer_type, {}).get("color", "#888888")
-
-        # Convert color from hex to matplotlib format
-        if layer_color.startswith("#"):
-            layer_color = layer_color
-
-        # Plot each note as a rectangle
-        for note_name, start, duration, velocity in midi_data:
-            # Convert note name to MIDI number for plotting
-            midi_note = note_name_to_midi_number(note_name)
-
-            # Create rectangle for note
-            rect_height = 0.8  # Height of note rectangle
-            rect_y = midi_note - rect_height / 2 + i * 0.1  # Slight offset per layer
-
-            # Alpha based on velocity
-            alpha = min(1.0, velocity / 127.0 * 0.8 + 0.2)
-
-            rect = plt.Rectangle(
-                (start, rect_y),
-                duration,
-                rect_height,
-                facecolor=layer_color,
-                alpha=alpha,
-                edgecolor="black",
-                linewidth=0.5,
+        layer_color = LAYER_TYPES.get(layer["type"], {}).get("color", "#888888")
+
+        if use_density:
+            _draw_density_cells(
+                ax, starts, starts + durations, pitches, view, columns, layer_color
             )
-            ax.add_patch(rect)
+            continue
 
-            all_times.extend([start, start + duration])
-            all_pitches.append(midi_note)
+        # One collection per layer instead of one patch per note
+        rect_height = 0.8  # Height of note rectangle
+        rect_y = pitches - rect_height / 2 + i * 0.1  # Slight offset per layer
+        ax.add_collection(
+            _note_collection(
+                starts, durations, rect_y, rect_height, layer_color, velocities
+            )
+        )
 
-    if all_times and all_pitches:
+    ax.set_xlim(*view)
+    if visible:
         # Set axis limits with some padding
-        time_min, time_max = min(all_times), max(all_times)
-        pitch_min, pitch_max = min(all_pitches), max(all_pitches)
-
-        ax.set_xlim(0, max(16, time_max + 1))
+        pitch_min = min(v[4].min() for v in visible)
+        pitch_max = max(v[4].max() for v in visible)
         ax.set_ylim(max(0, pitch_min - 5), min(127, pitch_max + 5))
     else:
-        ax.set_xlim(0, 16)
         ax.set_ylim(0, 127)
 
     # Customize the plot
@@ -125,6 +325,84 @@ def plot_midi_layers(
     return fig
 
 
+def piano_roll_records(layers: List[dict]) -> List[dict]:
+    """Flatten unmuted layers into compact per-note records for client-side charts.
+
+    Keys are kept to one letter because the records are shipped to the
+    browser on every rerun: layer title, layer type, note name, MIDI pitch,
+    start and end in beats and velocity.
+    """
+    records = []
+    for layer in layers:
+        if layer["muted"]:
+            continue
+        for note_name, start, duration, velocity in layer["midi_data"]:
+            records.append(
+                {
+                    "l": layer["title"],
+                    "t": layer["type"],
+                    "n": note_name,
+                    "p": note_name_to_midi_number(note_name),
+                    "s": round(start, 4),
+                    "e": round(start + duration, 4),
+                    "v": velocity,
+                }
+            )
+    return records
+
+
+def piano_roll_vega_lite_spec(layers: List[dict], height: int = 400) -> dict:
+    """Vega-Lite spec of an interactive piano roll (zoom and pan in the browser)."""
+    layer_types = list(dict.fromkeys(l["type"] for l in layers if not l["muted"]))
+    return {
+        "data": {"values": piano_roll_records(layers)},
+        "height": height,
+        "transform": [
+            {"calculate": "datum.p - 0.4", "as": "y"},
+            {"calculate": "datum.p + 0.4", "as": "y2"},
+        ],
+        "params": [{"name": "view", "select": "interval", "bind": "scales"}],
+        "mark": {"type": "rect", "stroke": "black", "strokeWidth": 0.5},
+        "encoding": {
+            "x": {"field": "s", "type": "quantitative", "title": "Time (beats)"},
+            "x2": {"field": "e"},
+            "y": {
+                "field": "y",
+                "type": "quantitative",
+                "title": "MIDI Note Number",
+                "scale": {"zero": False},
+            },
+            "y2": {"field": "y2"},
+            "color": {
+                "field": "t",
+                "type": "nominal",
+                "title": "Layer type",
+                "scale": {
+                    "domain": layer_types,
+                    "range": [
+                        LAYER_TYPES.get(t, {}).get("color", "#888888")
+                        for t in layer_types
+                    ],
+                },
+            },
+            "opacity": {
+                "field": "v",
+                "type": "quantitative",
+                "legend": None,
+                "scale": {"domain": [0, 127], "range": [0.2, 1.0]},
+            },
+            "tooltip": [
+                {"field": "l", "title": "Layer"},
+                {"field": "n", "title": "Note"},
+                {"field": "s", "title": "Start", "type": "quantitative"},
+                {"field": "e", "title": "End", "type": "quantitative"},
+                {"field": "v", "title": "Velocity", "type": "quantitative"},
+            ],
+        },
+    }
+
+
+@lru_cache(maxsize=None)
 def note_name_to_midi_number(note_name: str) -> int:
     """Convert note name (e.g., 'C4') to MIDI note number."""
     # Note mapping
@@ -171,38 +449,37 @@ def plot_single_layer_analysis(
     analysis = layer["analysis"]
 
     # Top plot: Note visualization
-    for note_name, start, duration, velocity in midi_data:
-        midi_note = note_name_to_midi_number(note_name)
-        alpha = min(1.0, velocity / 127.0 * 0.8 + 0.2)
-
-        rect = plt.Rectangle(
-            (start, midi_note - 0.4),
-            duration,
-            0.8,
-            facecolor="steelblue",
-            alpha=alpha,
-            edgecolor="black",
-            linewidth=0.5,
-        )
-        ax1.add_patch(rect)
-
-        # Add note labels
-        ax1.text(
-            start + duration / 2,
-            midi_note,
-            note_name,
-            ha="center",
-            va="center",
-            fontsize=8,
-            fontweight="bold",
-        )
+    starts, durations, pitches, velocities = _note_arrays(midi_data)
+    ax1.add_collection(
+        _note_collection(starts, durations, pitches - 0.4, 0.8, "steelblue", velocities)
+    )
 
     if midi_data:
-        all_notes = [note_name_to_midi_number(note[0]) for note in midi_data]
-        all_times = [note[1] + note[2] for note in midi_data]
-
-        ax1.set_xlim(0, max(all_times) + 1 if all_times else 16)
-        ax1.set_ylim(min(all_notes) - 2, max(all_notes) + 2)
+        x_max = float(np.max(starts + durations)) + 1
+        ax1.set_xlim(0, x_max)
+        ax1.set_ylim(pitches.min() - 2, pitches.max() + 2)
+
+        # Add note labels only where they are legible at this size
+        axes_width_px = fig.get_figwidth() * fig.dpi * ax1.get_position().width
+        axes_height_px = fig.get_figheight() * fig.dpi * ax1.get_position().height
+        px_per_beat = axes_width_px / x_max
+        px_per_semitone = axes_height_px / (pitches.max() - pitches.min() + 4)
+
+        if px_per_semitone >= LABEL_MIN_ROW_HEIGHT_PX:
+            wide_enough = np.flatnonzero(
+                durations * px_per_beat >= LABEL_MIN_NOTE_WIDTH_PX
+            )
+            if len(wide_enough) <= LABEL_MAX_COUNT:
+                for index in wide_enough:
+                    ax1.text(
+                        starts[index] + durations[index] / 2,
+                        pitches[index],
+                        midi_data[index][0],
+                        ha="center",
+                        va="center",
+                        fontsize=8,
+                        fontweight="bold",
+                    )
 
     ax1.set_ylabel("MIDI Note")
     ax1.set_title(f"{layer['title']} - {layer['type']}")
@@ -236,6 +513,64 @@ def plot_single_layer_analysis(
     return fig
 
 
+def _note_cells(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    origin: float,
+    resolution: float,
+    steps: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Expand notes into the time cells they cover.
+
+    Returns parallel (note index, cell index) arrays for the cells of width
+    *resolution* beats starting at *origin*; cells outside ``0..steps-1`` are
+    dropped.
+    """
+    start_steps = np.floor((starts - origin) / resolution).astype(np.int64)
+    end_steps = np.floor((ends - origin) / resolution).astype(np.int64)
+    start_steps = np.maximum(start_steps, 0)
+    end_steps = np.minimum(end_steps, steps - 1)
+    counts = np.maximum(end_steps - start_steps + 1, 0)
+
+    # Repeat each note once per covered cell and add its offset within the run
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (
+        np.repeat(np.arange(len(starts)), counts),
+        np.repeat(start_steps, counts) + offsets,
+    )
+
+
+def heatmap_time_resolution(max_time: float, width: float) -> float:
+    """Pick the finest heatmap cell size (in beats) that keeps cells legible.
+
+    Starts at a 16th note and doubles until the grid fits the plot width at
+    ``HEATMAP_MIN_CELL_PX`` pixels per cell.
+    """
+    max_columns = max(1, int(width * PLOT_DPI / HEATMAP_MIN_CELL_PX))
+    resolution = 0.25
+    while max_time / resolution > max_columns:
+        resolution *= 2
+    return resolution
+
+
+def _velocity_row(
+    midi_data: List[Tuple[str, float, float, int]],
+    time_resolution: float,
+    time_steps: int,
+) -> np.ndarray:
+    """Return the maximum velocity sounding in each time cell of a layer."""
+    row = np.zeros(time_steps)
+    if not midi_data:
+        return row
+
+    starts, durations, _, velocities = _note_arrays(midi_data)
+    notes, cells = _note_cells(
+        starts, starts + durations, 0.0, time_resolution, time_steps
+    )
+    np.maximum.at(row, cells, velocities[notes])
+    return row
+
+
 def create_velocity_heatmap(
     layers: List[dict], width: int = 12, height: int = 6
 ) -> plt.Figure:
@@ -258,20 +593,18 @@ def create_velocity_heatmap(
     fig, ax = plt.subplots(figsize=(width, height))
 
     # Create a grid for velocity visualization
-    time_resolution = 0.25  # Quarter beat resolution
-    max_time = 16  # 16 beats default
-
-    if layers:
-        layer_max_times = []
-        for layer in layers:
-            if layer["midi_data"]:
-                max_layer_time = max(note[1] + note[2] for note in layer["midi_data"])
-                layer_max_times.append(max_layer_time)
-        if layer_max_times:
-            max_time = max(max_time, max(layer_max_times) + 1)
-
-    time_steps = int(max_time / time_resolution)
-    velocity_grid = []
+    max_time = 16.0  # 16 beats default
+    layer_max_times = [
+        max(note[1] + note[2] for note in layer["midi_data"])
+        for layer in layers
+        if layer["midi_data"]
+    ]
+    if layer_max_times:
+        max_time = max(max_time, max(layer_max_times) + 1)
+
+    time_resolution = heatmap_time_resolution(max_time, width)
+    time_steps = int(np.ceil(max_time / time_resolution))
+    velocity_rows = []
     layer_names = []
 
     for layer in layers:
@@ -279,22 +612,13 @@ def create_velocity_heatmap(
             continue
 
         layer_names.append(f"{layer['title']}")
-        velocity_row = [0] * time_steps
-
-        for note_name, start, duration, velocity in layer["midi_data"]:
-            start_step = int(start / time_resolution)
-            end_step = int((start + duration) / time_resolution)
-
-            for step in range(start_step, min(end_step + 1, time_steps)):
-                velocity_row[step] = max(velocity_row[step], velocity)
-
-        velocity_grid.append(velocity_row)
-
-    if velocity_grid:
-        import numpy as np
+        velocity_rows.append(
+            _velocity_row(layer["midi_data"], time_resolution, time_steps)
+        )
 
-        # Create heatmap
-        heatmap_data = np.array(velocity_grid)
+    if velocity_rows:
+        # Create heatmap (x axis in beats, one row per layer)
+        heatmap_data = np.vstack(velocity_rows)
         im = ax.imshow(
             heatmap_data,
             cmap="YlOrRd",
@@ -302,19 +626,14 @@ def create_velocity_heatmap(
             vmin=0,
             vmax=127,
             interpolation="nearest",
+            extent=(0, time_steps * time_resolution, len(layer_names) - 0.5, -0.5),
         )
 
         # Set labels
         ax.set_yticks(range(len(layer_names)))
         ax.set_yticklabels(layer_names)
 
-        # Set x-axis to show time
-        x_ticks = range(0, time_steps, int(1 / time_resolution))  # Every beat
-        x_labels = [str(i) for i in range(0, max_time, 1)]
-        ax.set_xticks(x_ticks)
-        ax.set_xticklabels(x_labels)
-
-        ax.set_xlabel("Time (beats)")
+        ax.set_xlabel(f"Time (beats, {time_resolution:g}-beat cells)")
         ax.set_title("Layer Velocity Heatmap")
 
         # Add colorbar
@@ -323,3 +642,52 @@ def create_velocity_heatmap(
 
     plt.tight_layout()
     return fig
+
+
+def plot_waveform_overview(
+    overviews: List[Tuple[dict, WaveformPyramid]],
+    width: int = 12,
+    height: int = 6,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    max_points: int = 2000,
+) -> plt.Figure:
+    """Draw stacked waveform overviews from precomputed peak pyramids."""
+
+    if not overviews:
+        fig, ax = plt.subplots(figsize=(width, height))
+        ax.text(
+            0.5,
+            0.5,
+            "No waveforms to display",
+            horizontalalignment="center",
+            verticalalignment="center",
+            transform=ax.transAxes,
+            fontsize=16,
+            alpha=0.5,
+        )
+        return fig
+
+    fig, axes = plt.subplots(
+        len(overviews), 1, figsize=(width, height), sharex=True, squeeze=False
+    )
+    view_end = end if end is not None else max(p.duration for _, p in overviews)
+
+    for ax, (layer, pyramid) in zip(axes[:, 0], overviews):
+        layer_color = LAYER_TYPES.get(layer["type"], {}).get("color", "#888888")
+
+        # At most max_points buckets, whatever the track length or zoom
+        times, mins, maxs = pyramid.peaks(max_points, start, view_end)
+        ax.fill_between(times, mins, maxs, color=layer_color, linewidth=0)
+
+        ax.set_xlim(start, view_end)
+        ax.set_ylim(-1, 1)
+        ax.set_yticks([])
+        ax.set_ylabel(layer["title"], rotation=0, ha="right", va="center", fontsize=9)
+        ax.grid(True, alpha=0.3)
+
+    axes[-1, 0].set_xlabel("Time (seconds)")
+    axes[0, 0].set_title("Waveform Overview", fontsize=14, fontweight="bold")
+
+    plt.tight_layout()
+    return fig
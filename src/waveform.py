@@ -0,0 +1,104 @@
+"""Multi-resolution min/max peak pyramids for drawing waveform overviews."""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Samples summarised by each bucket of the finest pyramid level
+BASE_BLOCK_SIZE = 64
+
+
+class WaveformPyramid:
+    """DAW-style min/max peak pyramid of a mono audio buffer.
+
+    Level 0 stores the min and max of every ``BASE_BLOCK_SIZE`` samples and
+    each following level halves the resolution of the previous one, so the
+    whole pyramid costs about ``4 / BASE_BLOCK_SIZE`` of the float32 audio.
+    Any zoom range can then be drawn from a few thousand buckets without
+    touching the full-rate buffer.
+    """
+
+    def __init__(
+        self,
+        audio: np.ndarray,
+        sample_rate: int,
+        base_block_size: int = BASE_BLOCK_SIZE,
+    ) -> None:
+        self.length = len(audio)
+        self.sample_rate = sample_rate
+        self.base_block_size = base_block_size
+        self.levels: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        if not len(audio):
+            return
+
+        # Level 0: min/max over fixed-size blocks (pad the last block with edge values)
+        padding = -len(audio) % base_block_size
+        blocks = np.pad(audio, (0, padding), mode="edge").reshape(-1, base_block_size)
+        mins = blocks.min(axis=1).astype(np.float32)
+        maxs = blocks.max(axis=1).astype(np.float32)
+        self.levels.append((mins, maxs))
+
+        # Coarser levels: combine neighbouring bucket pairs
+        while len(mins) > 1:
+            if len(mins) % 2:
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+            mins = np.minimum(mins[0::2], mins[1::2])
+            maxs = np.maximum(maxs[0::2], maxs[1::2])
+            self.levels.append((mins, maxs))
+
+    @property
+    def duration(self) -> float:
+        return self.length / self.sample_rate
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the pyramid buckets."""
+        return sum(mins.nbytes + maxs.nbytes for mins, maxs in self.levels)
+
+    def block_size(self, level: int) -> int:
+        """Number of samples summarised by one bucket of *level*."""
+        return self.base_block_size * 2**level
+
+    def peaks(
+        self,
+        max_points: int = 2000,
+        start: float = 0.0,
+        end: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (times, mins, maxs) covering *start*..*end* seconds.
+
+        The finest level that fits in *max_points* buckets is used, so the
+        result never has more than *max_points* entries whatever the zoom
+        (views shorter than *max_points* level-0 buckets use level 0).
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        first = max(0, int(start * self.sample_rate))
+        last = max(first, int(end * self.sample_rate))
+        span = last - first
+
+        if span == 0 or not self.levels:
+            empty = np.zeros(0, dtype=np.float32)
+            return empty, empty, empty
+
+        # Count the partial buckets at both ends, or an unaligned *start*
+        # can return one bucket too many
+        for level in range(len(self.levels)):
+            block = self.block_size(level)
+            first_bucket = first // block
+            last_bucket = -(-last // block)
+            if last_bucket - first_bucket <= max_points:
+                break
+
+        mins, maxs = self.levels[level]
+        last_bucket = min(len(mins), last_bucket)
+        times = (
+            (np.arange(first_bucket, last_bucket) * block + block / 2)
+            / self.sample_rate
+        ).astype(np.float32)
+        return (
+            times,
+            mins[first_bucket:last_bucket],
+            maxs[first_bucket:last_bucket],
+        )
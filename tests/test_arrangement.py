@@ -0,0 +1,110 @@
+"""Tests for ordering and scheduling the layers of a full arrangement."""
+
+import pytest
+
+from src import arrangement
+from src.arrangement import SKIPPED, SUBMITTED, Arrangement, arrangement_order
+from src.jobs import DONE, FAILED, GenerationJob
+from src.ratelimit import BATCH
+
+ARTIST = "🔥 Chris Stussy"
+BASS, CHORDS, MELODY, DRUMS, FX = (
+    "🎸 Bassline",
+    "🎶 Chords",
+    "🎹 Melody",
+    "🥁 Drums",
+    "🎛️ FX",
+)
+NOTES = [("C2", 0.0, 1.0, 100)]
+
+
+class FakeRunner:
+    """Records submitted jobs; tests finish them by hand."""
+
+    def __init__(self) -> None:
+        self.submitted = {}
+
+    def submit(self, layer_type, prompt, request_kwargs=None, on_finished=None):
+        assert layer_type not in self.submitted, f"{layer_type} submitted twice"
+        job = GenerationJob(layer_type=layer_type, prompt=prompt)
+        self.submitted[layer_type] = (job, request_kwargs, on_finished)
+        return job
+
+    def finish(self, layer_type, status=DONE):
+        job, _, on_finished = self.submitted[layer_type]
+        job.status = status
+        job.midi_data = NOTES if status == DONE else None
+        on_finished(job)
+
+    def cancel(self, job_id):
+        return False
+
+
+def test_order_follows_dependencies_through_missing_layers():
+    graph = arrangement_order([MELODY, BASS, DRUMS, BASS])
+
+    # Chords are not selected, so the melody is conditioned on the bassline
+    assert graph == {MELODY: [BASS], BASS: [], DRUMS: []}
+
+
+@pytest.mark.parametrize(
+    "layer_types, selected",
+    [
+        ({"A": {"depends_on": ["B"]}, "B": {"depends_on": ["A"]}}, ["A", "B"]),
+        ({"A": {"depends_on": ["B"]}, "B": {"depends_on": ["A"]}}, ["A"]),
+        (
+            {
+                "A": {"depends_on": ["B"]},
+                "B": {"depends_on": ["C"]},
+                "C": {"depends_on": ["B"]},
+            },
+            ["A"],
+        ),
+    ],
+)
+def test_order_rejects_cycles(monkeypatch, layer_types, selected):
+    monkeypatch.setattr(arrangement, "LAYER_TYPES", layer_types)
+    with pytest.raises(ValueError, match="cycle"):
+        arrangement_order(selected)
+
+
+def test_layers_start_as_their_inputs_finish():
+    runner = FakeRunner()
+    song = Arrangement(runner, ARTIST, [BASS, CHORDS, MELODY, DRUMS]).start()
+    assert set(runner.submitted) == {BASS, DRUMS}
+
+    runner.finish(BASS)
+    assert set(runner.submitted) == {BASS, DRUMS, CHORDS}
+    _, request_kwargs, _ = runner.submitted[CHORDS]
+    assert request_kwargs["priority"] == BATCH
+    assert request_kwargs["layer_type"] == "chords"
+    assert [layer["type"] for layer in request_kwargs["existing_layers"]] == [BASS]
+
+    runner.finish(DRUMS)
+    runner.finish(CHORDS)
+    _, request_kwargs, _ = runner.submitted[MELODY]
+    assert [layer["type"] for layer in request_kwargs["existing_layers"]] == [
+        BASS,
+        CHORDS,
+    ]
+
+    assert not song.done
+    runner.finish(MELODY)
+    assert song.done
+    assert set(song.report()["layers"].values()) == {DONE}
+
+
+def test_failed_input_skips_its_dependants():
+    runner = FakeRunner()
+    song = Arrangement(runner, ARTIST, [BASS, CHORDS, MELODY, DRUMS, FX]).start()
+
+    runner.finish(BASS, FAILED)
+    assert song.status[CHORDS] == SKIPPED
+    assert song.status[MELODY] == SKIPPED  # Skipping cascades
+    assert song.status[DRUMS] == SUBMITTED
+    assert not song.done
+
+    runner.finish(DRUMS)
+    runner.finish(FX)
+    assert song.done
+    assert set(runner.submitted) == {BASS, DRUMS, FX}
@@ -0,0 +1,145 @@
+"""Tests for audio rendering and preview encoding."""
+
+import numpy as np
+import pytest
+
+from src import audio
+from src.audio import detect_loops, encode_audio, midi_data_to_audio, resolve_encoding
+
+SAMPLE_RATE = 22050
+
+# One bar whose last note rings 1.5 beats into the next bar
+BAR = [
+    ("C3", 0.0, 1.0, 100),
+    ("E3", 1.0, 0.5, 90),
+    ("G3", 2.0, 1.0, 110),
+    ("C4", 3.5, 1.5, 100),
+]
+
+
+def _repeat(pattern, times, jitter=0.0, velocity_offset=0):
+    """*pattern* repeated every bar; odd repeats shifted by *jitter* beats."""
+    return [
+        (
+            note,
+            start + 4.0 * bar + (jitter if bar % 2 else 0.0),
+            duration,
+            velocity + (velocity_offset if bar % 2 else 0),
+        )
+        for bar in range(times)
+        for note, start, duration, velocity in pattern
+    ]
+
+
+def _render_both(notes, bpm, **kwargs):
+    """Render *notes* loop-aware and directly; returns both buffers."""
+    tiled, _ = midi_data_to_audio(notes, "🎸 Bassline", bpm=bpm, **kwargs)
+    direct, _ = midi_data_to_audio(
+        notes, "🎸 Bassline", bpm=bpm, loop_aware=False, **kwargs
+    )
+    assert len(tiled) == len(direct)
+    return tiled, direct
+
+
+@pytest.mark.parametrize("bpm", [120.0, 97.3])
+def test_exact_repeats_render_like_direct_rendering(bpm):
+    # At 97.3 bpm a bar is 54375.13 samples, so repeats round onsets differently
+    notes = _repeat(BAR, 8)
+    plan = detect_loops(notes)
+    assert plan.has_repeats and len(plan.segments) == 1
+
+    tiled, direct = _render_both(notes, bpm)
+    np.testing.assert_allclose(tiled, direct, atol=1e-6)
+
+
+def test_notes_sustained_across_windows_render_like_direct_rendering():
+    # A whole note starting half a beat before each bar line, held for 6 beats
+    notes = _repeat(BAR[:3] + [("G2", 3.5, 6.0, 100)], 6)
+    assert detect_loops(notes).has_repeats
+
+    tiled, direct = _render_both(notes, 97.3)
+    np.testing.assert_allclose(tiled, direct, atol=1e-6)
+
+
+def test_near_exact_repeats_reuse_the_first_rendering():
+    notes = _repeat(BAR, 8, jitter=4e-4, velocity_offset=1)
+    assert len(detect_loops(notes).segments) == 1
+    assert len(detect_loops(notes, timing_tolerance=0.0).segments) > 1
+
+    tiled, direct = _render_both(notes, 97.3)
+    assert 0 < np.abs(tiled - direct).max() < 0.01
+
+    # Without tolerance every window is rendered as written
+    tiled, direct = _render_both(
+        notes, 97.3, loop_timing_tolerance=0.0, loop_velocity_tolerance=0
+    )
+    np.testing.assert_allclose(tiled, direct, atol=1e-6)
+
+
+def test_auto_encoding_is_playable_in_every_browser():
+    assert resolve_encoding("auto") in ("flac", "wav")
+
+
+def test_failed_encode_reports_the_wav_fallback(monkeypatch):
+    write_bytes = audio._write_bytes
+
+    def fail_ogg(samples, sample_rate, format, subtype):
+        if format == "OGG":
+            raise RuntimeError("no vorbis encoder")
+        return write_bytes(samples, sample_rate, format, subtype)
+
+    monkeypatch.setattr(audio, "_write_bytes", fail_ogg)
+    encoded = encode_audio(np.zeros(SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE, "ogg")
+
+    assert encoded.encoding == "wav"
+    assert encoded.mime == "audio/wav"
+    assert encoded.data[:4] == b"RIFF"
+
+
+def test_progressive_preview_encodes_its_draft_once(monkeypatch):
+    notes = [("C4", float(beat), 1.0, 100) for beat in range(4)]
+    preview = audio.ProgressivePreview(
+        audio.render_draft_preview(notes), audio.Future(), ("key",)
+    )
+    calls = []
+    encode = audio.encode_audio
+    monkeypatch.setattr(
+        audio, "encode_audio", lambda *args: calls.append(args) or encode(*args)
+    )
+
+    first = preview.encoded_draft("wav")
+    assert preview.encoded_draft("wav") is first
+    assert len(calls) == 1
+    assert preview.encoded_draft("flac").encoding == "flac"
+    assert len(calls) == 2
+
+
+def test_percussion_voices_for_pitches():
+    voice = audio.percussion_voice_for_pitch
+    assert voice(36) == "kick"  # GM kick
+    assert voice(42) == "closed_hat"  # GM closed hi-hat
+    assert voice(30) == "kick"  # Below the GM kit: by pitch range
+    assert voice(100) == "open_hat"
+    assert voice(36, "🎛️ FX") == "downlifter"  # FX layers ignore the GM map
+    assert voice(72, "🎛️ FX") == "riser"
+
+
+def test_drum_render_places_one_shots_at_each_hit():
+    bpm = 97.3
+    hits = [("C2", 0.0, 0.25, 127), ("D2", 1.0, 0.25, 64), ("F#2", 1.5, 0.1, 100)]
+    rendered, _ = midi_data_to_audio(hits, "🥁 Drums", SAMPLE_RATE, bpm)
+
+    one_shots = audio.percussion_one_shots(SAMPLE_RATE)
+    expected = np.zeros_like(rendered)
+    for voice, beat, velocity in [
+        ("kick", 0.0, 127),
+        ("snare", 1.0, 64),
+        ("closed_hat", 1.5, 100),
+    ]:
+        onset = int(beat * 60.0 / bpm * SAMPLE_RATE)
+        one_shot = one_shots[voice]
+        expected[onset : onset + len(one_shot)] += one_shot * (velocity / 127.0 * 0.3)
+    expected *= 0.8 / np.abs(expected).max()
+
+    np.testing.assert_allclose(rendered, expected, atol=1e-6)
+    assert not one_shots["kick"].flags.writeable  # Shared between renders
@@ -0,0 +1,29 @@
+"""Tests for atomic file writes."""
+
+import pytest
+
+from src.fileio import atomic_write
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / "nested" / "out.bin"
+    with atomic_write(path) as f:
+        f.write(b"first")
+    with atomic_write(path, "w", encoding="utf-8") as f:
+        f.write("second")
+
+    assert path.read_text(encoding="utf-8") == "second"
+    assert [p.name for p in path.parent.iterdir()] == ["out.bin"]
+
+
+def test_failed_write_keeps_old_file_and_removes_temp(tmp_path):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as f:
+            f.write(b"partial")
+            raise RuntimeError("disk full")
+
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.bin"]
@@ -0,0 +1,86 @@
+"""Tests for sharing and coalescing identical generations."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.generation_cache import GenerationCache
+
+NOTES = [("C2", 0.0, 1.0, 100)]
+
+
+class SlowGenerator:
+    """Counts calls and blocks every call until released."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt, should_stop=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        self.started.set()
+        assert self.release.wait(5)
+        return f"{prompt} #{call}", NOTES
+
+
+def test_concurrent_identical_requests_share_one_call():
+    cache = GenerationCache()
+    generate = SlowGenerator()
+
+    # Count callers entering the single-flight group
+    joined = threading.Semaphore(0)
+    do = cache._flights.do
+
+    def counting_do(*args):
+        joined.release()
+        return do(*args)
+
+    cache._flights.do = counting_do
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [
+            pool.submit(cache.generate, generate, "deep bass") for _ in range(4)
+        ]
+        for _ in range(4):
+            assert joined.acquire(timeout=5)
+        generate.release.set()
+        results = [future.result() for future in futures]
+
+    assert generate.calls == 1
+    assert results == [("deep bass #1", NOTES)] * 4
+    stats = cache.stats()
+    assert stats["generated"] == 1
+    assert stats["coalesced"] == 3
+    assert stats["in_flight"] == 0
+
+    # Later identical requests are cache hits; other prompts generate again
+    assert cache.generate(generate, "deep bass") == ("deep bass #1", NOTES)
+    assert cache.generate(generate, "bright bass") == ("bright bass #2", NOTES)
+
+
+def test_fresh_bypasses_and_updates_the_cache():
+    cache = GenerationCache()
+    generate = SlowGenerator()
+    generate.release.set()
+
+    assert cache.generate(generate, "deep bass") == ("deep bass #1", NOTES)
+    assert cache.generate(generate, "deep bass", fresh=True) == ("deep bass #2", NOTES)
+    assert cache.generate(generate, "deep bass") == ("deep bass #2", NOTES)
+    assert generate.calls == 2
+
+
+def test_generations_persist_to_the_cache_directory(tmp_path):
+    generate = SlowGenerator()
+    generate.release.set()
+    GenerationCache(directory=str(tmp_path)).generate(generate, "deep bass")
+
+    # A new process (cache) reads the stored result instead of generating
+    title, notes = GenerationCache(directory=str(tmp_path)).generate(
+        generate, "deep bass"
+    )
+    assert (title, notes) == ("deep bass #1", NOTES)
+    assert generate.calls == 1
+    assert [path.suffix for path in tmp_path.iterdir()] == [".json"]
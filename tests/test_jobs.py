@@ -0,0 +1,118 @@
+"""Tests for dispatching, cancelling and finishing background generation jobs."""
+
+import threading
+import time
+
+from src.jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobRunner
+from src.ratelimit import BATCH
+
+NOTES = [("C2", 0.0, 1.0, 100)]
+
+
+class FakeGenerator:
+    """Stand-in for `stream_midi` that blocks until each prompt is released."""
+
+    def __init__(self) -> None:
+        self.calls = []
+        self.started = threading.Semaphore(0)
+        self._release = {}
+        self._lock = threading.Lock()
+
+    def release(self, prompt: str) -> None:
+        self._gate(prompt).set()
+
+    def _gate(self, prompt: str) -> threading.Event:
+        with self._lock:
+            return self._release.setdefault(prompt, threading.Event())
+
+    def __call__(self, prompt, *, on_notes, should_stop, **kwargs):
+        self.calls.append((prompt, kwargs))
+        self.started.release()
+        on_notes(NOTES)
+        while not self._gate(prompt).wait(0.01):
+            if should_stop():
+                raise InterruptedError("Generation cancelled")
+        if prompt == "fail":
+            raise RuntimeError("model error")
+        return f"Title {prompt}", NOTES
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_runner_limits_concurrent_jobs_and_dispatches_in_order():
+    generate = FakeGenerator()
+    runner = JobRunner(max_workers=2, generate=generate)
+    jobs = [runner.submit("🎸 Bassline", prompt) for prompt in "abc"]
+
+    assert generate.started.acquire(timeout=5) and generate.started.acquire(timeout=5)
+    assert [job.status for job in jobs] == [RUNNING, RUNNING, QUEUED]
+    assert jobs[0].partial_notes == NOTES
+
+    # The queued job starts once a slot frees up
+    generate.release("a")
+    assert generate.started.acquire(timeout=5)
+    generate.release("b")
+    generate.release("c")
+    _wait_for(lambda: not runner.has_active())
+
+    assert [prompt for prompt, _ in generate.calls] == ["a", "b", "c"]
+    assert [job.status for job in jobs] == [DONE, DONE, DONE]
+    assert [job.title for job in runner.collect_finished()] == [
+        "Title a",
+        "Title b",
+        "Title c",
+    ]
+    assert runner.collect_finished() == []
+
+
+def test_cancel_queued_and_running_jobs():
+    generate = FakeGenerator()
+    runner = JobRunner(max_workers=1, generate=generate)
+    finished = []
+    running = runner.submit("🎸 Bassline", "a", on_finished=finished.append)
+    queued = runner.submit("🎸 Bassline", "b", on_finished=finished.append)
+    assert generate.started.acquire(timeout=5)
+
+    assert runner.cancel(queued.id)
+    assert queued.status == CANCELLED
+    assert runner.cancel(running.id)
+    _wait_for(lambda: not runner.has_active())
+
+    assert running.status == CANCELLED
+    assert finished == [queued, running]
+    assert [prompt for prompt, _ in generate.calls] == ["a"]  # Never started
+    assert not runner.cancel(running.id)
+
+
+def test_failed_job_keeps_its_error():
+    generate = FakeGenerator()
+    runner = JobRunner(generate=generate)
+    generate.release("fail")
+    job = runner.submit("🎸 Bassline", "fail")
+    _wait_for(lambda: not job.active)
+
+    assert job.status == FAILED
+    assert job.error == "model error"
+    assert runner.collect_finished() == []
+    runner.forget(job.id)
+    assert runner.jobs() == []
+
+
+def test_requests_carry_session_and_priority():
+    generate = FakeGenerator()
+    runner = JobRunner(generate=generate, session="session-1")
+    for prompt in "ab":
+        generate.release(prompt)
+    runner.submit("🎸 Bassline", "a", {"model": "test-model"})
+    runner.submit("🎸 Bassline", "b", {"priority": BATCH})
+    _wait_for(lambda: not runner.has_active())
+
+    kwargs = dict(generate.calls)
+    assert kwargs["a"] == {"session": "session-1", "model": "test-model"}
+    # Without a priority the request keeps stream_midi's interactive default
+    assert kwargs["b"] == {"session": "session-1", "priority": BATCH}
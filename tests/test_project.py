@@ -0,0 +1,146 @@
+"""Tests for reading and writing binary project files."""
+
+import json
+
+import pytest
+
+from src.core import make_layer
+from src.project import (
+    PROJECT_MAGIC,
+    _HEADER_LENGTH,
+    append_to_project,
+    load_project,
+    project_from_bytes,
+    project_to_bytes,
+    save_project,
+)
+
+BASS = [("C2", 0.0, 1.0, 100), ("G2", 1.0, 0.5, 90), ("C2", 2.5, 1.5, 127)]
+DRUMS = [("C1", 0.0, 0.25, 110), ("D1", 1.0, 0.25, 80)]
+
+
+def _layers() -> list:
+    bass = make_layer(1, "🎸 Bassline", "Bass", BASS)
+    drums = {**make_layer(3, "🥁 Drums", "Beat", DRUMS), "muted": True}
+    empty = {**make_layer(4, "🎹 Melody", "Empty", []), "solo": True}
+    return [bass, drums, empty]
+
+
+def _with_header(data: bytes, change) -> bytes:
+    """*data* with its JSON header replaced by ``change(header)``."""
+    (length,) = _HEADER_LENGTH.unpack_from(data, len(PROJECT_MAGIC))
+    start = len(PROJECT_MAGIC) + _HEADER_LENGTH.size
+    header = json.loads(data[start : start + length])
+    header = change(header) or header
+
+    arrays_start = start + length + (-(start + length) % 8)
+    encoded = json.dumps(header).encode("utf-8")
+    padding = b"\0" * (-(start + len(encoded)) % 8)
+    return (
+        PROJECT_MAGIC
+        + _HEADER_LENGTH.pack(len(encoded))
+        + encoded
+        + padding
+        + data[arrays_start:]
+    )
+
+
+def test_round_trip_keeps_layers():
+    layers = _layers()
+    loaded = project_from_bytes(project_to_bytes(layers))
+
+    assert loaded == layers
+    assert isinstance(loaded[0]["analysis"]["velocity_range"], tuple)
+
+
+def test_empty_project():
+    assert project_from_bytes(project_to_bytes([])) == []
+
+
+def test_save_and_load_file(tmp_path):
+    path = tmp_path / "song.midigpt"
+    save_project(path, _layers())
+    assert load_project(path) == _layers()
+    assert [p.name for p in tmp_path.iterdir()] == ["song.midigpt"]
+
+
+def test_append_numbers_new_layers(tmp_path):
+    path = tmp_path / "song.midigpt"
+    assert append_to_project(path, "🎸 Bassline", "Bass", BASS)["id"] == 1
+    save_project(path, _layers())
+    layer = append_to_project(path, "🎺 Lead", "Lead", BASS)
+
+    assert layer["id"] == 5
+    assert [layer["title"] for layer in load_project(path)][-1] == "Lead"
+
+
+def test_stored_analysis_and_hash_are_recomputed():
+    def tamper(header):
+        header["layers"][0]["analysis"] = {}
+        header["layers"][0]["content_hash"] = "0" * 32
+
+    data = _with_header(project_to_bytes(_layers()), tamper)
+    assert project_from_bytes(data) == _layers()
+
+
+def test_bad_magic():
+    data = project_to_bytes(_layers())
+    with pytest.raises(ValueError, match="Not a MidiGPT project"):
+        project_from_bytes(b"MThd" + data[4:])
+
+
+def test_bad_version():
+    data = _with_header(project_to_bytes(_layers()), lambda h: h.update(version=99))
+    with pytest.raises(ValueError, match="Unsupported project version"):
+        project_from_bytes(data)
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.midigpt"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        load_project(path)
+
+
+def test_every_truncation_raises_value_error():
+    data = project_to_bytes(_layers())
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            project_from_bytes(data[:length])
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda h: h["layers"][0].update(title=7),
+        lambda h: h["layers"][0].pop("muted"),
+        lambda h: h["layers"][1].update(id=1),
+        lambda h: h["layers"][1].update(offset=100),
+        lambda h: h["layers"][1].update(count=-1),
+        lambda h: h.update(notes="5"),
+        lambda h: h.update(pitch_names=[]),
+        lambda h: h.update(layers={}),
+        lambda h: [h],
+    ],
+)
+def test_malformed_header_raises_value_error(change):
+    data = _with_header(project_to_bytes(_layers()), change)
+    with pytest.raises(ValueError):
+        project_from_bytes(data)
+
+
+def test_load_truncated_file_raises_value_error(tmp_path):
+    path = tmp_path / "song.midigpt"
+    path.write_bytes(project_to_bytes(_layers())[:-1])
+    with pytest.raises(ValueError, match="Truncated"):
+        load_project(path)
+
+
+def test_load_pitch_out_of_range_raises_value_error(tmp_path):
+    def drop_names(header):
+        header["pitch_names"] = header["pitch_names"][:1]
+
+    path = tmp_path / "song.midigpt"
+    path.write_bytes(_with_header(project_to_bytes(_layers()), drop_names))
+    with pytest.raises(ValueError, match="pitch out of range"):
+        load_project(path)
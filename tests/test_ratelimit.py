@@ -0,0 +1,170 @@
+"""Tests for the token buckets and fair scheduling of the rate limiter."""
+
+import threading
+import time
+import types
+
+import pytest
+
+from src import ratelimit
+from src.ratelimit import BATCH, INTERACTIVE, RateLimiter, TokenBucket
+
+MODEL = "test-model"
+
+
+class FakeClock:
+    """Stand-in for `time.monotonic` that only moves when told to."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_bucket_refills_at_capacity_per_minute(clock):
+    bucket = TokenBucket(60)
+    assert bucket.delay(60) == 0.0
+
+    bucket.take(60)
+    assert bucket.delay(30) == pytest.approx(30.0)
+
+    clock.now += 15
+    assert bucket.delay(30) == pytest.approx(15.0)
+    assert bucket.level == pytest.approx(15.0)
+
+    clock.now += 3600  # Never refills past capacity
+    assert bucket.delay(60) == 0.0
+    assert bucket.level == 60
+
+
+def test_bucket_debt_and_oversized_requests(clock):
+    bucket = TokenBucket(60)
+    bucket.take(90)  # Corrections may overdraw
+    assert bucket.delay(1) == pytest.approx(31.0)
+
+    clock.now += 120
+    # Requests above capacity only wait for a full bucket
+    assert bucket.delay(1000) == 0.0
+
+
+def test_estimate_tokens():
+    messages = [{"content": "x" * 400}, {"content": "y" * 400}]
+    expected = 200 + ratelimit.COMPLETION_TOKEN_ESTIMATE
+    assert ratelimit.estimate_tokens(messages) == expected
+
+
+def test_settle_corrects_token_bucket(clock):
+    limiter = RateLimiter({MODEL: (100, 1000)})
+    grant = limiter.acquire(MODEL, 600)
+    tokens = limiter._model_buckets(MODEL)[1]
+    assert tokens.level == pytest.approx(400)
+
+    limiter.settle(grant, 100)
+    assert tokens.level == pytest.approx(900)
+    limiter.settle(grant, None)
+    assert tokens.level == pytest.approx(900)
+
+
+def test_unknown_priority_rejected(clock):
+    with pytest.raises(ValueError):
+        RateLimiter().acquire(MODEL, 1, priority="urgent")
+
+
+class _Waiters:
+    """Blocked `acquire` calls started one at a time, recording grant order."""
+
+    def __init__(self, limiter: RateLimiter) -> None:
+        self.limiter = limiter
+        self.granted = []
+        self.threads = []
+
+    def _queued(self) -> int:
+        return sum(stats["queued"] for stats in self.limiter.stats().values())
+
+    def start(self, name: str, session: str, priority: str = INTERACTIVE) -> None:
+        queued = self._queued()
+
+        def run() -> None:
+            self.limiter.acquire(MODEL, 1, priority=priority, session=session)
+            self.granted.append(name)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        _wait_for(lambda: self._queued() == queued + 1)
+
+    def release_all(self, clock: FakeClock) -> list:
+        """Refill one request per step and return the grant order."""
+        while len(self.granted) < len(self.threads):
+            count = len(self.granted)
+            clock.now += 60
+            _wait_for(lambda: len(self.granted) == count + 1)
+        for thread in self.threads:
+            thread.join(5)
+        return self.granted
+
+
+def test_sessions_take_turns(clock):
+    limiter = RateLimiter({MODEL: (1, 10**6)})
+    limiter.acquire(MODEL, 1)  # Empty the one-request bucket
+
+    waiters = _Waiters(limiter)
+    for name in ("a1", "a2", "a3"):
+        waiters.start(name, session="a")
+    waiters.start("b1", session="b")
+    waiters.start("c1", session="c")
+
+    assert waiters.release_all(clock) == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_interactive_before_batch(clock):
+    limiter = RateLimiter({MODEL: (1, 10**6)})
+    limiter.acquire(MODEL, 1)
+
+    waiters = _Waiters(limiter)
+    waiters.start("batch1", session="a", priority=BATCH)
+    waiters.start("batch2", session="b", priority=BATCH)
+    waiters.start("interactive", session="c")
+
+    assert waiters.release_all(clock) == ["interactive", "batch1", "batch2"]
+    stats = limiter.stats()
+    assert stats[INTERACTIVE]["granted"] == 2
+    assert stats[BATCH]["granted"] == 2
+    assert stats[BATCH]["queued"] == 0
+
+
+def test_cancelled_waiter_leaves_queue(clock):
+    limiter = RateLimiter({MODEL: (1, 10**6)})
+    limiter.acquire(MODEL, 1)
+    stop = threading.Event()
+    errors = []
+
+    def run() -> None:
+        try:
+            limiter.acquire(MODEL, 1, session="a", should_stop=stop.is_set)
+        except InterruptedError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    _wait_for(lambda: limiter.stats()[INTERACTIVE]["queued"] == 1)
+    stop.set()
+    thread.join(5)
+
+    assert len(errors) == 1
+    assert limiter.stats()[INTERACTIVE]["queued"] == 0
@@ -0,0 +1,107 @@
+"""Tests for loading sample libraries and picking samples for notes."""
+
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from src import sampler
+from src.audio import _stem_key
+from src.sampler import SampleLibrary, get_sample_library, root_note_from_filename
+
+SAMPLE_RATE = 22050
+
+
+def _write_sample(path, frequency=110.0, seconds=0.5):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    sf.write(str(path), 0.5 * np.sin(2 * np.pi * frequency * t), SAMPLE_RATE)
+
+
+@pytest.mark.parametrize(
+    "filename, root_note",
+    [
+        ("bass_C2.wav", 36),
+        ("bass_C#2.wav", 37),
+        ("Pad Db3 soft.flac", 49),
+        ("lead_A4_v2.wav", 69),
+        ("sub_C-1.wav", 0),
+        ("bass_37.wav", 37),
+        ("kit2_45.wav", 45),  # The last number wins
+        ("bass_200.wav", None),
+        ("Bass.wav", None),
+        ("bass_c2.wav", None),  # Note names are upper case
+    ],
+)
+def test_root_note_from_filename(filename, root_note):
+    assert root_note_from_filename(filename) == root_note
+
+
+def test_nearest_sample_and_skipped_files(tmp_path):
+    library_dir = tmp_path / "samples"
+    library_dir.mkdir()
+    for name in ("bass_C2.wav", "bass_C2_alt.wav", "bass_G2.wav", "bass_C3.wav"):
+        _write_sample(library_dir / name)
+    # Not a sample, no root note, and a second C2 (the first one is kept)
+    (library_dir / "notes.txt").write_text("not a sample")
+    _write_sample(library_dir / "loop.wav")
+
+    library = SampleLibrary(str(library_dir), cache_dir=tmp_path / "cache")
+    assert library.root_notes == [36, 43, 48]
+
+    assert library.nearest(20).root_note == 36
+    assert library.nearest(39).root_note == 36
+    assert library.nearest(40).root_note == 43
+    assert library.nearest(46).root_note == 48
+    assert library.nearest(100).root_note == 48
+
+
+def test_render_note_length_and_release(tmp_path):
+    library_dir = tmp_path / "samples"
+    library_dir.mkdir()
+    _write_sample(library_dir / "bass_C2.wav", seconds=1.0)
+    library = SampleLibrary(str(library_dir), cache_dir=tmp_path / "cache")
+
+    wave = library.render_note(36, 0.25, SAMPLE_RATE)
+    assert len(wave) == int(0.27 * SAMPLE_RATE)
+    assert wave.dtype == np.float32
+    assert abs(wave[-1]) < 1e-6
+
+    # An octave up plays the sample twice as fast, so it runs out sooner
+    assert len(library.render_note(48, 5.0, SAMPLE_RATE)) < SAMPLE_RATE // 2 + 1
+
+
+def test_edited_sample_reloads_library_and_changes_stem_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(sampler, "DEFAULT_SAMPLE_CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(sampler, "_libraries", {})
+    library_dir = tmp_path / "samples"
+    library_dir.mkdir()
+    _write_sample(library_dir / "bass_C2.wav")
+
+    notes = [("C2", 0.0, 1.0, 100)]
+    library = get_sample_library(str(library_dir))
+    assert get_sample_library(str(library_dir)) is library
+    key = _stem_key(notes, "🎸 Bassline", 15.0, 120.0, SAMPLE_RATE, library)
+
+    # Replace the sample with a different one (and a later mtime)
+    _write_sample(library_dir / "bass_C2.wav", frequency=220.0, seconds=0.4)
+    path = library_dir / "bass_C2.wav"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    reloaded = get_sample_library(str(library_dir))
+    assert reloaded is not library
+    assert len(reloaded.nearest(36).data) == int(0.4 * SAMPLE_RATE)
+    assert _stem_key(notes, "🎸 Bassline", 15.0, 120.0, SAMPLE_RATE, reloaded) != key
+
+
+def test_decoded_cache_leaves_no_temp_files(tmp_path):
+    library_dir = tmp_path / "samples"
+    library_dir.mkdir()
+    _write_sample(library_dir / "bass_C2.wav")
+    _write_sample(library_dir / "bass_C3.wav")
+
+    SampleLibrary(str(library_dir), cache_dir=tmp_path / "cache")
+    names = [path.name for path in (tmp_path / "cache").iterdir()]
+    assert len(names) == 2
+    assert all(name.endswith(".npy") and not name.startswith(".") for name in names)
@@ -0,0 +1,159 @@
+"""Tests for the layer store's indexes and undo/redo history."""
+
+from src.session import _NOTE_BYTES, LayerStore
+
+NOTES = [("C2", 0.0, 1.0, 100), ("G2", 1.0, 1.0, 90), ("C3", 2.0, 0.5, 110)]
+
+
+def _store(**kwargs) -> LayerStore:
+    store = LayerStore(**kwargs)
+    store.add("🎸 Bassline", "Bass", NOTES)
+    store.add("🥁 Drums", "Beat", NOTES[:1])
+    store.add("🎹 Melody", "Hook", NOTES[1:])
+    return store
+
+
+def _titles(store: LayerStore) -> list:
+    return [layer["title"] for layer in store]
+
+
+def test_undo_redo_add_and_remove():
+    store = _store()
+    store.remove(2)
+    assert _titles(store) == ["Bass", "Hook"]
+
+    assert store.undo() == "Remove Beat"
+    assert _titles(store) == ["Bass", "Beat", "Hook"]  # Original position
+    assert [layer["id"] for layer in store] == [1, 2, 3]
+    assert store.redo_label == "Remove Beat"
+
+    assert store.redo() == "Remove Beat"
+    assert 2 not in store
+    assert store.redo() is None
+
+
+def test_new_change_discards_redo_steps():
+    store = _store()
+    store.undo()
+    assert store.redo_label == "Add Hook"
+
+    store.add("🎺 Lead", "Lead", NOTES)
+    assert store.redo_label is None
+    assert store.history_stats()["redo_steps"] == 0
+
+
+def test_undo_past_start_returns_none():
+    store = LayerStore()
+    store.add("🎸 Bassline", "Bass", NOTES)
+    assert store.undo() == "Add Bass"
+    assert len(store) == 0
+    assert store.undo() is None
+    assert store.undo_label is None
+
+
+def test_clear_is_undoable_and_keeps_ids():
+    store = _store()
+    store.clear()
+    assert len(store) == 0
+
+    store.undo()
+    assert _titles(store) == ["Bass", "Beat", "Hook"]
+    store.redo()
+    assert store.add("🎺 Lead", "Lead", NOTES)["id"] == 4
+
+
+def test_mute_history_and_active_layers():
+    store = _store()
+    unmuted = store.get(2)
+    version = store.version
+    store.set_muted(2, True)
+    assert store.version == version + 1
+    assert store.muted_count == 1
+    assert [layer["id"] for layer in store.active()] == [1, 3]
+
+    # Muting shares the notes with the previous record
+    assert store.get(2)["midi_data"] is unmuted["midi_data"]
+    store.set_muted(2, True)  # No-op: no new step
+    assert store.undo_label == "Mute Beat"
+
+    assert store.undo() == "Mute Beat"
+    assert store.muted_count == 0
+    assert not store.get(2)["muted"]
+
+
+def test_solo_history():
+    store = _store()
+    store.set_solo(1)
+    store.set_solo(3)
+    assert store.solo_id == 3
+    assert [layer["id"] for layer in store.active()] == [3]
+    assert not store.get(1)["solo"]
+
+    assert store.undo() == "Solo Hook"
+    assert store.solo_id == 1
+    assert store.get(1)["solo"] and not store.get(3)["solo"]
+
+    store.set_solo(None)
+    assert store.undo_label == "Clear solo"
+    assert store.solo_id is None
+    assert len(store.active()) == 3
+
+
+def test_by_type_matches_name_without_icon():
+    store = _store()
+    assert [layer["id"] for layer in store.by_type("bassline")] == [1]
+    assert [layer["id"] for layer in store.by_type("🥁 Drums")] == [2]
+
+
+def test_history_depth_drops_oldest_steps():
+    store = LayerStore(history_depth=3)
+    for index in range(5):
+        store.add("🎸 Bassline", f"Bass {index}", NOTES)
+
+    assert store.history_stats()["undo_steps"] == 3
+    assert store.undo() == "Add Bass 4"
+    assert store.undo() == "Add Bass 3"
+    assert store.undo() == "Add Bass 2"
+    assert store.undo() is None
+    assert _titles(store) == ["Bass 0", "Bass 1"]
+
+
+def test_history_max_bytes_drops_oldest_steps():
+    notes = NOTES * 100
+    step_bytes = LayerStore._change_bytes({1: None}, {1: {"midi_data": notes}})
+    assert step_bytes >= len(notes) * _NOTE_BYTES
+
+    store = LayerStore(history_max_bytes=2 * step_bytes)
+    for index in range(4):
+        store.add("🎸 Bassline", f"Bass {index}", notes)
+
+    stats = store.history_stats()
+    assert stats["undo_steps"] == 2
+    assert stats["bytes"] <= stats["max_bytes"]
+
+
+def test_mute_steps_are_cheaper_than_adding_notes():
+    store = LayerStore()
+    layer = store.add("🎸 Bassline", "Bass", NOTES * 100)
+    added = store.history_stats()["bytes"]
+
+    store.set_muted(layer["id"], True)
+    muted = store.history_stats()["bytes"] - added
+    assert muted < added
+
+
+def test_replace_renumbers_loaded_layers():
+    store = _store()
+    store.remove(3)
+    loaded = [
+        {**layer, "muted": layer["id"] == 2} for layer in _store() if layer["id"] != 1
+    ]
+
+    store.replace(loaded)
+    assert [layer["id"] for layer in store] == [4, 5]  # 3 was used before
+    assert _titles(store) == ["Beat", "Hook"]
+    assert store.get(4)["muted"] and store.muted_count == 1
+
+    assert store.undo() == "Load project"
+    assert _titles(store) == ["Bass", "Beat"]
+    assert store.add("🎺 Lead", "Lead", NOTES)["id"] == 6
@@ -0,0 +1,48 @@
+"""Tests for picking pyramid levels and buckets for waveform views."""
+
+import numpy as np
+
+from src.audio import get_layer_waveform
+from src.waveform import WaveformPyramid
+
+SAMPLE_RATE = 6400  # 100 level-0 buckets per second
+
+
+def _pyramid(seconds: float = 10.0) -> WaveformPyramid:
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-1, 1, int(seconds * SAMPLE_RATE)).astype(np.float32)
+    return WaveformPyramid(audio, SAMPLE_RATE)
+
+
+def test_whole_buffer_fits_in_max_points():
+    times, mins, maxs = _pyramid().peaks(max_points=100)
+
+    assert 0 < len(times) <= 100
+    assert len(mins) == len(maxs) == len(times)
+    assert np.all(mins <= maxs)
+
+
+def test_unaligned_start_never_exceeds_max_points():
+    pyramid = _pyramid()
+
+    # A 2 s view starting one level-0 bucket in is exactly 100 level-1
+    # buckets long but straddles 101 of them
+    times, _, _ = pyramid.peaks(max_points=100, start=0.01, end=2.01)
+    assert 0 < len(times) <= 100
+
+    for start in np.linspace(0.0, 3.0, 37):
+        times, _, _ = pyramid.peaks(max_points=100, start=start, end=start + 2.0)
+        assert 0 < len(times) <= 100
+
+
+def test_empty_view():
+    times, mins, maxs = _pyramid().peaks(start=5.0, end=5.0)
+    assert len(times) == len(mins) == len(maxs) == 0
+
+
+def test_layer_waveform_covers_the_whole_layer():
+    # 60 bars at 120 bpm: two minutes, far past the 20 s preview limit
+    notes = [("C3", float(beat), 0.5, 100) for beat in range(240)]
+    pyramid = get_layer_waveform(notes, "🎹 Melody")
+
+    assert pyramid.duration > 120.0
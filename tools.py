@@ -0,0 +1,365 @@
+"""Batch tools for MIDI files and projects.
+
+Kept apart from ``cli.py`` so that prompts starting with a tool name (e.g.
+``python cli.py render a deep bassline``) are still generated::
+
+    python tools.py render midi/ --format flac --workers 4
+    python tools.py thumbnails midi/ --size small
+    python tools.py project song.midigpt --export-dir stems/
+"""
+
+import argparse
+import glob
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def _collect_midi_files(inputs: List[str]) -> List[Path]:
+    """Expand directories and glob patterns in *inputs* into ``.mid`` files."""
+
+    files = []
+    for item in inputs:
+        path = Path(item).expanduser()
+        if path.is_dir():
+            candidates = sorted(path.rglob("*.mid")) + sorted(path.rglob("*.midi"))
+        else:
+            candidates = [Path(match) for match in sorted(glob.glob(str(path)))]
+        files.extend(
+            candidate.resolve()
+            for candidate in candidates
+            if candidate.suffix.lower() in {".mid", ".midi"}
+        )
+    return list(dict.fromkeys(files))  # De-duplicate, keeping order
+
+
+def _plan_targets(
+    sources: List[Path], out_dir: Optional[Path], suffix: str
+) -> Tuple[Dict[Path, Path], List[Path]]:
+    """Map each source to its output path; returns (targets, colliding sources).
+
+    Sources whose output path would also be written for another source (same
+    stem in different directories with ``--out-dir``) are reported instead
+    of silently overwriting each other.
+    """
+
+    by_target: Dict[Path, List[Path]] = {}
+    for source in sources:
+        target = (out_dir or source.parent) / f"{source.stem}{suffix}"
+        by_target.setdefault(target, []).append(source)
+
+    targets = {}
+    collisions = []
+    for target, target_sources in by_target.items():
+        if len(target_sources) == 1:
+            targets[target_sources[0]] = target
+            continue
+        print(
+            f"❌ {target.name}: would be written by "
+            + ", ".join(str(source) for source in target_sources),
+            file=sys.stderr,
+        )
+        collisions.extend(target_sources)
+    return targets, collisions
+
+
+def _options_path(target: Path) -> Path:
+    """Sidecar file recording the options *target* was rendered with."""
+
+    return target.with_name(f".{target.name}.options.json")
+
+
+def _is_up_to_date(source: Path, target: Path, options: dict) -> bool:
+    """Return True when *target* is newer than *source* and used *options*."""
+
+    if not target.exists() or target.stat().st_mtime < source.stat().st_mtime:
+        return False
+    try:
+        return json.loads(_options_path(target).read_text()) == options
+    except (OSError, ValueError):
+        return False
+
+
+def _write_options(target: Path, options: dict) -> None:
+    _options_path(target).write_text(json.dumps(options, sort_keys=True))
+
+
+def _render_file(
+    job: Tuple[Path, Path, dict],
+) -> Tuple[Path, float, Optional[str]]:
+    """Render one MIDI file (worker process); returns (path, audio seconds, error)."""
+
+    from src.audio import render_midi_file, write_audio_file
+    from src.fileio import atomic_write
+
+    source, target, options = job
+    try:
+        audio, sample_rate = render_midi_file(
+            str(source),
+            layer_type=options["layer_type"],
+            sample_rate=options["sample_rate"],
+            bpm=options["bpm"],
+        )
+        # Write next to the target first so an interrupted run never leaves a
+        # partial file that looks up to date
+        with atomic_write(target) as f:
+            write_audio_file(audio, sample_rate, f, options["format"])
+        _write_options(target, options)
+        return source, len(audio) / sample_rate, None
+    except Exception as exc:  # noqa: BLE001
+        return source, 0.0, str(exc)
+
+
+def render_main(args: argparse.Namespace) -> int:
+    """Batch-render MIDI files to audio across a process pool."""
+
+    sources = _collect_midi_files(args.inputs)
+    if not sources:
+        print("❌ No MIDI files found", file=sys.stderr)
+        return 1
+
+    options = {
+        "format": args.format,
+        "layer_type": args.layer_type,
+        "sample_rate": args.sample_rate,
+        "bpm": args.bpm,
+    }
+    out_dir = Path(args.out_dir).expanduser().resolve() if args.out_dir else None
+    targets, failed = _plan_targets(sources, out_dir, f".{args.format}")
+
+    jobs = []
+    skipped = 0
+    for source, target in targets.items():
+        if not args.force and _is_up_to_date(source, target, options):
+            skipped += 1
+            continue
+        jobs.append((source, target, options))
+
+    print(f"🎧 Rendering {len(jobs)} file(s), {skipped} up to date")
+
+    rendered = 0
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for source, seconds, error in pool.map(_render_file, jobs):
+                if error:
+                    print(f"❌ {source.name}: {error}", file=sys.stderr)
+                    failed.append(source)
+                    continue
+                rendered += 1
+                audio_seconds += seconds
+                print(f"✅ {source.name} ({seconds:.1f}s of audio)")
+    elapsed = time.perf_counter() - start
+
+    if rendered:
+        print(
+            f"\n⏱️  {rendered} file(s) in {elapsed:.2f}s • "
+            f"{rendered / elapsed:.2f} files/s • "
+            f"{audio_seconds / elapsed:.1f}x real-time "
+            f"({audio_seconds:.1f}s of audio)"
+        )
+    if failed:
+        print(f"❌ {len(failed)} file(s) failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _thumbnail_file(
+    job: Tuple[Path, Path, dict],
+) -> Tuple[Path, Optional[str]]:
+    """Render one piano-roll thumbnail (worker process); returns (path, error)."""
+
+    from src.thumbnails import write_thumbnail
+
+    source, target, options = job
+    try:
+        write_thumbnail(source, target, options["width"], options["height"])
+        _write_options(target, options)
+        return source, None
+    except Exception as exc:  # noqa: BLE001
+        return source, str(exc)
+
+
+def thumbnails_main(args: argparse.Namespace) -> int:
+    """Batch-render piano-roll PNG thumbnails across a process pool."""
+
+    from src.thumbnails import THUMBNAIL_SIZES
+
+    sources = _collect_midi_files(args.inputs)
+    if not sources:
+        print("❌ No MIDI files found", file=sys.stderr)
+        return 1
+
+    width, height = THUMBNAIL_SIZES[args.size]
+    options = {"width": args.width or width, "height": args.height or height}
+
+    out_dir = Path(args.out_dir).expanduser().resolve() if args.out_dir else None
+    targets, failed = _plan_targets(sources, out_dir, ".png")
+
+    jobs = []
+    skipped = 0
+    for source, target in targets.items():
+        if not args.force and _is_up_to_date(source, target, options):
+            skipped += 1
+            continue
+        jobs.append((source, target, options))
+
+    print(f"🖼️ Rendering {len(jobs)} thumbnail(s), {skipped} up to date")
+
+    rendered = 0
+    start = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for source, error in pool.map(_thumbnail_file, jobs, chunksize=8):
+                if error:
+                    print(f"❌ {source.name}: {error}", file=sys.stderr)
+                    failed.append(source)
+                    continue
+                rendered += 1
+    elapsed = time.perf_counter() - start
+
+    if rendered:
+        print(
+            f"\n⏱️  {rendered} thumbnail(s) "
+            f"({options['width']}x{options['height']}) in {elapsed:.2f}s • "
+            f"{rendered / elapsed:.1f} files/s"
+        )
+    if failed:
+        print(f"❌ {len(failed)} file(s) failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+def project_main(args: argparse.Namespace) -> int:
+    """List the layers of a project file and optionally export them as MIDI."""
+
+    from src.core import combine_midi_layers, generate_midi_file, slugify
+    from src.project import load_project
+
+    start = time.perf_counter()
+    try:
+        layers = load_project(args.project)
+    except (OSError, ValueError) as exc:
+        print(f"❌ {args.project}: {exc}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - start
+
+    note_count = sum(len(layer["midi_data"]) for layer in layers)
+    print(
+        f"📁 {args.project}: {len(layers)} layer(s), {note_count} notes "
+        f"(loaded in {elapsed * 1000:.1f} ms)"
+    )
+    for layer in layers:
+        flags = " [muted]" if layer["muted"] else " [solo]" if layer["solo"] else ""
+        print(
+            f"  {layer['id']:>3}  {layer['type']}  {layer['title']} "
+            f"({len(layer['midi_data'])} notes){flags}"
+        )
+
+    if args.export_dir:
+        out_dir = Path(args.export_dir).expanduser().resolve()
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for layer in layers:
+            generate_midi_file(
+                layer["midi_data"],
+                out_dir / f"{layer['id']:03d}_{slugify(layer['title'])}.mid",
+            )
+
+        solo = [layer for layer in layers if layer["solo"]]
+        active = solo or [layer for layer in layers if not layer["muted"]]
+        if active:
+            generate_midi_file(combine_midi_layers(active), out_dir / "mix.mid")
+        print(f"✅ Exported {len(layers)} layer(s) to {out_dir}")
+    return 0
+
+
+def main() -> None:
+    """Parse the tool name and its arguments, then exit with its status."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="tool", required=True)
+
+    render = subparsers.add_parser("render", help="Render .mid files to WAV/FLAC")
+    render.add_argument(
+        "inputs", nargs="+", help="MIDI files, directories or glob patterns"
+    )
+    render.add_argument(
+        "--out-dir",
+        default=None,
+        help="Directory for rendered audio (default: next to each .mid file)",
+    )
+    render.add_argument(
+        "--format",
+        choices=["wav", "flac"],
+        default="wav",
+        help="Output format (default: wav, 16-bit PCM)",
+    )
+    render.add_argument(
+        "--layer-type",
+        default="bassline",
+        help="Voice used for non-drum tracks (default: bassline)",
+    )
+    render.add_argument("--sample-rate", type=int, default=44100)
+    render.add_argument(
+        "--bpm", type=float, default=None, help="Override the tempo of every file"
+    )
+    render.add_argument(
+        "--workers", type=int, default=None, help="Worker processes (default: CPUs)"
+    )
+    render.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-render files that are up to date with the same options",
+    )
+    render.set_defaults(func=render_main)
+
+    thumbnails = subparsers.add_parser(
+        "thumbnails", help="Render a piano-roll .png next to every .mid file"
+    )
+    thumbnails.add_argument(
+        "inputs", nargs="+", help="MIDI files, directories or glob patterns"
+    )
+    thumbnails.add_argument(
+        "--out-dir",
+        default=None,
+        help="Directory for thumbnails (default: next to each .mid file)",
+    )
+    thumbnails.add_argument(
+        "--size",
+        choices=["small", "medium", "large"],
+        default="medium",
+        help="Thumbnail size preset (default: medium, 320x120)",
+    )
+    thumbnails.add_argument("--width", type=int, default=None, help="Width in pixels")
+    thumbnails.add_argument("--height", type=int, default=None, help="Height in pixels")
+    thumbnails.add_argument(
+        "--workers", type=int, default=None, help="Worker processes (default: CPUs)"
+    )
+    thumbnails.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-render thumbnails that are up to date with the same size",
+    )
+    thumbnails.set_defaults(func=thumbnails_main)
+
+    project = subparsers.add_parser(
+        "project", help="Inspect a .midigpt project saved by the app or the CLI"
+    )
+    project.add_argument("project", help="Project file")
+    project.add_argument(
+        "--export-dir",
+        default=None,
+        help="Write every layer and the active mix as .mid files here",
+    )
+    project.set_defaults(func=project_main)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()